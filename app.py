@@ -1,9 +1,20 @@
-from flask import Flask, render_template
+from flask import Flask, Response, render_template, request, jsonify
 import threading
+import gaits
+import metrics
 import motion
+import trajectory
 
 app = Flask(__name__)
 
+
+@app.before_request
+def record_command():
+    # every command that changes what the snake does goes into the flight recorder
+    if request.method in ("POST", "DELETE"):
+        motion.flight.command(request.endpoint)
+
+
 # ======================
 # Routes
 # ======================
@@ -15,28 +26,23 @@ def index():
 
 @app.route("/start_serpentine", methods=["POST"])
 def start_serpentine():
-    if not motion.motor_running:
-        motion.motor_running = True
-        threading.Thread(
-            target=motion.serpentine_loop,
-            daemon=True
-        ).start()
+    metrics.http_commands.inc()
+    if not motion.start(motion.serpentine_loop):
+        return jsonify(error="already moving, stop first"), 409
     return "Started serpentine"
 
 
 @app.route("/start_sidewinding", methods=["POST"])
 def start_sidewinding():
-    if not motion.motor_running:
-        motion.motor_running = True
-        threading.Thread(
-            target=motion.sidewinding_loop,
-            daemon=True
-        ).start()
+    metrics.http_commands.inc()
+    if not motion.start(motion.sidewinding_loop):
+        return jsonify(error="already moving, stop first"), 409
     return "Started sidewinding"
 
 
 @app.route("/lower_sensor", methods=["POST"])
 def lower_sensor():
+    metrics.http_commands.inc()
     threading.Thread(
         target=motion.lower_sensor,
         daemon=True
@@ -46,6 +52,7 @@ def lower_sensor():
 
 @app.route("/raise_sensor", methods=["POST"])
 def raise_sensor():
+    metrics.http_commands.inc()
     threading.Thread(
         target=motion.raise_sensor,
         daemon=True
@@ -55,13 +62,143 @@ def raise_sensor():
 
 @app.route("/stop", methods=["POST"])
 def stop():
-    motion.motor_running = False
+    metrics.http_commands.inc()
+    # sends the neutral pose on the priority path, no waiting for the gait loop
+    motion.emergency_stop()
     return "Stopped motor motion"
 
 
+@app.route("/start_trajectory", methods=["POST"])
+def start_trajectory():
+    # body: {"t": [seconds...], "angles": [[servo angles]...], "tol": degrees}
+    metrics.http_commands.inc()
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        joints = trajectory.fit(body["t"], body["angles"], float(body.get("tol", trajectory.DEFAULT_TOL)))
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return jsonify(error=f"bad trajectory: {e}"), 400
+    if not motion.start(motion.trajectory_loop, joints):
+        return jsonify(error="already moving, stop first"), 409
+    return jsonify(segments=sum(len(s) for s in joints),
+                   bytes=len(trajectory.encode_upload(joints)),
+                   duration=trajectory.duration(joints))
+
+
+@app.route("/gaits", methods=["GET"])
+def list_gaits():
+    return jsonify(motion.gait_library.names())
+
+
+@app.route("/gaits", methods=["POST"])
+def add_gait():
+    # body is a gait spec, see gaits.py. Saved to gaits.json.
+    try:
+        motion.gait_library.add(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    gaits.write_specs(motion.gait_library.user_specs())
+    return jsonify(motion.gait_library.names())
+
+
+@app.route("/start_gait/<name>", methods=["POST"])
+def start_gait(name):
+    # onboard=1 uploads the period table and lets the Pico play it
+    metrics.http_commands.inc()
+    if name not in motion.gait_library.names():
+        return jsonify(error=f"no gait named {name}"), 404
+    target = motion.gait_loop_named
+    if request.args.get("onboard"):
+        # the upload is built again on the gait thread, this only tells the
+        # caller now if the Pico can't play the gait
+        try:
+            gaits.encode_upload(motion.gait_library.get(name))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        target = motion.onboard_loop
+    if not motion.start(target, name):
+        return jsonify(error="already moving, stop first"), 409
+    return f"Started {name}"
+
+
+# ======================
+# Gait parameters
+# ======================
+
+@app.route("/params", methods=["GET"])
+def get_params():
+    return jsonify(motion.params.public())
+
+
+@app.route("/params", methods=["POST"])
+def set_params():
+    # partial updates are fine, e.g. {"omega": 3.0}
+    try:
+        motion.params.update(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(motion.params.public())
+
+
+@app.route("/presets", methods=["GET"])
+def list_presets():
+    return jsonify(motion.params.list_presets())
+
+
+@app.route("/presets/<name>", methods=["POST"])
+def save_preset(name):
+    # saves the body if one is given, otherwise the live parameters
+    body = None
+    if request.get_data():
+        body = request.get_json(force=True, silent=True)
+        if body is None:
+            return jsonify(error="body is not valid JSON"), 400
+    try:
+        saved = motion.params.save_preset(name, body)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(saved)
+
+
+@app.route("/presets/<name>/load", methods=["POST"])
+def load_preset(name):
+    try:
+        motion.params.load_preset(name)
+    except KeyError:
+        return jsonify(error=f"no preset named {name}"), 404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(motion.params.public())
+
+
+@app.route("/presets/<name>", methods=["DELETE"])
+def delete_preset(name):
+    try:
+        motion.params.delete_preset(name)
+    except KeyError:
+        return jsonify(error=f"no preset named {name}"), 404
+    return jsonify(motion.params.list_presets())
+
+
+@app.route("/devices")
+def devices():
+    # Picos found by discovery, see discovery.py
+    return jsonify(motion.pico_registry.devices())
+
+
+# ======================
+# Metrics
+# ======================
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 # ======================
 # Run Flask
 # ======================
 
 if __name__ == "__main__":
+    motion.start_discovery()
+    motion.start_sensor_stream()
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,269 @@
+import json
+import os
+import socket
+import threading
+import time
+
+import metrics
+
+# Zero-configuration discovery of the Picos, so the ground station does not
+# depend on hard-coded IPs.
+#
+# Every Pico broadcasts a small JSON announcement on UDP DISCOVERY_PORT once it
+# is on the network (testing/pico_discovery.py), quickly at first and then
+# every few seconds:
+#
+#   {"sss": 1, "role": "motor", "fw": "0.5", "port": 8080,
+#    "caps": ["frames", "delta", ...], "id": "e6614c31", "boot": "9f2a01c4"}
+#
+# id is the board's unique id, boot is random per power-up so a reboot can be
+# told apart from a repeat. The address is taken from the packet's source.
+# The ground station can also broadcast a probe, {"sss": 1, "probe": "motor"}
+# ("*" for every role), which Picos answer straight away.
+#
+# Registry keeps the latest announcement per role and wakes up anyone waiting
+# for a role to (re)appear. Announcer is the CPython stand-in for a Pico, used
+# by the check scripts together with testing/fake_pico.py.
+
+DISCOVERY_PORT = 8089
+BROADCAST = "255.255.255.255"
+PROTOCOL = 1
+# a Pico that has not announced for this long is treated as gone
+TTL = 10.0
+# while waiting for a Pico, probe this often in case an announcement was missed
+PROBE_INTERVAL = 0.5
+
+
+def encode_announcement(role, fw, port, caps, dev_id, boot):
+    return json.dumps({"sss": PROTOCOL, "role": role, "fw": fw, "port": port,
+                       "caps": list(caps), "id": dev_id, "boot": boot}).encode()
+
+
+def encode_probe(role="*"):
+    return json.dumps({"sss": PROTOCOL, "probe": role}).encode()
+
+
+def parse(data):
+    """
+    Datagram -> dict, None if it is not one of ours or a badly formed
+    announcement. Anyone on the network can send to the port, a bad field
+    must not reach the registry's listener thread.
+    """
+    try:
+        msg = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(msg, dict) or msg.get("sss") != PROTOCOL:
+        return None
+    if "role" in msg and not _well_formed(msg):
+        return None
+    return msg
+
+
+def _well_formed(msg):
+    port = msg.get("port", 8080)
+    caps = msg.get("caps", [])
+    return (isinstance(msg["role"], str) and msg["role"] != ""
+            and isinstance(port, int) and not isinstance(port, bool) and 0 < port < 65536
+            and isinstance(caps, list) and all(isinstance(c, str) for c in caps)
+            and all(isinstance(msg.get(k, ""), str) for k in ("fw", "id", "boot")))
+
+
+class Device:
+    def __init__(self, msg, host, now):
+        self.role = msg["role"]
+        self.host = host
+        self.port = int(msg.get("port", 8080))
+        self.fw = msg.get("fw", "")
+        self.caps = list(msg.get("caps", []))
+        self.id = msg.get("id", "")
+        self.boot = msg.get("boot", "")
+        self.first_seen = now
+        self.last_seen = now
+
+    def public(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {"role": self.role, "host": self.host, "port": self.port, "fw": self.fw,
+                "caps": self.caps, "id": self.id, "boot": self.boot,
+                "age": round(now - self.last_seen, 3), "up": round(now - self.first_seen, 3)}
+
+
+class Registry:
+    """
+    Live table of announced Picos, fed by a listener thread.
+    lookup(role) returns the freshest Device or None, wait_for() blocks
+    until a role is announced (optionally: announced after a given time).
+    """
+
+    def __init__(self, port=DISCOVERY_PORT, bind="0.0.0.0", probe_target=BROADCAST,
+                 probe_port=DISCOVERY_PORT, ttl=TTL):
+        self.port = port
+        self.bind = bind
+        self.probe_target = probe_target
+        self.probe_port = probe_port
+        self.ttl = ttl
+        self.sock = None
+        self._devices = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.bind((self.bind, self.port))
+        self.sock = s
+        self.port = s.getsockname()[1]
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    @property
+    def running(self):
+        return self.sock is not None
+
+    def _listen(self):
+        sock = self.sock
+        while True:
+            try:
+                data, (host, _) = sock.recvfrom(1024)
+            except OSError:
+                break
+            msg = parse(data)
+            if msg is None or "role" not in msg:
+                continue
+            self.handle(msg, host)
+
+    def handle(self, msg, host, now=None):
+        now = time.monotonic() if now is None else now
+        with self._cond:
+            old = self._devices.get(msg["role"])
+            fresh = (old is None or old.boot != msg.get("boot") or old.host != host
+                     or old.port != int(msg.get("port", 8080))
+                     or now - old.last_seen > self.ttl)
+            if fresh:
+                self._devices[msg["role"]] = Device(msg, host, now)
+                metrics.discovery_changes.inc()
+            else:
+                old.last_seen = now
+            metrics.discovery_announcements.inc()
+            self._cond.notify_all()
+
+    def probe(self, role="*"):
+        """Ask every Pico to announce itself now instead of at its next interval"""
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendto(encode_probe(role), (self.probe_target, self.probe_port))
+        except OSError:
+            pass
+
+    def lookup(self, role, now=None):
+        now = time.monotonic() if now is None else now
+        dev = self._devices.get(role)
+        if dev is None or now - dev.last_seen > self.ttl:
+            return None
+        return dev
+
+    def wait_for(self, role, timeout, since=None, keep_going=None):
+        """
+        Wait until role has been announced, by a device first seen after
+        since (time.monotonic()) if given. keep_going() is checked every
+        PROBE_INTERVAL, returning False gives up early. Returns the Device or None.
+        """
+        deadline = time.monotonic() + timeout
+        next_probe = 0.0
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                dev = self.lookup(role, now)
+                if dev is not None and (since is None or dev.first_seen > since):
+                    return dev
+                if now >= deadline or (keep_going is not None and not keep_going()):
+                    return None
+                if now >= next_probe:
+                    self.probe(role)
+                    next_probe = now + PROBE_INTERVAL
+                self._cond.wait(min(deadline, next_probe) - now)
+
+    def devices(self):
+        now = time.monotonic()
+        return [d.public(now) for d in self._devices.values()]
+
+
+class Announcer:
+    """
+    CPython stand-in for the Pico side (testing/pico_discovery.py): announces
+    a burst right after start(), then every interval seconds, and answers probes.
+    """
+
+    BURST = (0.0, 0.05, 0.1, 0.2, 0.4, 0.8, 1.6)
+
+    def __init__(self, role, port, target=(BROADCAST, DISCOVERY_PORT), fw="fake",
+                 caps=(), dev_id=None, interval=2.0, listen_port=DISCOVERY_PORT):
+        self.role = role
+        self.port = port
+        self.target = target
+        self.fw = fw
+        self.caps = caps
+        self.id = dev_id or os.urandom(4).hex()
+        self.boot = os.urandom(4).hex()
+        self.interval = interval
+        self.sent = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # probes arrive here, listen_port=0 picks a free port for local tests
+        self.sock.bind(("0.0.0.0", listen_port))
+        self.listen_port = self.sock.getsockname()[1]
+        self.sock.settimeout(0.02)
+        self._running = False
+        self._thread = None
+
+    def announcement(self):
+        return encode_announcement(self.role, self.fw, self.port, self.caps, self.id, self.boot)
+
+    def announce(self, target=None):
+        try:
+            self.sock.sendto(self.announcement(), target or self.target)
+            self.sent += 1
+        except OSError:
+            pass
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self.sock.close()
+
+    def _run(self):
+        start = time.monotonic()
+        burst = [start + b for b in self.BURST]
+        next_at = burst[-1] + self.interval
+        while self._running:
+            now = time.monotonic()
+            if burst and now >= burst[0]:
+                self.announce()
+                burst.pop(0)
+            elif not burst and now >= next_at:
+                self.announce()
+                next_at = now + self.interval
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except OSError:
+                continue
+            msg = parse(data)
+            if msg is not None and msg.get("probe") in ("*", self.role):
+                # answer the prober directly
+                self.announce((addr[0], self.target[1]))
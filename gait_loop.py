@@ -0,0 +1,42 @@
+import time
+
+import metrics
+import transport
+
+# The gait loop shared by the Wi-Fi build (motion.py, TcpTransport) and the
+# USB-tethered build (no_wifi/motion.py, SerialTransport).
+
+PERIOD = 0.05  # seconds between frames
+
+
+def run(angle_generator, link, keep_running, flight=None, period=PERIOD, debug_print=False,
+        wake=None):
+    """
+    Send angle_generator(start_time) over link every period seconds while
+    keep_running() is true. flight is an optional recorder.FlightRecorder.
+    wake is an optional threading.Event, setting it cuts the sleep between
+    frames short so a stop is noticed right away.
+    """
+    metrics.active_gait.set(angle_generator.__name__.replace("_angles", ""))
+    metrics.tick.reset()
+
+    try:
+        # a previous stop leaves the Pico ignoring frames until resumed
+        link.send_priority(transport.RESUME)
+        start_time = time.perf_counter()
+
+        while keep_running():
+            metrics.tick.tick()
+            angles = angle_generator(start_time)
+            message = link.send_frame(angles)
+            if flight is not None:
+                flight.frame(angles)
+
+            if debug_print:
+                print("sent:", message)
+            if wake is not None:
+                wake.wait(period)
+            else:
+                time.sleep(period)
+    finally:
+        metrics.active_gait.set(None)
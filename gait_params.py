@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import threading
+import time
+
+# presets live next to the code so they survive restarts of the ground station
+PRESET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gait_presets.json")
+
+# (min, max) for every numeric parameter we accept over the API
+LIMITS = {
+    "alpha": (0.0, 90.0),
+    "omega": (0.0, 20.0),
+    "K_n": (0.0, 10.0),
+    "beta": (-2 * math.pi, 2 * math.pi),
+    "n": (1, 32),
+    # heading offset in degrees, added to every waving joint to turn
+    "gamma": (-30.0, 30.0),
+}
+
+
+class GaitParams:
+    """
+    Runtime store for the gait parameters (alpha, omega, K_n, n, beta, gamma, calibration).
+
+    Readers call snapshot() and get a plain dict that is never mutated afterwards.
+    Writers build a new dict and swap it in under a lock, so the send loop always
+    sees either the old or the new parameter set, never a mix of both.
+
+    The serpentine phase is tracked here too: phase(now) integrates omega over time,
+    so changing omega mid-run does not make the wave jump.
+    """
+
+    def __init__(self, alpha, omega, K_n, n, calibration, beta=None, gamma=0.0,
+                 preset_file=PRESET_FILE):
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.preset_file = preset_file
+
+        values = {
+            "alpha": float(alpha),
+            "omega": float(omega),
+            "K_n": float(K_n),
+            "n": int(n),
+            "gamma": float(gamma),
+            "calibration": list(calibration),
+        }
+        values["beta"] = float(beta) if beta is not None else _derive_beta(values)
+        values["version"] = 0
+        values["epoch"] = time.perf_counter()
+        values["phase0"] = 0.0
+        self._values = values
+
+    # ======================
+    # Reading
+    # ======================
+
+    def snapshot(self):
+        # single attribute read, no lock needed
+        return self._values
+
+    def phase(self, now=None, snapshot=None):
+        v = snapshot if snapshot is not None else self._values
+        if now is None:
+            now = time.perf_counter()
+        return v["phase0"] + v["omega"] * (now - v["epoch"])
+
+    def public(self):
+        """Parameters as shown over the API (no internal phase bookkeeping)"""
+        v = self._values
+        return {k: v[k] for k in ("alpha", "omega", "K_n", "n", "beta", "gamma", "calibration", "version")}
+
+    # ======================
+    # Writing
+    # ======================
+
+    def update(self, changes, now=None):
+        """
+        Apply a dict of changes atomically and return the new snapshot.
+        Raises ValueError if anything in changes is invalid, in which case
+        nothing is applied.
+        """
+        changes = _validate(changes, len(self._values["calibration"]))
+
+        with self._lock:
+            old = self._values
+            if now is None:
+                now = time.perf_counter()
+
+            new = dict(old)
+            new.update(changes)
+            if "beta" not in changes and ("K_n" in changes or "n" in changes):
+                new["beta"] = _derive_beta(new)
+
+            # re-anchor the phase so the wave is continuous across an omega change
+            new["phase0"] = old["phase0"] + old["omega"] * (now - old["epoch"])
+            new["epoch"] = now
+            new["version"] = old["version"] + 1
+
+            self._values = new
+            listeners = list(self._listeners)
+
+        for fn in listeners:
+            fn(new)
+        return new
+
+    def reset_phase(self, now=None):
+        """Restart the wave from phase 0, called when a gait is started"""
+        with self._lock:
+            new = dict(self._values)
+            new["phase0"] = 0.0
+            new["epoch"] = time.perf_counter() if now is None else now
+            self._values = new
+
+    def add_listener(self, fn):
+        """
+        fn(snapshot) is called after every update. Anything that precomputes
+        gait tables from these parameters should register here and drop its
+        cached tables when called.
+        """
+        with self._lock:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    # ======================
+    # Presets
+    # ======================
+
+    def list_presets(self):
+        return read_presets(self.preset_file)
+
+    def save_preset(self, name, values=None):
+        if not name:
+            raise ValueError("preset name must not be empty")
+        if values is None:
+            values = self.public()
+        if isinstance(values, dict):
+            # what GET /params returns can be saved as it is
+            values = {k: v for k, v in values.items() if k != "version"}
+        # what gets saved is what load_preset() will apply, e.g. n as an int
+        values = _validate(values, len(self._values["calibration"]))
+
+        with self._lock:
+            presets = read_presets(self.preset_file)
+            presets[name] = values
+            write_presets(presets, self.preset_file)
+        return values
+
+    def load_preset(self, name):
+        presets = read_presets(self.preset_file)
+        if name not in presets:
+            raise KeyError(name)
+        return self.update(presets[name])
+
+    def delete_preset(self, name):
+        with self._lock:
+            presets = read_presets(self.preset_file)
+            if name not in presets:
+                raise KeyError(name)
+            del presets[name]
+            write_presets(presets, self.preset_file)
+
+
+def read_presets(path=PRESET_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_presets(presets, path=PRESET_FILE):
+    # write to a temp file and rename so a crash never leaves half a file
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(presets, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _derive_beta(values):
+    return (2 * values["K_n"] * math.pi) / values["n"]
+
+
+def _validate(changes, num_servos):
+    if not isinstance(changes, dict):
+        raise ValueError("expected a JSON object of parameters")
+
+    clean = {}
+    for key, value in changes.items():
+        if key == "calibration":
+            if not isinstance(value, (list, tuple)) or len(value) != num_servos:
+                raise ValueError(f"calibration must be a list of {num_servos} numbers")
+            try:
+                clean[key] = [float(x) for x in value]
+            except (TypeError, ValueError):
+                raise ValueError("calibration must be a list of numbers")
+            if not all(math.isfinite(x) for x in clean[key]):
+                raise ValueError("calibration must be finite numbers")
+            continue
+
+        if key not in LIMITS:
+            raise ValueError(f"unknown parameter: {key}")
+
+        try:
+            value = int(value) if key == "n" else float(value)
+        except (TypeError, ValueError, OverflowError):
+            # int(inf) overflows, and Python's JSON parser reads Infinity
+            raise ValueError(f"{key} must be a number")
+
+        lo, hi = LIMITS[key]
+        if not (lo <= value <= hi):
+            raise ValueError(f"{key} must be between {lo} and {hi}")
+        clean[key] = value
+
+    return clean
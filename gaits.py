@@ -0,0 +1,427 @@
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+# Declarative gaits. A gait is a dict (or JSON file) describing every joint
+# as a Fourier series in the gait phase theta:
+#
+#   angle_j = clamp(round(env * (offset_j + sum_k amp_k * sin(k * theta + phase_k))) + center_j)
+#
+# where theta = omega * t, or the live serpentine phase from gait_params when
+# omega is "omega". center is added after rounding so calibration trims stay
+# whole degrees. env is 1 unless the gait has an envelope (see below).
+#
+# {
+#   "name": "sidewinding",
+#   "omega": 6.283,                  # rad/s, a number or a parameter name
+#   "round": true,                   # round to whole degrees (default true)
+#   "clamp": [0, 180],               # servo limits (default 0..180)
+#   "envelope": {"ramp": 2.0},       # optional: scale up from 0 over 2 s after start
+#   "joints": [
+#     {"offset": 5, "harmonics": [[1, 5, 0]]},     # [k, amplitude, phase]
+#     {"center": 90, "clamp": [45, 135]},          # per-joint clamp overrides the gait's
+#     ...
+#   ]
+# }
+#
+# Any number can instead refer to the live gait parameters (gait_params.py):
+#   "alpha"                        the parameter itself
+#   {"beta": 2}                    2 * beta
+#   {"calibration": 1, "const": 90}  calibration[j] + 90, list parameters are indexed by joint
+#
+# compile_gait() turns a spec into a CompiledGait with a per-frame evaluator
+# (angles), a vectorized one (evaluate) and a one-period lookup table
+# (period_table), which is also what the Pico plays back on its own
+# (encode_upload, pico_wifi_motor.py).
+
+GAIT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gaits.json")
+
+TWO_PI = 2 * math.pi
+LUT_SIZE = 64
+
+
+# ======================
+# Built-in gaits
+# ======================
+
+def serpentine(horizontal):
+    """motion.serpentine_angles: alpha * sin(phase + joint * beta) + gamma on the waving joints"""
+    joints = []
+    for j, h in enumerate(horizontal):
+        joint = {"center": {"calibration": 1, "const": 90}}
+        if not h:
+            joint["offset"] = "gamma"
+            joint["harmonics"] = [[1, "alpha", {"beta": j}]]
+        joints.append(joint)
+    return {"name": "serpentine", "omega": "omega", "joints": joints}
+
+
+SIDEWINDING = {
+    "name": "sidewinding",
+    "omega": TWO_PI,
+    "joints": [
+        {"offset": 5, "harmonics": [[1, 5, 0]]},
+        {"offset": 22.5, "harmonics": [[1, 22.5, math.pi / 2]]},
+        {},
+        {"offset": 18, "harmonics": [[1, 18, math.pi / 4]]},
+        {"offset": 5, "harmonics": [[1, 5, 0]]},
+    ],
+}
+
+
+# ======================
+# Compiler
+# ======================
+
+def _number(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{what}: expected a number, got {value!r}")
+    return float(value)
+
+
+def _clamp(value, what):
+    """[low, high] servo limits, returned as given"""
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{what}: clamp is [low, high], got {value!r}")
+    lo, hi = value
+    if _number(lo, what) > _number(hi, what):
+        raise ValueError(f"{what}: clamp {lo} > {hi}")
+    return lo, hi
+
+
+def _resolve(value, params, j, what):
+    """Number, parameter name or {name: coefficient, "const": c} -> float for joint j"""
+    if isinstance(value, bool):
+        raise ValueError(f"{what}: expected a number, got {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = {value: 1}
+    if not isinstance(value, dict):
+        raise ValueError(f"{what}: expected a number, parameter name or dict, got {value!r}")
+
+    total = 0.0
+    for name, coef in value.items():
+        coef = _number(coef, f"{what}.{name}")
+        if name == "const":
+            total += coef
+            continue
+        if params is None or name not in params:
+            raise ValueError(f"{what}: unknown parameter {name!r}")
+        p = params[name]
+        if isinstance(p, (list, tuple)):
+            if j >= len(p):
+                raise ValueError(f"{what}: {name} has no entry for joint {j}")
+            p = p[j]
+        # coefficient first, the same order the hand-written gaits multiplied in
+        total += coef * p
+    return total
+
+
+class CompiledGait:
+    """A gait spec with every parameter resolved, ready to evaluate"""
+
+    def __init__(self, name, omega, follows_params, offset, center, harmonics, lo, hi,
+                 rounded, ramp):
+        self.name = name
+        self.omega = omega
+        # theta comes from gait_params.phase() instead of omega * t
+        self.follows_params = follows_params
+        self.offset = offset
+        self.center = center
+        # per joint list of (k, amp, phase)
+        self.harmonics = harmonics
+        self.lo = lo
+        self.hi = hi
+        self.rounded = rounded
+        self.ramp = ramp
+        self.joints = len(offset)
+        self._lut = None
+
+        kmax = max((len(h) for h in harmonics), default=0)
+        # padded arrays for evaluate(), unused slots have amplitude 0
+        self._k = np.zeros((self.joints, kmax))
+        self._amp = np.zeros((self.joints, kmax))
+        self._phase = np.zeros((self.joints, kmax))
+        for j, hs in enumerate(harmonics):
+            for i, (k, amp, phase) in enumerate(hs):
+                self._k[j, i], self._amp[j, i], self._phase[j, i] = k, amp, phase
+
+    def envelope(self, t):
+        if not self.ramp or t is None:
+            return 1.0
+        return min(1.0, max(0.0, t / self.ramp))
+
+    def angles(self, theta, t=None):
+        """Servo angles for one frame. Plain Python, cheaper than numpy for a handful of joints."""
+        env = self.envelope(t)
+        out = [0] * self.joints
+        for j in range(self.joints):
+            value = self.offset[j]
+            for k, amp, phase in self.harmonics[j]:
+                value += amp * math.sin(k * theta + phase)
+            if env != 1.0:
+                value *= env
+            if self.rounded:
+                value = round(value, 0)
+            value = max(self.lo[j], min(self.hi[j], value + self.center[j]))
+            # whole degrees go out as "90", not "90.0"
+            out[j] = int(value) if self.rounded and value == int(value) else value
+        return out
+
+    def evaluate(self, theta, t=None):
+        """Vectorized angles, theta (and t for the envelope) of shape (T,) -> (T, joints)"""
+        theta = np.asarray(theta, dtype=float)[:, None, None]
+        waves = (self._amp * np.sin(self._k * theta + self._phase)).sum(axis=2)
+        value = np.asarray(self.offset) + waves
+        if self.ramp and t is not None:
+            value = value * np.clip(np.asarray(t, dtype=float) / self.ramp, 0, 1)[:, None]
+        if self.rounded:
+            value = np.round(value)
+        return np.clip(value + np.asarray(self.center), self.lo, self.hi)
+
+    def period_table(self, size=LUT_SIZE):
+        """(size, joints) angles over one period of theta, built once per compile"""
+        if self._lut is None or len(self._lut) != size:
+            self._lut = self.evaluate(np.arange(size) * (TWO_PI / size))
+        return self._lut
+
+    def lookup(self, theta, size=LUT_SIZE):
+        """Angles from the period table, linearly interpolated. Ignores the envelope."""
+        lut = self.period_table(size)
+        x = (theta % TWO_PI) * (size / TWO_PI)
+        i = int(x)
+        frac = x - i
+        a, b = lut[i % size], lut[(i + 1) % size]
+        return (a + (b - a) * frac).tolist()
+
+
+def compile_gait(spec, params=None):
+    """
+    Resolve a gait spec against a parameter snapshot (gait_params snapshot()
+    dict). Raises ValueError for anything malformed.
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get("joints"), list) or not spec["joints"]:
+        raise ValueError("gait spec needs a non-empty 'joints' list")
+    name = str(spec.get("name", "gait"))
+    omega_spec = spec.get("omega", TWO_PI)
+    follows_params = omega_spec == "omega"
+    omega = _resolve(omega_spec, params, 0, f"{name}.omega")
+
+    clamp = _clamp(spec.get("clamp", (0, 180)), f"{name}.clamp")
+    envelope = spec.get("envelope", {})
+    if not isinstance(envelope, dict):
+        raise ValueError(f"{name}.envelope: expected a dict like {{\"ramp\": 2.0}}, got {envelope!r}")
+    ramp = envelope.get("ramp")
+    if ramp is not None and _number(ramp, f"{name}.envelope.ramp") <= 0:
+        raise ValueError(f"{name}.envelope.ramp must be positive")
+
+    offset, center, harmonics, lo, hi = [], [], [], [], []
+    for j, joint in enumerate(spec["joints"]):
+        where = f"{name}.joints[{j}]"
+        if not isinstance(joint, dict):
+            raise ValueError(f"{where}: expected a dict, got {joint!r}")
+        offset.append(_resolve(joint.get("offset", 0), params, j, where + ".offset"))
+        center.append(_resolve(joint.get("center", 0), params, j, where + ".center"))
+        terms = joint.get("harmonics", [])
+        if not isinstance(terms, list):
+            raise ValueError(f"{where}: harmonics is a list of [k, amplitude, phase], got {terms!r}")
+        hs = []
+        for h in terms:
+            if not isinstance(h, (list, tuple)) or len(h) != 3:
+                raise ValueError(f"{where}: harmonics are [k, amplitude, phase], got {h!r}")
+            k = _resolve(h[0], params, j, where + ".k")
+            hs.append((k, _resolve(h[1], params, j, where + ".amplitude"),
+                       _resolve(h[2], params, j, where + ".phase")))
+        harmonics.append(hs)
+        jlo, jhi = _clamp(joint.get("clamp", clamp), where + ".clamp")
+        lo.append(jlo)
+        hi.append(jhi)
+
+    return CompiledGait(name, omega, follows_params, offset, center, harmonics, lo, hi,
+                        bool(spec.get("round", True)), float(ramp) if ramp else None)
+
+
+# ======================
+# Library
+# ======================
+
+def load_specs(path=GAIT_FILE):
+    """
+    User gaits from gaits.json, a list of specs. Missing file -> no user
+    gaits. A file that isn't JSON is reported and ignored, it must not keep
+    the ground station from starting.
+    """
+    try:
+        with open(path) as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return []
+    except ValueError as e:
+        print(f"{path}: not valid JSON, no user gaits loaded: {e}")
+        return []
+    if isinstance(specs, dict):
+        specs = [specs]
+    if not isinstance(specs, list):
+        print(f"{path}: expected a list of gait specs, no user gaits loaded")
+        return []
+    return specs
+
+
+def write_specs(specs, path=GAIT_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(specs, f, indent=2)
+    os.replace(tmp, path)
+
+
+class Library:
+    """
+    Named gaits compiled against the live gait parameters. Registered as a
+    gait_params listener, so every parameter update recompiles (and rebuilds
+    the period tables) lazily on the next get().
+    """
+
+    def __init__(self, params, specs, builtin=("serpentine", "sidewinding")):
+        self.params = params
+        self.builtin = set(builtin)
+        self._specs = {}
+        # user specs that don't compile, reported and kept as they were so
+        # the next write_specs() doesn't lose them
+        self.skipped = []
+        for spec in specs:
+            if isinstance(spec, dict) and spec.get("name") in self.builtin \
+                    and spec["name"] not in self._specs:
+                self._specs[spec["name"]] = spec
+                continue
+            try:
+                self._check(spec)
+            except ValueError as e:
+                label = spec["name"] if isinstance(spec, dict) and isinstance(spec.get("name"), str) \
+                    else repr(spec)[:40]
+                print(f"skipping gait {label}: {e}")
+                self.skipped.append(spec)
+                continue
+            self._specs[spec["name"]] = spec
+        self._compiled = {}
+        self._lock = threading.Lock()
+        params.add_listener(self._invalidate)
+
+    def _invalidate(self, snapshot=None):
+        self._compiled = {}
+
+    def names(self):
+        return list(self._specs)
+
+    def _check(self, spec):
+        if not isinstance(spec, dict) or not isinstance(spec.get("name"), str) or not spec["name"]:
+            raise ValueError("gait spec needs a name")
+        if spec["name"] in self.builtin:
+            raise ValueError(f"{spec['name']} is a built-in gait")
+        compile_gait(spec, self.params.snapshot())  # validate before accepting it
+
+    def add(self, spec):
+        """Add or replace a user gait, raises ValueError if it does not compile"""
+        self._check(spec)
+        with self._lock:
+            self._specs[spec["name"]] = spec
+            # a fixed gait replaces the broken one it was skipped as
+            self.skipped = [s for s in self.skipped
+                            if not (isinstance(s, dict) and s.get("name") == spec["name"])]
+            self._compiled = {}
+
+    def user_specs(self):
+        return [s for name, s in self._specs.items() if name not in self.builtin] + self.skipped
+
+    def get(self, name, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.params.snapshot()
+        key = (name, snapshot["version"])
+        gait = self._compiled.get(key)
+        if gait is None:
+            gait = compile_gait(self._specs[name], snapshot)
+            # a dict swap, readers never see a half-filled cache
+            self._compiled = {**self._compiled, key: gait}
+        return gait
+
+    def angle_generator(self, name):
+        """A motion.py style angle_generator(start_time, now=None) for a named gait"""
+        params = self.params
+
+        def generate(start_time, now=None):
+            p = params.snapshot()
+            gait = self.get(name, p)
+            if now is None:
+                now = time.perf_counter()
+            t = now - start_time
+            if gait.follows_params:
+                theta = params.phase(now, snapshot=p)
+            else:
+                theta = gait.omega * t
+            return gait.angles(theta, t)
+
+        generate.__name__ = f"{name}_angles"
+        return generate
+
+
+# ======================
+# On-Pico playback
+# ======================
+
+def encode_upload(gait, theta0=0.0, size=LUT_SIZE):
+    """
+    Period table upload for pico_wifi_motor.py, which steps theta by omega
+    and interpolates the table itself:
+      @P,joints,size,omega,theta0   begin
+      @V,j,a0,a1,...                whole-degree table of joint j
+      @W                            go
+    """
+    if gait.ramp:
+        raise ValueError("the Pico plays the period table, gaits with an envelope can't be uploaded")
+    lut = np.round(gait.period_table(size)).astype(int)
+    if lut.min() < 0 or lut.max() > 255:
+        raise ValueError("the period table is sent as bytes, angles must stay within 0..255")
+    lines = [f"@P,{gait.joints},{size},{gait.omega:.6f},{theta0 % TWO_PI:.6f}"]
+    for j in range(gait.joints):
+        lines.append(f"@V,{j}," + ",".join(map(str, lut[:, j])))
+    lines.append("@W")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+class UploadParser:
+    """Reassembles a period table upload and plays it back the way the firmware does"""
+
+    def __init__(self):
+        self.lut = None
+        self.size = None
+        self.omega = None
+        self.theta0 = 0.0
+        self.ready = False
+
+    def handle_line(self, line):
+        parts = line.strip().split(b",")
+        cmd = parts[0]
+        if cmd == b"@P":
+            joints, self.size = int(parts[1]), int(parts[2])
+            self.omega, self.theta0 = float(parts[3]), float(parts[4])
+            self.lut = [bytearray(self.size) for _ in range(joints)]
+            self.ready = False
+        elif cmd == b"@V":
+            self.lut[int(parts[1])][:] = bytes(int(x) for x in parts[2:])
+        elif cmd == b"@W":
+            self.ready = True
+        else:
+            raise ValueError(f"not a gait upload line: {line!r}")
+
+    def angles_at(self, t):
+        """Angles t seconds after @W, same interpolation as play_step() in the firmware"""
+        theta = self.theta0 + self.omega * t
+        x = (theta % TWO_PI) * (self.size / TWO_PI)
+        i = int(x)
+        frac = x - i
+        i %= self.size
+        nxt = (i + 1) % self.size
+        return [v[i] + (v[nxt] - v[i]) * frac for v in self.lut]
@@ -0,0 +1,309 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+# Forward kinematics of the snake, ported from testing/matlab/SnakeCode.m and
+# sidewinding_sim2.m. Everything works on whole trajectories at once: joint
+# angles come in as a (T, n) array (T time steps, n joints) and body poses go
+# out as (T, n + 2, 2 or 3) arrays of link end points.
+#
+# Conventions (cleaned up from SnakeCode.m):
+#   - link 0 starts at the origin with heading heading0
+#   - joint i sits between link i and link i + 1, so n joints -> n + 1 links
+#   - heading of link k = heading0 + sum of the first k joint angles
+#   - angles are in radians, lengths in meters
+#
+#   python kinematics.py serpentine --out serpentine.png
+#   python kinematics.py sidewinding --out sidewinding.png
+#   python kinematics.py bench
+
+# link length estimate from sidewinding_sim2.m
+LINK_LENGTH = 0.11
+
+
+# ======================
+# Joint trajectories
+# ======================
+
+def serpentine_joint_angles(t, alpha, omega, beta, n, gamma=0.0):
+    """theta_i(t) = alpha * sin(omega * t + i * beta) + gamma, shape (T, n)"""
+    t = np.asarray(t, dtype=float)[:, None]
+    return alpha * np.sin(omega * t + np.arange(n) * beta) + gamma
+
+
+def servo_to_joint(servo_angles, calibration=None, center=90.0):
+    """Servo angles in degrees as sent to the Pico -> joint angles in radians"""
+    deg = np.asarray(servo_angles, dtype=float) - center
+    if calibration is not None:
+        deg = deg - np.asarray(calibration, dtype=float)
+    return np.radians(deg)
+
+
+def sample_gait(gait, times, theta0=0.0):
+    """
+    Evaluate a gaits.CompiledGait (e.g. motion.gait_library.get("serpentine"))
+    at the given times, with the gait phase theta0 at t = 0, returns servo
+    angles (T, servos). The phase is explicit: the angle generators in
+    motion.py read the live phase, which depends on when they are called.
+    This goes through the exact rounding/clamping the robot sees, but is a
+    Python loop, use serpentine_joint_angles for large batches.
+    """
+    return np.array([gait.angles(theta0 + gait.omega * t, t) for t in times], dtype=float)
+
+
+# ======================
+# Forward kinematics
+# ======================
+
+def _link_lengths(link_lengths, links):
+    lengths = np.broadcast_to(np.asarray(link_lengths, dtype=float), (links,))
+    return lengths
+
+
+def planar_chain(joint_angles, link_lengths=LINK_LENGTH, heading0=0.0):
+    """
+    Link end points of a chain of yaw joints, viewed from above.
+    joint_angles (T, n) -> points (T, n + 2, 2). Vectorized over time and links.
+    """
+    q = np.atleast_2d(np.asarray(joint_angles, dtype=float))
+    T, n = q.shape
+    lengths = _link_lengths(link_lengths, n + 1)
+
+    headings = np.empty((T, n + 1))
+    headings[:, 0] = heading0
+    np.cumsum(q, axis=1, out=headings[:, 1:])
+    headings[:, 1:] += heading0
+
+    points = np.zeros((T, n + 2, 2))
+    np.cumsum(lengths * np.cos(headings), axis=1, out=points[:, 1:, 0])
+    np.cumsum(lengths * np.sin(headings), axis=1, out=points[:, 1:, 1])
+    return points
+
+
+def link_headings(joint_angles, heading0=0.0):
+    """Absolute heading of every link, (T, n) -> (T, n + 1)"""
+    q = np.atleast_2d(np.asarray(joint_angles, dtype=float))
+    return heading0 + np.concatenate([np.zeros((q.shape[0], 1)), np.cumsum(q, axis=1)], axis=1)
+
+
+def _rotations(axis, q):
+    # batch of rotation matrices about one body axis, q shape (T,)
+    c, s = np.cos(q), np.sin(q)
+    R = np.zeros((q.shape[0], 3, 3))
+    if axis == "yaw":  # about z
+        R[:, 0, 0], R[:, 0, 1], R[:, 1, 0], R[:, 1, 1], R[:, 2, 2] = c, -s, s, c, 1
+    elif axis == "pitch":  # about y
+        R[:, 0, 0], R[:, 0, 2], R[:, 2, 0], R[:, 2, 2], R[:, 1, 1] = c, s, -s, c, 1
+    else:
+        raise ValueError(f"unknown joint axis: {axis}")
+    return R
+
+
+def spatial_chain(joint_angles, axes, link_lengths=LINK_LENGTH):
+    """
+    Link end points of a chain with mixed yaw/pitch joints (e.g. the real
+    snake with alternating servos). joint_angles (T, n), axes is a list of
+    n 'yaw'/'pitch' -> points (T, n + 2, 3). Vectorized over time, the loop
+    is over the (few) joints only.
+    """
+    q = np.atleast_2d(np.asarray(joint_angles, dtype=float))
+    T, n = q.shape
+    if len(axes) != n:
+        raise ValueError(f"expected {n} joint axes, got {len(axes)}")
+    lengths = _link_lengths(link_lengths, n + 1)
+
+    points = np.zeros((T, n + 2, 3))
+    R = np.broadcast_to(np.eye(3), (T, 3, 3))
+    for k in range(n + 1):
+        # link k points along the local x axis
+        points[:, k + 1] = points[:, k] + lengths[k] * R[:, :, 0]
+        if k < n:
+            R = R @ _rotations(axes[k], q[:, k])
+    return points
+
+
+def axes_from_horizontal(horizontal):
+    """
+    motion.horizontal marks the servos whose axis is horizontal: they lift
+    the body (pitch). The others swing it in the ground plane (yaw), they
+    are the joints serpentine waves.
+    """
+    return ["pitch" if h else "yaw" for h in horizontal]
+
+
+def body_frame(points):
+    """Shift every pose so its mean point is at the origin"""
+    return points - points.mean(axis=1, keepdims=True)
+
+
+# ======================
+# Ground contact
+# ======================
+
+# normal / tangential friction of a link, how much easier the snake slides
+# along its body than sideways (wheels or scales make this large)
+FRICTION_RATIO = 5.0
+
+
+def locomote(joint_angles, dt, link_lengths=LINK_LENGTH, friction_ratio=FRICTION_RATIO):
+    """
+    Quasi-static planar locomotion with anisotropic (resistive force) friction.
+
+    Each link is pushed back by friction proportional to its velocity, with
+    the sideways coefficient friction_ratio times the along-body one. With no
+    inertia the friction forces and torques on the whole body have to cancel,
+    which gives a 3x3 linear system per time step for the velocity of the
+    body frame. All time steps are solved in one batch.
+
+    joint_angles (T, n) sampled every dt seconds. Returns (com, heading):
+    com (T, 2) world position of the body center, heading (T,) rotation of
+    the body frame, both starting at zero.
+    """
+    q = np.atleast_2d(np.asarray(joint_angles, dtype=float))
+    T, n = q.shape
+    lengths = _link_lengths(link_lengths, n + 1)
+
+    # link midpoints, tangents and shape velocities in the body frame
+    points = planar_chain(q, lengths)
+    mid = 0.5 * (points[:, 1:] + points[:, :-1])
+    h = link_headings(q)
+    tx, ty = np.cos(h), np.sin(h)
+    vel = np.gradient(mid, dt, axis=0) if T > 1 else np.zeros_like(mid)
+
+    # A = ct * t t^T + cn * n n^T per link (ct = 1), weighted by link length
+    cn = friction_ratio
+    a_xx = lengths * (tx * tx + cn * ty * ty)
+    a_xy = lengths * (1 - cn) * tx * ty
+    a_yy = lengths * (ty * ty + cn * tx * tx)
+
+    # J p = z x p, velocity of a body point from body rotation
+    jx, jy = -mid[..., 1], mid[..., 0]
+    ajx = a_xx * jx + a_xy * jy
+    ajy = a_xy * jx + a_yy * jy
+    avx = a_xx * vel[..., 0] + a_xy * vel[..., 1]
+    avy = a_xy * vel[..., 0] + a_yy * vel[..., 1]
+
+    M = np.empty((T, 3, 3))
+    M[:, 0, 0] = a_xx.sum(1)
+    M[:, 0, 1] = M[:, 1, 0] = a_xy.sum(1)
+    M[:, 1, 1] = a_yy.sum(1)
+    M[:, 0, 2] = M[:, 2, 0] = ajx.sum(1)
+    M[:, 1, 2] = M[:, 2, 1] = ajy.sum(1)
+    M[:, 2, 2] = (jx * ajx + jy * ajy).sum(1)
+    b = -np.stack([avx.sum(1), avy.sum(1), (jx * avx + jy * avy).sum(1)], axis=1)
+    v = np.linalg.solve(M, b[..., None])[..., 0]
+
+    # integrate the body frame in the world (trapezoid rule on the heading)
+    heading = np.concatenate([[0.0], np.cumsum(0.5 * (v[1:, 2] + v[:-1, 2]) * dt)])
+    c, s = np.cos(heading), np.sin(heading)
+    wx = c * v[:, 0] - s * v[:, 1]
+    wy = s * v[:, 0] + c * v[:, 1]
+    origin = np.zeros((T, 2))
+    origin[1:, 0] = np.cumsum(0.5 * (wx[1:] + wx[:-1]) * dt)
+    origin[1:, 1] = np.cumsum(0.5 * (wy[1:] + wy[:-1]) * dt)
+
+    center = points.mean(axis=1)
+    com = origin + np.stack([c * center[:, 0] - s * center[:, 1],
+                             s * center[:, 0] + c * center[:, 1]], axis=1)
+    return com - com[0], heading
+
+
+# ======================
+# MATLAB stage shapes
+# ======================
+
+def sidewinding_stages(L=LINK_LENGTH):
+    """The three shapes of sidewinding_sim2.m, each a (4, 2) array"""
+    def step(p, a):
+        # angles in sidewinding_sim2.m are measured from the y axis
+        return [p[0] + 2 * L * math.sin(a), p[1] + 2 * L * math.cos(a)]
+
+    pt1 = [0.0, 0.0]
+    pt2 = step(pt1, -5 * math.pi / 4)
+    pt3 = step(pt2, -7 * math.pi / 4)
+    pt4 = step(pt3, -5 * math.pi / 4)
+    stage1 = np.array([pt1, pt2, pt3, pt4])
+
+    pt2_2 = [pt3[0] - 2 * L, pt3[1]]
+    pt1_2 = [0.0, pt2_2[1] + 2 * L * math.cos(math.pi / 4)]
+    stage2 = np.array([pt1_2, pt2_2, pt3, pt4])
+
+    stage3 = stage1 + [0.0, pt3[1] - pt4[1]]
+    return [stage1, stage2, stage3]
+
+
+def _pyplot():
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise RuntimeError("plotting needs matplotlib: pip install matplotlib")
+    return plt
+
+
+def plot_sequence(points, steps=10, ax=None):
+    """Overlay the body shape at the first few time steps, like SnakeCode.m"""
+    plt = _pyplot()
+    if ax is None:
+        ax = plt.figure().gca()
+    for pose in points[:steps]:
+        ax.plot(pose[:, 0], pose[:, 1], "r-")
+    ax.set_title("Snake Position Sequence")
+    ax.set_xlabel("X Position (m)")
+    ax.set_ylabel("Y Position (m)")
+    ax.set_aspect("equal")
+    return ax
+
+
+def plot_sidewinding_stages(L=LINK_LENGTH, ax=None):
+    plt = _pyplot()
+    if ax is None:
+        ax = plt.figure().gca()
+    styles = [("b-", "Stage 1"), ("m-", "Stage 2"), ("r-", "Stage 3")]
+    for pts, (style, label) in zip(sidewinding_stages(L), styles):
+        ax.plot(pts[:, 0], pts[:, 1], style, linewidth=2, label=label)
+    ax.set_title("Shape Change During Sidewinding (from Above)")
+    ax.set_xlabel("X-Position(m)")
+    ax.set_ylabel("Y-Position(m)")
+    ax.legend()
+    ax.set_aspect("equal")
+    return ax
+
+
+# ======================
+# Benchmark
+# ======================
+
+def bench(cycles=10000, steps_per_cycle=50, n=3):
+    """Gait cycles per second through planar_chain, serpentine joint angles"""
+    omega = 2.0
+    t = np.linspace(0, cycles * 2 * math.pi / omega, cycles * steps_per_cycle, endpoint=False)
+    start = time.perf_counter()
+    q = serpentine_joint_angles(t, math.radians(60), omega, 2 * 0.5 * math.pi / n, n)
+    planar_chain(q)
+    return cycles / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snake kinematics")
+    parser.add_argument("what", choices=["serpentine", "sidewinding", "bench"])
+    parser.add_argument("--out", help="save the plot here instead of showing it")
+    args = parser.parse_args()
+
+    if args.what == "bench":
+        print(f"{bench():.0f} gait cycles per second")
+    else:
+        if args.what == "serpentine":
+            # parameters from SnakeCode.m, one time step per millisecond
+            t = np.arange(1, 5001)
+            q = serpentine_joint_angles(t, 0.4, 0.5, 2 * 0.5 * math.pi / 3, 3, -0.05)
+            plot_sequence(planar_chain(q, 0.06))
+        else:
+            plot_sidewinding_stages()
+
+        plt = _pyplot()
+        if args.out:
+            plt.savefig(args.out)
+        else:
+            plt.show()
@@ -0,0 +1,78 @@
+import csv
+import os
+import threading
+
+# Where soil samples end up on the ground station: the dashboard's live.csv
+# (testing/dashboard/sssdash.py), one row per sample. The first four columns
+# are the ones the dashboard and makesencsv.py's simulator use, the rest say
+# how much the sample can be trusted (soil_sampler.py's flags, 0 is clean)
+# and which one it was on the Pico (boot, seq). Rows without a usable
+# reading keep their timestamp and flags and leave the values empty.
+#
+# Samples come in batches (sensor_stream.py, serial_ingest.py), a batch is
+# one open and one write, not one per sample like testing/pi_sensor.py's
+# old loop. Rows are in the order they arrived: samples backfilled after a
+# Wi-Fi drop come after newer ones, sort by timestamp (or boot and seq)
+# when reading.
+
+LIVE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testing", "dashboard", "live.csv")
+COLUMNS = ["timestamp", "capacitance", "moisture_pct", "temperature_c", "flags", "kept", "boot", "seq"]
+
+# moisture (%) from the sensor's counts, the transfer function of makesencsv.py
+MOISTURE_A = 0.1428
+MOISTURE_B = -82.2140
+
+
+def moisture_pct(counts):
+    return MOISTURE_A * counts + MOISTURE_B
+
+
+def _row(s):
+    if s.moisture is None:
+        counts = pct = ""
+    else:
+        counts = round(s.moisture, 2)
+        pct = round(moisture_pct(s.moisture), 3)
+    return ["%.3f" % s.timestamp, counts, pct, "" if s.temp_c is None else round(s.temp_c, 2),
+            s.flags, s.kept, s.boot, s.seq]
+
+
+class LogStore:
+    """Appends sensor_stream.Samples to a CSV, safe to share between threads"""
+
+    def __init__(self, path=LIVE_CSV):
+        self.path = path
+        self.rows = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="") as f:
+                header = next(csv.reader(f), [])
+            if header != COLUMNS:
+                raise ValueError("%s has the columns %s, not %s; move it away first"
+                                 % (path, ",".join(header), ",".join(COLUMNS)))
+        else:
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerow(COLUMNS)
+
+    def append(self, samples):
+        with self._lock:
+            with open(self.path, "a", newline="") as f:
+                csv.writer(f).writerows(_row(s) for s in samples)
+            self.rows += len(samples)
+
+    def received(self):
+        """(boot, seqs) of the Pico boot of the newest row, (None, []) for an empty log"""
+        boot, seqs = None, []
+        with self._lock:
+            with open(self.path, newline="") as f:
+                for row in csv.DictReader(f):
+                    if row["boot"] != boot:
+                        boot, seqs = row["boot"], []
+                    seqs.append(int(row["seq"]))
+        return (None, []) if boot is None else (int(boot), seqs)
+
+    def read(self):
+        """Every row as a dict of strings, in the order they arrived"""
+        with self._lock:
+            with open(self.path, newline="") as f:
+                return list(csv.DictReader(f))
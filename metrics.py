@@ -0,0 +1,297 @@
+import bisect
+import math
+import threading
+import time
+
+# Metrics for the ground station, rendered in the Prometheus text format at /metrics.
+#
+# Nothing in here takes a lock. Counters are written from several threads
+# (frames_dropped by the gait thread and the serial writer, send_errors by
+# the gait thread and the HTTP thread on a stop, the sensor counters by the
+# stream receiver and the serial ingest), and an unlocked += from two
+# threads can lose an increment. So every thread counts in a shard of its
+# own and the shards are summed at scrape time: each shard has one writer,
+# a dict item update is atomic under the GIL, and an update stays cheap
+# enough to leave on in the 100 Hz loop.
+#
+# A histogram has one writer at a time (send_latency the thread sending
+# frames, control_rtt the link's reader thread), gauges are only ever set,
+# the last set wins.
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        # thread ident -> that thread's count
+        self._shards = {}
+
+    def inc(self, n=1):
+        shards = self._shards
+        tid = threading.get_ident()
+        shards[tid] = shards.get(tid, 0) + n
+
+    @property
+    def value(self):
+        # copy() is one step under the GIL, a thread counting for the first
+        # time can't change the dict in the middle of the sum
+        return sum(self._shards.copy().values())
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Gauge:
+    """A gauge is either set() directly or reads its value from fn() at scrape time"""
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        value = self.value
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                value = math.nan
+        if value is None:
+            value = math.nan
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_fmt(value)}",
+        ]
+
+
+class StateGauge:
+    """One-hot gauge over a label, e.g. snake_active_gait{gait="serpentine"} 1"""
+
+    def __init__(self, name, help_text, label, states):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.states = list(states)
+        self.state = None
+
+    def set(self, state):
+        if state is not None and state not in self.states:
+            self.states.append(state)
+        self.state = state
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for s in self.states:
+            lines.append(f'{self.name}{{{self.label}="{s}"}} {1 if s == self.state else 0}')
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram, buckets are upper bounds in seconds"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = sorted(buckets)
+        # one extra slot for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        # copy first so the cumulative counts are consistent with each other
+        counts = list(self.counts)
+        total = 0
+        for bound, c in zip(self.buckets, counts):
+            total += c
+            lines.append(f'{self.name}_bucket{{le="{_fmt(bound)}"}} {total}')
+        total += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f"{self.name}_sum {_fmt(self.sum)}")
+        lines.append(f"{self.name}_count {total}")
+        return lines
+
+
+class TickTimer:
+    """
+    Tracks the achieved loop rate and jitter of a periodic loop.
+    Call tick() once per iteration. Both values are exponentially weighted
+    so they follow the recent behaviour of the loop.
+    """
+
+    def __init__(self, name, help_rate, help_jitter, smoothing=0.1):
+        self.rate = Gauge(name + "_rate_hz", help_rate)
+        self.jitter = Gauge(name + "_jitter_seconds", help_jitter)
+        self.smoothing = smoothing
+        self.last = None
+        self.mean_dt = None
+
+    def reset(self):
+        self.last = None
+        self.mean_dt = None
+        self.rate.set(0)
+        self.jitter.set(0)
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        last = self.last
+        self.last = now
+        if last is None:
+            return
+
+        dt = now - last
+        if self.mean_dt is None:
+            self.mean_dt = dt
+            return
+
+        a = self.smoothing
+        self.jitter.value += a * (abs(dt - self.mean_dt) - self.jitter.value)
+        self.mean_dt += a * (dt - self.mean_dt)
+        self.rate.value = 1.0 / self.mean_dt if self.mean_dt > 0 else 0
+
+    def render(self):
+        return self.rate.render() + self.jitter.render()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.add(Counter(name, help_text))
+
+    def gauge(self, name, help_text, fn=None):
+        return self.add(Gauge(name, help_text, fn))
+
+    def histogram(self, name, help_text, buckets):
+        return self.add(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for m in self.metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+# ======================
+# Ground station metrics
+# ======================
+
+# send() latency buckets, 50 us to 1 s
+LATENCY_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+registry = Registry()
+
+frames_sent = registry.counter("snake_frames_sent_total", "Servo frames sent to the motor Pico")
+bytes_sent = registry.counter("snake_bytes_sent_total", "Bytes sent to the motor Pico")
+send_errors = registry.counter("snake_send_errors_total", "Frames that failed to send")
+keyframes_sent = registry.counter("snake_keyframes_sent_total", "Full frames sent, the rest are deltas")
+frames_suppressed = registry.counter(
+    "snake_frames_suppressed_total", "Ticks not sent because no joint angle changed")
+priority_sent = registry.counter(
+    "snake_priority_commands_total", "Stop/resume commands sent on the priority path")
+frames_dropped = registry.counter(
+    "snake_frames_dropped_total", "Frames replaced by a newer one before they were written")
+send_latency = registry.histogram(
+    "snake_send_seconds", "Time spent in the send call for one frame", LATENCY_BUCKETS)
+tick = registry.add(TickTimer(
+    "snake_tick",
+    "Achieved rate of the gait send loop",
+    "Mean absolute deviation of the gait loop period"))
+connects = registry.counter("snake_connects_total", "TCP connections opened to the motor Pico")
+reconnects = registry.counter(
+    "snake_reconnects_total", "Connections opened after the first one of the process")
+connect_errors = registry.counter("snake_connect_errors_total", "Failed connection attempts")
+sensor_commands = registry.counter("snake_sensor_commands_total", "Commands sent to the sensor Pico")
+http_commands = registry.counter("snake_http_commands_total", "Motion commands received over HTTP")
+discovery_announcements = registry.counter(
+    "snake_discovery_announcements_total", "Pico announcements received (discovery.py)")
+discovery_changes = registry.counter(
+    "snake_discovery_changes_total", "Picos that appeared, rebooted or moved to a new address")
+motor_recovery = registry.gauge(
+    "snake_motor_recovery_seconds", "Last time from losing the motor link to sending frames again")
+sensor_samples = registry.counter(
+    "snake_sensor_samples_total", "Soil samples received over the sensor stream (sensor_stream.py)")
+sensor_stream_bytes = registry.counter(
+    "snake_sensor_stream_bytes_total", "Bytes received over the sensor stream")
+sensor_backfilled = registry.counter(
+    "snake_sensor_backfilled_total", "Soil samples the sensor Pico kept through an outage and sent later")
+sensor_stream_errors = registry.counter(
+    "snake_sensor_stream_errors_total", "Sensor stream connections lost or refused")
+sensor_serial_lines = registry.counter(
+    "snake_sensor_serial_lines_total", "Soil samples read off sensor Picos on USB serial (serial_ingest.py)")
+sensor_serial_bytes = registry.counter(
+    "snake_sensor_serial_bytes_total", "Bytes read off the sensor serial ports")
+sensor_serial_malformed = registry.counter(
+    "snake_sensor_serial_malformed_total", "Lines on the sensor serial ports that weren't samples")
+sensor_serial_dropped = registry.counter(
+    "snake_sensor_serial_dropped_total", "Sample batches a slow live subscriber missed")
+sensor_serial_errors = registry.counter(
+    "snake_sensor_serial_errors_total", "Sensor serial ports that failed to open or went away")
+active_gait = registry.add(StateGauge(
+    "snake_active_gait", "Gait currently being sent", "gait", ["serpentine", "sidewinding"]))
+
+# reported by the motor Pico over the telemetry back-channel (telemetry.py)
+pico_reports = registry.counter("snake_pico_reports_total", "Telemetry reports received from the motor Pico")
+pico_bad_reports = registry.counter(
+    "snake_pico_bad_reports_total", "Lines from the motor Pico that were not telemetry reports")
+pico_last_seq = registry.gauge("snake_pico_last_seq", "Sequence number of the last frame the Pico applied")
+pico_frames_applied = registry.gauge(
+    "snake_pico_frames_applied", "Frames applied by the Pico on the current connection")
+pico_frames_skipped = registry.gauge(
+    "snake_pico_frames_skipped", "Frames the Pico skipped for a newer one on the current connection")
+pico_apply_latency = registry.gauge(
+    "snake_pico_apply_latency_seconds", "Mean receive-to-apply time on the Pico over the last report")
+pico_apply_latency_max = registry.gauge(
+    "snake_pico_apply_latency_max_seconds", "Worst receive-to-apply time on the Pico over the last report")
+pico_loop_time = registry.gauge(
+    "snake_pico_loop_seconds", "Mean time the Pico spent handling one read over the last report")
+pico_loop_time_max = registry.gauge(
+    "snake_pico_loop_max_seconds", "Worst time the Pico spent handling one read over the last report")
+pico_mem_free = registry.gauge("snake_pico_mem_free_bytes", "gc.mem_free() on the motor Pico")
+pico_parse_errors = registry.gauge(
+    "snake_pico_parse_errors", "Lines the Pico could not parse on the current connection")
+control_rtt = registry.histogram(
+    "snake_control_rtt_seconds", "Frame sent to Pico report of it being applied", LATENCY_BUCKETS)
+
+
+def queue_gauge(name, help_text, fn):
+    """Register a queue depth read at scrape time, fn() returns the current depth"""
+    return registry.gauge(name, help_text, fn)
+
+
+def record_connect():
+    if connects.value > 0:
+        reconnects.inc()
+    connects.inc()
@@ -2,12 +2,37 @@ import serial
 import time
 import math
 import socket
+import threading
 
-# wifi connection
+import discovery
+import gait_loop
+import gaits
+import gait_params
+import log_store
+import metrics
+import recorder
+import sensor_stream
+import trajectory
+import transport
+
+# wifi connection. The Picos announce themselves (discovery.py), these
+# addresses are only used until they do or when discovery is off
 HOST_motor =  '192.168.34.119'
 HOST_sensor = '192.168.35.242'
 PORT = 8080
 
+# after the motor link drops, keep trying this long before giving up the gait
+RECONNECT_TIMEOUT = 30.0
+# retry the connection at least this often while waiting, an announcement
+# from a rebooted Pico cuts the wait short
+RETRY_INTERVAL = 1.0
+
+# live table of the Picos on the network, started by start_discovery()
+pico_registry = discovery.Registry()
+
+# writes the sensor Pico's samples to the log store, see start_sensor_stream()
+sensor_receiver = None
+
 # ===== Common Parameters =====
 num_servos = 6
 calibration = [0, -20, 0, -30, 0, 0]
@@ -20,67 +45,299 @@ K_n = 0.5
 n = 3
 beta = (2 * K_n * math.pi) / n
 
+# the constants above are only the startup defaults, the live values
+# are in params and can be changed while a gait is running (see app.py)
+params = gait_params.GaitParams(alpha, omega, K_n, n, calibration, beta)
+
 # ===== Control Flag =====
 running = False
 
+# set by emergency_stop() to wake the gait loop out of its sleep
+stop_event = threading.Event()
+
+# transport of the running gait loop, None when no gait is running
+active_transport = None
+
+# thread of the current (or last) gait, see start()
+gait_thread = None
+_start_lock = threading.Lock()
+
+# how long a start waits for the thread of a stopped gait to finish
+STOP_JOIN_TIMEOUT = 2.0
+
+# every frame and command is logged here, see recorder.py (the file is
+# made by the first record, not by importing this module)
+flight = recorder.FlightRecorder()
+
+# printing every frame costs more than sending it, only turn on for debugging
+debug_print = False
+
+
+def start_discovery():
+    try:
+        pico_registry.start()
+    except OSError as e:
+        print("discovery disabled, using fixed addresses:", e)
+
+
+def start_sensor_stream(path=log_store.LIVE_CSV):
+    """Log the soil samples the sensor Pico streams over Wi-Fi, see sensor_stream.py"""
+    global sensor_receiver
+    if not pico_registry.running:
+        # the fixed address is the single-client angle server, it has no stream
+        print("sensor stream disabled: only a Pico found by discovery can stream")
+        return
+    try:
+        store = log_store.LogStore(path)
+    except (OSError, ValueError) as e:
+        print("sensor stream disabled:", e)
+        return
+    sensor_receiver = sensor_stream.Receiver(_sensor_stream_address, store).start()
+
+
+def _sensor_stream_address():
+    # only a sensor Pico that announces the stream capability is asked for
+    # one. Without discovery HOST_sensor is pico_wifi_sensor.py's angle
+    # server, which serves one client: streaming from it would lock out
+    # lower/raise_sensor.
+    if not pico_registry.running:
+        return None
+    dev = pico_registry.lookup("sensor")
+    if dev is None or "stream" not in dev.caps:
+        return None
+    return dev.host, dev.port
+
+
+def pico_address(role):
+    """(host, port) of the "motor" or "sensor" Pico"""
+    dev = pico_registry.lookup(role) if pico_registry.running else None
+    if dev is not None:
+        return dev.host, dev.port
+    return (HOST_motor if role == "motor" else HOST_sensor), PORT
+
+
+def _wait_for_motor(lost_at, since):
+    """
+    Between reconnect attempts. Returns the new since, or None to give up.
+    A Pico announcing itself after since (it rebooted or moved) ends the
+    wait right away.
+    """
+    if time.monotonic() - lost_at > RECONNECT_TIMEOUT or not running:
+        return None
+    if pico_registry.running:
+        dev = pico_registry.wait_for("motor", RETRY_INTERVAL, since=since,
+                                     keep_going=lambda: running)
+        if dev is not None:
+            since = dev.first_seen
+    else:
+        stop_event.wait(RETRY_INTERVAL)
+    return since if running else None
+
 
 def socket_sender_loop(angle_generator):
     """
     Generic loop that sends servo angles over TCP
-    angle_generator() must return a list of angles
+    angle_generator() must return a list of angles.
+    If the link drops, the gait carries on as soon as the Pico is back.
+    """
+    global running, active_transport
+
+    lost_at = since = None
+    while running:
+        try:
+            host, port = pico_address("motor")
+            if lost_at is None:
+                link = transport.TcpTransport(host, port).connect()
+            else:
+                # a rebooting Pico doesn't refuse, it just doesn't answer
+                link = transport.TcpTransport(host, port, timeout=RETRY_INTERVAL).connect()
+        except OSError:
+            if lost_at is None:
+                if not pico_registry.running:
+                    running = False
+                    raise
+                lost_at = since = time.monotonic()
+            since = _wait_for_motor(lost_at, since)
+            if since is None:
+                running = False
+                return
+            continue
+
+        if lost_at is not None:
+            recovery = time.monotonic() - lost_at
+            metrics.motor_recovery.set(recovery)
+            print(f"motor link back after {recovery:.2f} s")
+            lost_at = None
+
+        active_transport = link
+        stop_event.clear()
+        try:
+            gait_loop.run(angle_generator, link, lambda: running, flight,
+                          debug_print=debug_print, wake=stop_event)
+            return
+        except OSError as e:
+            # try again straight away, the Pico may already be back
+            print("motor link lost:", e)
+            lost_at = since = time.monotonic()
+        finally:
+            active_transport = None
+            link.close()
+
+
+def neutral_pose():
+    """Every joint straight, what the snake goes to on stop"""
+    return [max(0, min(180, c + 90)) for c in params.snapshot()["calibration"]]
+
+
+def emergency_stop():
+    """
+    Stop the gait and put the snake in its neutral pose right away.
+    Runs on the caller's (HTTP) thread: the stop command goes straight out
+    on the priority path instead of waiting for the gait loop to notice.
     """
     global running
+    # send before clearing running, otherwise the gait thread may close the
+    # link under us. A frame it sends meanwhile is ignored by the latched Pico.
+    link = active_transport
+    sent = False
+    if link is not None:
+        pose = neutral_pose()
+        try:
+            link.send_priority(transport.encode_stop(pose))
+            flight.record(recorder.STOP, pose)
+            sent = True
+        except OSError:
+            metrics.send_errors.inc()
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST_motor, PORT))
-        start_time = time.perf_counter()
+    running = False
+    stop_event.set()
+    return sent
 
-        while running:
-            angles = angle_generator(start_time)
-            message = ",".join(map(str, angles)) + "\r\n"
-            s.sendall(message.encode())
-            print("sent:", message)
-            time.sleep(0.05)
 
+def start(target, *args):
+    """
+    Run target(*args) on a new gait thread unless a gait is running.
+    A gait that was just stopped may not have noticed yet: its thread is
+    waited for first, two gait threads must never drive the motor at once.
+    Returns False if a gait is running or the last one didn't finish in
+    STOP_JOIN_TIMEOUT.
+    """
+    global running, gait_thread
+    with _start_lock:
+        if running:
+            return False
+        if gait_thread is not None:
+            gait_thread.join(STOP_JOIN_TIMEOUT)
+            if gait_thread.is_alive():
+                return False
+        running = True
+        gait_thread = threading.Thread(target=_run_gait, args=(target, args), name=target.__name__,
+                                       daemon=True)
+        gait_thread.start()
+    return True
 
-def serpentine_angles(start_time):
-    t = time.perf_counter() - start_time
-    theta = [0] * num_servos
 
-    for joint in range(num_servos):
-        if horizontal[joint] == 0:
-            wave = alpha * math.sin(omega * t + joint * beta)
-            angle = round(wave, 0) + calibration[joint]
-        else:
-            angle = calibration[joint]
+def _run_gait(target, args):
+    global running
+    try:
+        target(*args)
+    finally:
+        # however the gait ended, an error included, the next one can start
+        running = False
 
-        servo_angle = angle + 90
-        theta[joint] = max(0, min(180, servo_angle))
 
-    return theta
+def _unsent_bytes():
+    link = active_transport
+    return link.unsent_bytes() if link is not None else 0
 
 
-def serpentine_loop():
-    socket_sender_loop(serpentine_angles)
+metrics.queue_gauge(
+    "snake_motor_unsent_bytes",
+    "Bytes queued below the motor transport (socket or serial buffer)",
+    _unsent_bytes)
+
 
+# serpentine and sidewinding are declared in gaits.py, along with any user
+# gaits from gaits.json. Both generators keep the old signature:
+# angles(start_time, now=None), now can be given to sample a gait offline.
+gait_library = gaits.Library(
+    params, [gaits.serpentine(horizontal), gaits.SIDEWINDING] + gaits.load_specs())
 
+serpentine_angles = gait_library.angle_generator("serpentine")
+sidewinding_angles = gait_library.angle_generator("sidewinding")
 
-def sidewinding_angles(start_time):
-    t = time.perf_counter() - start_time
 
-    s1 = 5 + 5 * math.sin(2 * math.pi * t)
-    s2 = 22.5 + 22.5 * math.sin(2 * math.pi * t + math.pi / 2)
-    s3 = 0
-    s4 = 18 + 18 * math.sin(2 * math.pi * t + math.pi / 4)
-    s5 = 5 + 5 * math.sin(2 * math.pi * t)
+def serpentine_loop():
+    params.reset_phase()
+    socket_sender_loop(serpentine_angles)
 
-    return [max(0, min(180, round(a))) for a in [s1, s2, s3, s4, s5]]
 
 
 def sidewinding_loop():
     socket_sender_loop(sidewinding_angles)
 
 
+def gait_loop_named(name):
+    """Stream any gait from the library, e.g. a user gait from gaits.json"""
+    params.reset_phase()
+    socket_sender_loop(gait_library.angle_generator(name))
+
+
+def onboard_loop(name):
+    """
+    Upload a gait's period table and let the Pico play it on its own.
+    Parameter updates are re-uploaded, starting from the current phase so
+    the wave carries on where it was.
+    """
+    global active_transport
+
+    link = transport.TcpTransport(*pico_address("motor")).connect()
+    changed = threading.Event()
+    listener = lambda snapshot: changed.set()
+    params.add_listener(listener)
+    active_transport = link
+    stop_event.clear()
+    metrics.active_gait.set(name)
+    try:
+        params.reset_phase()
+        link.send_priority(transport.RESUME)
+        start = time.perf_counter()
+        while running:
+            now = time.perf_counter()
+            gait = gait_library.get(name)
+            theta = params.phase(now) if gait.follows_params else gait.omega * (now - start)
+            link.send(gaits.encode_upload(gait, theta))
+            changed.clear()
+            while running and not changed.is_set():
+                stop_event.wait(0.1)
+    finally:
+        params.remove_listener(listener)
+        metrics.active_gait.set(None)
+        active_transport = None
+        link.close()
+
+
+def trajectory_loop(joints):
+    """
+    Upload a fitted trajectory (trajectory.fit) and wait while the Pico plays
+    it. Nothing is streamed meanwhile, emergency_stop() still works because
+    the link stays open as active_transport.
+    """
+    global active_transport
+
+    link = transport.TcpTransport(*pico_address("motor")).connect()
+    active_transport = link
+    stop_event.clear()
+    metrics.active_gait.set("trajectory")
+    try:
+        trajectory.upload(link, joints)
+        stop_event.wait(trajectory.duration(joints))
+    finally:
+        metrics.active_gait.set(None)
+        active_transport = None
+        link.close()
+
+
 def lower_sensor():
     socket_to_motor(20)
 
@@ -95,9 +352,11 @@ def socket_to_motor(angle):
     global running
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST_sensor, PORT))
+        s.connect(pico_address("sensor"))
 
         message = str(angle) + "\r\n"
         s.sendall(message.encode())
+        metrics.sensor_commands.inc()
+        flight.sensor(angle)
         print("sent to sensor:", message)
         time.sleep(0.05)    
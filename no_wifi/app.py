@@ -1,9 +1,7 @@
 from flask import Flask, render_template
-import threading
 import motion
 
 app = Flask(__name__)
-motion_thread = None
 
 
 @app.route("/")
@@ -13,31 +11,21 @@ def index():
 
 @app.route("/start_forward", methods=["POST"])
 def start_forward():
-    global motion_thread
-    if not motion.running:
-        motion.running = True
-        motion_thread = threading.Thread(
-            target=motion.serpentine_loop, daemon=True
-        )
-        motion_thread.start()
+    if not motion.start(motion.serpentine_loop):
+        return "Already moving, stop first", 409
     return "Started serpentine"
 
 
 @app.route("/start_sidewinding", methods=["POST"])
 def start_sidewinding():
-    global motion_thread
-    if not motion.running:
-        motion.running = True
-        motion_thread = threading.Thread(
-            target=motion.sidewinding_loop, daemon=True
-        )
-        motion_thread.start()
+    if not motion.start(motion.sidewinding_loop):
+        return "Already moving, stop first", 409
     return "Started sidewinding"
 
 
 @app.route("/stop", methods=["POST"])
 def stop():
-    motion.running = False
+    motion.emergency_stop()
     return "Stopped motion"
 
 
@@ -1,9 +1,19 @@
-import serial
+import os
+import sys
 import time
 import math
+import threading
+
+import serial
+
+# the gait loop and transports are shared with the Wi-Fi build one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gait_loop
+import transport
 
 # Serial connection
-ser = serial.Serial('/dev/ttyACM1', 115200)
+SERIAL_PORT = '/dev/ttyACM1'
+BAUDRATE = 115200
 
 # ===== Common Parameters =====
 num_servos = 6
@@ -20,42 +30,103 @@ beta = (2 * K_n * math.pi) / n
 # ===== Control Flag =====
 running = False
 
+# set by emergency_stop() to wake the gait loop out of its sleep
+stop_event = threading.Event()
 
-def serpentine_loop():
-    global running
-    start_time = time.perf_counter()
+# transport of the running gait loop, None when no gait is running
+active_transport = None
 
-    while running:
-        t = time.perf_counter() - start_time
-        angles = []
+# thread of the current (or last) gait, see start()
+gait_thread = None
+_start_lock = threading.Lock()
+STOP_JOIN_TIMEOUT = 2.0
 
-        for j in range(num_servos):
-            if horizontal[j] == 0:
-                wave = alpha * math.sin(omega * t + j * beta)
-                angle = round(wave, 0) + calibration[j]
-            else:
-                angle = calibration[j]
 
-            servo_angle = max(0, min(180, angle + 90))
-            angles.append(servo_angle)
+def serial_sender_loop(angle_generator):
+    """
+    Same loop as motion.socket_sender_loop, over USB serial. Writes happen
+    on the transport's writer thread, so a slow port never delays a tick.
+    """
+    global running, active_transport
 
-        ser.write((",".join(map(str, angles)) + "\r\n").encode())
-        time.sleep(0.05)
+    try:
+        link = transport.SerialTransport(SERIAL_PORT, BAUDRATE).connect()
+    except serial.SerialException:
+        running = False
+        raise
 
+    active_transport = link
+    stop_event.clear()
+    try:
+        gait_loop.run(angle_generator, link, lambda: running, wake=stop_event)
+    finally:
+        active_transport = None
+        link.close()
 
-def sidewinding_loop():
+
+def emergency_stop():
+    """Stop the gait and send the neutral pose ahead of any queued frame"""
     global running
-    start_time = time.perf_counter()
+    link = active_transport
+    if link is not None:
+        pose = [max(0, min(180, c + 90)) for c in calibration]
+        link.send_priority(transport.encode_stop(pose))
+    running = False
+    stop_event.set()
+
+
+def start(target):
+    """Same as motion.start: waits for a stopped gait's thread before the next one"""
+    global running, gait_thread
+    with _start_lock:
+        if running:
+            return False
+        if gait_thread is not None:
+            gait_thread.join(STOP_JOIN_TIMEOUT)
+            if gait_thread.is_alive():
+                return False
+        running = True
+        gait_thread = threading.Thread(target=target, daemon=True)
+        gait_thread.start()
+    return True
+
 
-    while running:
-        t = time.perf_counter() - start_time
+def serpentine_angles(start_time, now=None):
+    if now is None:
+        now = time.perf_counter()
+    t = now - start_time
+    angles = []
 
-        s1 = 5 + 5 * math.sin(2 * math.pi * t)
-        s2 = 22.5 + 22.5 * math.sin(2 * math.pi * t + math.pi / 2)
-        s3 = 0
-        s4 = 18 + 18 * math.sin(2 * math.pi * t + math.pi / 4)
-        s5 = 5 + 5 * math.sin(2 * math.pi * t)
+    for j in range(num_servos):
+        if horizontal[j] == 0:
+            wave = alpha * math.sin(omega * t + j * beta)
+            angle = round(wave, 0) + calibration[j]
+        else:
+            angle = calibration[j]
 
-        angles = [max(0, min(180, round(a))) for a in [s1, s2, s3, s4, s5]]
-        ser.write((",".join(map(str, angles)) + "\r\n").encode())
-        time.sleep(0.05)
+        servo_angle = max(0, min(180, angle + 90))
+        angles.append(servo_angle)
+
+    return angles
+
+
+def serpentine_loop():
+    serial_sender_loop(serpentine_angles)
+
+
+def sidewinding_angles(start_time, now=None):
+    if now is None:
+        now = time.perf_counter()
+    t = now - start_time
+
+    s1 = 5 + 5 * math.sin(2 * math.pi * t)
+    s2 = 22.5 + 22.5 * math.sin(2 * math.pi * t + math.pi / 2)
+    s3 = 0
+    s4 = 18 + 18 * math.sin(2 * math.pi * t + math.pi / 4)
+    s5 = 5 + 5 * math.sin(2 * math.pi * t)
+
+    return [max(0, min(180, round(a))) for a in [s1, s2, s3, s4, s5]]
+
+
+def sidewinding_loop():
+    serial_sender_loop(sidewinding_angles)
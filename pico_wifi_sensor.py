@@ -1,41 +1,16 @@
 from machine import Pin, PWM
-import sys
-import network
-import socket
-from time import sleep
-from picozero import pico_led
+import errno
+from pico_discovery import Announcer, FW_VERSION
+from pico_net import Net
 import machine
-import rp2
 
 # wifi credentials
 ssid = 'OLIN-DEVICES'
 password = 'BestOval4Engineers!'
+# (ip, netmask, gateway, dns) skips DHCP on every (re)connect, None for DHCP
+STATIC = None
 
-def connect():
-    #Connect to WLAN
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(ssid, password)
-    while wlan.isconnected() == False:
-        if rp2.bootsel_button() == 1:
-            sys.exit()
-        print('Waiting for connection...')
-        pico_led.on()
-        sleep(0.5)
-        pico_led.off()
-        sleep(0.5)
-    ip = wlan.ifconfig()[0]
-    print(f'Connected on {ip}')
-    pico_led.on()
-    return ip
-
-def open_socket(ip):
-    # Open a socket
-    address = (ip, 8080)
-    connection = socket.socket()
-    connection.bind(address)
-    connection.listen(1)
-    return connection
+net = Net(ssid, password, STATIC, fw=FW_VERSION)
 
 def angle_to_duty(angle):
     # Map 0–180° to duty cycle (adjust for your servos)
@@ -51,36 +26,50 @@ def angle_to_duty(angle):
     return duty
 
 
-ip = connect()
-print(ip)
-connection = open_socket(ip)
+net.connect()
+net.listen(8080)
 
 # Setup 5 servos on GPIO pins
 motor_pin = 27
 servo = PWM(Pin(motor_pin))
 servo.freq(50)  # Standard servo frequency
 
-client, addr = connection.accept()
-print('Client connected from', addr)
-
-buffer = b""
+# tell the ground station where we are (discovery.py)
+announcer = Announcer("sensor", 8080, ["angle"])
 
+# the ground station opens a connection per command (motion.socket_to_motor)
 while True:
-    data = client.recv(32)
-    if not data:
-        break
+    client, addr = net.accept(announcer)
+    print('Client connected from', addr)
+    client.settimeout(0.5)
+
+    buffer = b""
+
+    while True:
+        try:
+            data = client.recv(32)
+        except OSError as e:
+            if e.args[0] != errno.ETIMEDOUT:
+                break
+            # timed out, nothing arrived
+            announcer.poll()
+            if not net.poll():
+                break
+            continue
+        if not data:
+            break
 
-    buffer += data
-    try:
-        if b"\n" in buffer:
-            line, buffer = buffer.split(b"\n", 1)
-            angle = float(line.decode().strip())
+        buffer += data
+        try:
+            if b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                angle = float(line.decode().strip())
 
-            duty = angle_to_duty(angle)
-            servo.duty_u16(duty)
+                duty = angle_to_duty(angle)
+                servo.duty_u16(duty)
 
-    except Exception as e:
-            print("Parse error:", e, line)
+        except Exception as e:
+                print("Parse error:", e, line)
 
-client.close()
-print("Socket closed")
\ No newline at end of file
+    client.close()
+    print("Socket closed")
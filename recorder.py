@@ -0,0 +1,227 @@
+import argparse
+import csv
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Flight recorder: every frame sent to the snake and every HTTP command is
+# written as a fixed-size record into a memory-mapped ring file. The file never
+# grows past HEADER.size + capacity * RECORD.size bytes, old records are
+# overwritten once the ring is full.
+#
+# Dump it with:  python recorder.py dump flight.rec flight.csv
+
+RECORDER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flight.rec")
+DEFAULT_CAPACITY = 100000  # ~4.6 MB, about 80 minutes of frames at 20 Hz
+
+MAGIC = b"SSSREC01"
+# magic, record size, capacity
+HEADER = struct.Struct("<8sII48x")
+# seq, wall time, kind, value count, command code, 12 angles in centidegrees
+MAX_VALUES = 12
+RECORD = struct.Struct("<QdBBH%dh4x" % MAX_VALUES)
+
+# record kinds
+FRAME = 1
+SENSOR = 2
+COMMAND = 3
+STOP = 4
+KIND_NAMES = {FRAME: "frame", SENSOR: "sensor", COMMAND: "command", STOP: "stop"}
+
+# HTTP commands are stored as a code, new endpoints get appended at the end
+COMMANDS = [
+    "unknown",
+    "start_serpentine",
+    "start_sidewinding",
+    "lower_sensor",
+    "raise_sensor",
+    "stop",
+    "set_params",
+    "save_preset",
+    "load_preset",
+    "delete_preset",
+    "start_trajectory",
+    "add_gait",
+    "start_gait",
+]
+COMMAND_CODES = {name: i for i, name in enumerate(COMMANDS)}
+
+_PAD = (0,) * MAX_VALUES
+
+
+class FlightRecorder:
+    """
+    readonly opens an existing recording without ever writing to it (dump,
+    replay), a file of the wrong size or with a bad header is a ValueError.
+    Otherwise the file is made, or reset if it doesn't match, when the first
+    record is written, so importing motion leaves the disk alone.
+    """
+
+    def __init__(self, path=RECORDER_FILE, capacity=DEFAULT_CAPACITY, readonly=False):
+        self.path = path
+        self.capacity = capacity
+        self.size = HEADER.size + capacity * RECORD.size
+        self._mm = None
+        self._seq = None
+        self._lock = threading.Lock()
+        if readonly:
+            self._open_readonly()
+
+    def _open_readonly(self):
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != self.size:
+                raise ValueError(f"{self.path} is not {self.size} bytes, not a complete recording")
+            mm = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+        if HEADER.unpack_from(mm, 0) != (MAGIC, RECORD.size, self.capacity):
+            mm.close()
+            raise ValueError(f"{self.path} is not a flight recorder file")
+        self._mm = mm
+
+    def _open(self):
+        with self._lock:
+            if self._mm is not None:
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fresh = os.fstat(fd).st_size != self.size
+                if fresh:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                mm = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+
+            if fresh or HEADER.unpack_from(mm, 0) != (MAGIC, RECORD.size, self.capacity):
+                mm[:] = bytes(self.size)
+                HEADER.pack_into(mm, 0, MAGIC, RECORD.size, self.capacity)
+                last = 0
+            else:
+                last = max((r[0] for r in _iter_raw(mm, self.capacity)), default=0)
+
+            # next() on an itertools.count is atomic under the GIL, so the gait
+            # thread and the HTTP threads can claim slots without a lock
+            self._seq = itertools.count(last + 1)
+            self._mm = mm
+
+    def record(self, kind, values=(), code=0):
+        if self._mm is None:
+            self._open()
+        seq = next(self._seq)
+        n = len(values)
+        if n > MAX_VALUES:
+            values = values[:MAX_VALUES]
+            n = MAX_VALUES
+        cdeg = [int(v * 100) for v in values]
+        RECORD.pack_into(
+            self._mm, HEADER.size + (seq % self.capacity) * RECORD.size,
+            seq, time.time(), kind, n, code, *cdeg, *_PAD[n:])
+
+    def frame(self, angles):
+        self.record(FRAME, angles)
+
+    def sensor(self, angle):
+        self.record(SENSOR, (angle,))
+
+    def command(self, name):
+        self.record(COMMAND, (), COMMAND_CODES.get(name, 0))
+
+    def flush(self):
+        if self._mm is not None and self._seq is not None:
+            self._mm.flush()
+
+    def close(self):
+        self.flush()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    # ======================
+    # Reading back
+    # ======================
+
+    def records(self):
+        """All records still in the ring, oldest first, as dicts"""
+        if self._mm is None:
+            self._open()
+        out = []
+        for rec in sorted(_iter_raw(self._mm, self.capacity)):
+            seq, t, kind, n, code = rec[:5]
+            out.append({
+                "seq": seq,
+                "timestamp": t,
+                "kind": KIND_NAMES.get(kind, str(kind)),
+                "command": COMMANDS[code] if kind == COMMAND and code < len(COMMANDS) else "",
+                "values": [v / 100 for v in rec[5:5 + n]],
+            })
+        return out
+
+    def dump_csv(self, out_path):
+        records = self.records()
+        with open(out_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seq", "timestamp", "kind", "command"]
+                            + [f"v{i}" for i in range(MAX_VALUES)])
+            for r in records:
+                writer.writerow([r["seq"], repr(r["timestamp"]), r["kind"], r["command"]]
+                                + [_fmt_value(v) for v in r["values"]])
+        return len(records)
+
+
+def _iter_raw(mm, capacity):
+    for i in range(capacity):
+        rec = RECORD.unpack_from(mm, HEADER.size + i * RECORD.size)
+        if rec[0] != 0:
+            yield rec
+
+
+def _fmt_value(v):
+    return str(int(v)) if v == int(v) else str(v)
+
+
+def open_file(path, capacity=None):
+    """Open an existing recording read-only, reading the capacity from its header"""
+    if capacity is None:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError(f"{path} is not a flight recorder file")
+        magic, rec_size, capacity = HEADER.unpack(header)
+        if magic != MAGIC or rec_size != RECORD.size:
+            raise ValueError(f"{path} is not a flight recorder file")
+    return FlightRecorder(path, capacity, readonly=True)
+
+
+def bench(n=100000):
+    path = RECORDER_FILE + ".bench"
+    rec = FlightRecorder(path, capacity=10000)
+    angles = [90, 70.0, 141.0, 60, 39.0, 90]
+    start = time.perf_counter()
+    for _ in range(n):
+        rec.frame(angles)
+    per_frame = (time.perf_counter() - start) / n
+    rec.close()
+    os.remove(path)
+    return per_frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flight recorder tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("dump", help="write a recording out as CSV")
+    p.add_argument("recording", nargs="?", default=RECORDER_FILE)
+    p.add_argument("csv", nargs="?", default="flight.csv")
+    sub.add_parser("bench", help="measure the cost of recording one frame")
+    args = parser.parse_args()
+
+    if args.cmd == "dump":
+        try:
+            rec = open_file(args.recording)
+        except (OSError, ValueError) as e:
+            parser.exit(1, f"can't read {args.recording}: {e}\n")
+        count = rec.dump_csv(args.csv)
+        print(f"wrote {count} records to {args.csv}")
+    else:
+        print(f"{bench() * 1e6:.2f} us per frame")
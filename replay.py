@@ -0,0 +1,119 @@
+import argparse
+import csv
+import time
+
+import recorder
+import transport
+
+# Replays recorded frames to a Pico (or testing/fake_pico.py) through the same
+# TcpTransport the gait loops use.
+#
+#   python replay.py flight.rec --host 127.0.0.1 --speed 2
+#   python replay.py flight.csv --speed max --loops 10
+#
+# speed scales the recorded timing (0.1 to 10), "max" sends back to back.
+
+MIN_SPEED = 0.1
+MAX_SPEED = 10.0
+
+
+def load_frames(path):
+    """
+    Read frames from a recorder file or a CSV made by 'recorder.py dump'.
+    Returns a list of (timestamp, [angles]), oldest first.
+    """
+    if path.endswith(".csv"):
+        frames = []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                if row["kind"] != "frame":
+                    continue
+                values = [row[f"v{i}"] for i in range(recorder.MAX_VALUES)]
+                angles = [_number(v) for v in values if v not in ("", None)]
+                frames.append((float(row["timestamp"]), angles))
+        frames.sort(key=lambda fr: fr[0])
+        return frames
+
+    rec = recorder.open_file(path)
+    try:
+        return [(r["timestamp"], [_number(v) for v in r["values"]])
+                for r in rec.records() if r["kind"] == "frame"]
+    finally:
+        rec.close()
+
+
+def _number(v):
+    v = float(v)
+    return int(v) if v == int(v) else v
+
+
+def replay(frames, link, speed=1.0, loops=1):
+    """
+    Send frames over link. speed=None sends as fast as possible, otherwise
+    the gaps between recorded timestamps are divided by speed.
+    Returns a dict of stats about the run.
+    """
+    if speed is not None and not (MIN_SPEED <= speed <= MAX_SPEED):
+        raise ValueError(f"speed must be between {MIN_SPEED} and {MAX_SPEED}")
+    # a stop latches the Pico, it ignores frames until told to resume
+    link.send_priority(transport.RESUME)
+    if not frames:
+        return {"frames": 0, "seconds": 0.0, "rate_hz": 0.0, "max_late_ms": 0.0, "mean_late_ms": 0.0}
+
+    # encode everything up front so the send loop only does timing and I/O
+    messages = [transport.encode_frame(angles) for _, angles in frames]
+    t_first = frames[0][0]
+    offsets = [t - t_first for t, _ in frames]
+    # keep the gap between the last and first frame when looping
+    period = offsets[-1] + (offsets[-1] / (len(offsets) - 1) if len(offsets) > 1 else 0)
+
+    sent = 0
+    late_total = 0.0
+    late_max = 0.0
+    start = time.perf_counter()
+
+    for loop in range(loops):
+        for offset, message in zip(offsets, messages):
+            if speed is not None:
+                # absolute schedule, so sleep error does not accumulate
+                target = start + (loop * period + offset) / speed
+                delay = target - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                late = time.perf_counter() - target
+                late_total += late
+                late_max = max(late_max, late)
+            link.send(message)
+            sent += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": sent,
+        "seconds": elapsed,
+        "rate_hz": sent / elapsed if elapsed > 0 else 0.0,
+        "max_late_ms": late_max * 1000,
+        "mean_late_ms": late_total / sent * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded frames to a Pico")
+    parser.add_argument("recording", help="flight recorder file or CSV dump")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--speed", default="1", help="0.1 to 10, or 'max'")
+    parser.add_argument("--loops", type=int, default=1)
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    try:
+        frames = load_frames(args.recording)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"can't read {args.recording}: {e}\n")
+    print(f"loaded {len(frames)} frames")
+
+    with transport.TcpTransport(args.host, args.port) as link:
+        stats = replay(frames, link, speed, args.loops)
+
+    print("sent {frames} frames in {seconds:.2f} s ({rate_hz:.0f} Hz), "
+          "late by {mean_late_ms:.2f} ms on average, {max_late_ms:.2f} ms max".format(**stats))
@@ -0,0 +1,294 @@
+import bisect
+import socket
+import struct
+import threading
+import time
+
+import metrics
+
+# Soil samples from the sensor Pico over Wi-Fi, so logging doesn't need the
+# USB tether of testing/pi_sensor.py. A connection to the Pico's port that
+# sends "+stream,boot,seq\n" gets batches of samples in this binary format
+# (testing/pico_stream.py packs them, testing/pico_async.py sends them):
+#
+#   header  "SB", version, count, n, kind, boot, seq, age   <2sBBBBHII, 16 bytes
+#   sample  dt, moisture, temp, flags, kept, spread         <HHhBBB, 9 bytes each
+#
+#   kind      LIVE, or BACKFILL for samples taken before the connection
+#   boot      random per Pico power-up, sequence numbers start over with it
+#   seq       sequence number of the first sample of the batch, the rest follow on
+#   age       ms from the first sample being taken to the batch being sent
+#   n         readings per sample (soil_sampler.py's burst)
+#   dt        ms since the sample before it, 0 for the first
+#   moisture  mean of the kept readings in 1/16 counts, NO_MOISTURE if none
+#   temp      1/100 degC, NO_TEMP if none
+#   flags     soil_sampler.py's Q_* bits, 0 for a clean sample
+#   kept      readings that went into moisture, out of n
+#   spread    robust standard deviation of the readings in 1/4 counts, at most 255
+#
+# Timestamps are the Pico's: the receiver turns age into wall time at the
+# moment the batch arrives, so the link delay (a few ms) is the only error.
+#
+# Store and forward: the Pico keeps its samples (RAM, then flash) until the
+# ground station has them. "+stream,boot,seq" says it has everything of boot
+# below seq, the Pico then backfills the older samples it still has in
+# BACKFILL batches alongside the live ones, so rows reach the log store out
+# of order. "+ack,boot,seq" after every batch lets the Pico know what it no
+# longer has to keep. A plain "+stream" asks for everything of the boot.
+
+MAGIC = b"SB"
+VERSION = 2
+HEADER = struct.Struct("<2sBBBBHII")
+SAMPLE = struct.Struct("<HHhBBB")
+MAX_BATCH = 255
+NO_MOISTURE = 0xFFFF
+NO_TEMP = -0x8000
+LIVE = 0
+BACKFILL = 1
+
+# give up on a half-received batch after this many bytes without a header
+MAX_BUFFER = HEADER.size + MAX_BATCH * SAMPLE.size
+
+
+class Sample:
+    __slots__ = ("boot", "seq", "timestamp", "moisture", "temp_c", "flags", "kept", "n", "spread",
+                 "backfill")
+
+    def __init__(self, boot, seq, timestamp, moisture, temp_c, flags, kept, n, spread,
+                 backfill=False):
+        self.boot = boot
+        self.seq = seq
+        self.timestamp = timestamp
+        self.moisture = moisture
+        self.temp_c = temp_c
+        self.flags = flags
+        self.kept = kept
+        self.n = n
+        self.spread = spread
+        self.backfill = backfill
+
+    def __repr__(self):
+        return "Sample(%d, %.3f, %r, %r, flags=%d)" % (
+            self.seq, self.timestamp, self.moisture, self.temp_c, self.flags)
+
+
+def encode_batch(seq, samples, n, now_ms, boot=0, kind=LIVE):
+    """
+    The CPython side of the format, for check scripts and fakes.
+    samples are (ticks_ms, moisture, temp_c, flags, kept, spread) tuples.
+    """
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(samples), n, kind, boot, seq,
+                                now_ms - samples[0][0] if samples else 0))
+    prev = samples[0][0] if samples else 0
+    for ticks, moisture, temp_c, flags, kept, spread in samples:
+        out += SAMPLE.pack(
+            min(ticks - prev, 0xFFFF),
+            NO_MOISTURE if moisture is None else int(round(moisture * 16)),
+            NO_TEMP if temp_c is None else int(round(temp_c * 100)),
+            flags, kept, min(int(spread * 4), 255))
+        prev = ticks
+    return bytes(out)
+
+
+class Decoder:
+    """
+    Bytes off the socket in, Samples out. Anything that isn't a batch (text
+    lines the firmware sends every client, e.g. a "?" reply) is skipped by
+    looking for the next header.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.batches = 0
+        self.skipped = 0
+
+    def feed(self, data, now=None):
+        """Returns the samples of every batch completed by data"""
+        now = time.time() if now is None else now
+        buf = self.buffer + data
+        out = []
+        pos = 0
+        while True:
+            start = buf.find(MAGIC, pos)
+            if start < 0:
+                # keep a trailing "S", it may be the start of the next magic
+                keep = len(buf) - 1 if buf.endswith(MAGIC[:1]) else len(buf)
+                keep = max(keep, pos)
+                self.skipped += keep - pos
+                pos = keep
+                break
+            self.skipped += start - pos
+            pos = start
+            if len(buf) - pos < HEADER.size:
+                break
+            _, version, count, n, kind, boot, seq, age = HEADER.unpack_from(buf, pos)
+            if version != VERSION:
+                self.skipped += 1
+                pos += 1
+                continue
+            end = pos + HEADER.size + count * SAMPLE.size
+            if len(buf) < end:
+                break
+            t = now - age / 1000
+            off = pos + HEADER.size
+            for i in range(count):
+                dt, moisture, temp, flags, kept, spread = SAMPLE.unpack_from(buf, off)
+                t += dt / 1000
+                out.append(Sample(
+                    boot, (seq + i) & 0xFFFFFFFF, t,
+                    None if moisture == NO_MOISTURE else moisture / 16,
+                    None if temp == NO_TEMP else temp / 100,
+                    flags, kept, n, spread / 4, kind == BACKFILL))
+                off += SAMPLE.size
+            self.batches += 1
+            pos = end
+        self.buffer = buf[pos:]
+        if len(self.buffer) > MAX_BUFFER:
+            self.skipped += len(self.buffer)
+            self.buffer = b""
+        return out
+
+
+class SeqRanges:
+    """The sequence numbers received so far, as sorted [start, end) ranges"""
+
+    def __init__(self, seqs=()):
+        self.starts = []
+        self.ends = []
+        for seq in sorted(seqs):
+            self.add(seq)
+
+    def __contains__(self, seq):
+        i = bisect.bisect_right(self.starts, seq) - 1
+        return i >= 0 and seq < self.ends[i]
+
+    def add(self, seq):
+        """False if seq was already there"""
+        starts, ends = self.starts, self.ends
+        i = bisect.bisect_right(starts, seq) - 1
+        if i >= 0 and seq < ends[i]:
+            return False
+        if i >= 0 and ends[i] == seq:
+            ends[i] += 1
+        else:
+            i += 1
+            starts.insert(i, seq)
+            ends.insert(i, seq + 1)
+        if i + 1 < len(starts) and starts[i + 1] == ends[i]:
+            ends[i] = ends.pop(i + 1)
+            starts.pop(i + 1)
+        return True
+
+    def frontier(self):
+        """Where the first gap starts, everything below it has arrived"""
+        return self.ends[0] if self.ends else 0
+
+    def gaps(self):
+        return list(zip(self.ends, self.starts[1:]))
+
+
+class Receiver:
+    """
+    Keeps a streaming connection to the sensor Pico and hands every new
+    sample to store.append(samples), backfilled ones included. address()
+    returns (host, port) of the Pico, None while there is none to connect
+    to; it is asked again after every lost connection, so a Pico that moved
+    is found through discovery. Where the log left off comes from
+    store.received(), so a restarted ground station backfills too.
+    """
+
+    def __init__(self, address, store, retry_interval=1.0, timeout=10.0):
+        self.address = address
+        self.store = store
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.running = False
+        self.connected = False
+        self.samples = 0
+        self.backfilled = 0
+        self.duplicates = 0
+        # boot of the Pico the samples are from, None before the first one
+        self.boot, seqs = store.received()
+        self.received = SeqRanges(seqs)
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while self.running:
+            addr = self.address()
+            if addr is None:
+                time.sleep(self.retry_interval)
+                continue
+            try:
+                self._receive(addr)
+            except OSError as e:
+                if self.running:
+                    print("sensor stream lost:", e)
+                    metrics.sensor_stream_errors.inc()
+            finally:
+                self.connected = False
+            if self.running:
+                time.sleep(self.retry_interval)
+
+    def _receive(self, addr):
+        # the Pico sends a batch at least every few seconds (BATCH_MS), a
+        # longer silence means the Wi-Fi link is gone without a FIN
+        sock = socket.create_connection(addr, timeout=self.timeout)
+        self._sock = sock
+        try:
+            if self.boot is None:
+                sock.sendall(b"+stream\n")
+            else:
+                sock.sendall(b"+stream,%d,%d\n" % (self.boot, self.received.frontier()))
+            self.connected = True
+            decoder = Decoder()
+            while self.running:
+                data = sock.recv(4096)
+                if not data:
+                    raise OSError("connection closed by the Pico")
+                metrics.sensor_stream_bytes.inc(len(data))
+                batches = decoder.batches
+                samples = self._new(decoder.feed(data))
+                if samples:
+                    self.store.append(samples)
+                    self.samples += len(samples)
+                    metrics.sensor_samples.inc(len(samples))
+                if decoder.batches != batches:
+                    sock.sendall(b"+ack,%d,%d\n" % (self.boot, self.received.frontier()))
+        finally:
+            self._sock = None
+            sock.close()
+
+    def _new(self, samples):
+        # drops what the log already has, a backfill can overlap it
+        out = []
+        for s in samples:
+            if s.boot != self.boot:
+                # the Pico rebooted, its sequence numbers start over
+                self.boot = s.boot
+                self.received = SeqRanges()
+            if not self.received.add(s.seq):
+                self.duplicates += 1
+                continue
+            if s.backfill:
+                self.backfilled += 1
+                metrics.sensor_backfilled.inc()
+            out.append(s)
+        return out
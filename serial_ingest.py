@@ -0,0 +1,380 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+import serial
+
+import metrics
+from sensor_stream import Sample
+
+# Soil samples from sensor Picos on USB serial, the tethered path that
+# testing/pi_sensor.py used to read a line at a time. Any number of ports
+# are read on one asyncio event loop, each at a kHz of lines and more. The
+# Pico prints one line per sample:
+#
+#   moisture,temp            e.g. "612,23.4"
+#   ticks_ms,moisture,temp   the same with the Pico's time.ticks_ms() first
+#
+# A line with ticks is timestamped on the Pico's clock, anchored to wall
+# time by the line that arrived with the least delay so far. A line without
+# gets the time of the read it came in with, so does every other line of
+# that read.
+#
+# A port is read whenever it has data, but at most every BATCH_S: whatever
+# the driver holds (up to CHUNK bytes) goes straight into the port's
+# buffer, the complete lines in it are parsed with one regex scan and handed
+# on as one batch. A line that doesn't parse is counted and skipped (the
+# first few of every port are printed), so is one longer than the buffer.
+#
+# Every batch goes to the subscribers' queues as it arrives, and to the log
+# store (log_store.py) every FLUSH_S, written on a worker thread so the disk
+# never holds up the ports. A subscriber that falls behind loses its oldest
+# batches, the log doesn't. Samples of a port are numbered by seq under a
+# random boot per opening of the port, as sensor_stream.py's are per Pico
+# power-up.
+
+BAUD = 115200
+CHUNK = 65536
+BATCH_S = 0.01
+FLUSH_S = 0.5
+SUBSCRIBER_BATCHES = 100
+MALFORMED_PRINTED = 5
+# Pico crystal against the Pi's clock, how fast the ticks anchor may creep up
+DRIFT = 100e-6
+
+LINE = re.compile(rb"^[ \t]*(?:(\d+),)?(-?\d+(?:\.\d*)?),(-?\d+(?:\.\d*)?)[ \t\r]*$", re.M)
+NEWLINE = re.compile(rb"\n")
+
+
+def parse_lines(chunk):
+    """
+    Complete lines (without the last newline) -> [(ticks_ms or None,
+    moisture, temp_c)] and the lines that didn't parse. Blank lines are
+    neither. chunk is bytes or a memoryview (LineBuffer.lines()), which is
+    only copied if a line in it isn't a sample.
+    """
+    rows = [(int(t) if t else None, float(m), float(c)) for t, m, c in LINE.findall(chunk)]
+    # a memoryview has no count(), the regex counts without a copy
+    if len(rows) == len(NEWLINE.findall(chunk)) + 1:
+        return rows, []
+    # something in there isn't a sample, find out what line by line
+    rows, bad = [], []
+    for line in bytes(chunk).split(b"\n"):
+        if not line.strip():
+            continue
+        match = LINE.match(line)
+        if match is None:
+            bad.append(line)
+        else:
+            t, m, c = match.groups()
+            rows.append((int(t) if t else None, float(m), float(c)))
+    return rows, bad
+
+
+async def _readable(loop, fd):
+    """
+    Waits for data on fd. The reader is there for one wakeup only, left in
+    place it would spin the loop through the sleeps between reads.
+    """
+    ready = loop.create_future()
+
+    def wake():
+        loop.remove_reader(fd)
+        if not ready.done():
+            ready.set_result(None)
+
+    loop.add_reader(fd, wake)
+    try:
+        await ready
+    finally:
+        loop.remove_reader(fd)
+
+
+class LineBuffer:
+    """
+    A port's bytes, read into one fixed buffer. fill() reads into the free
+    end of it, lines() hands out every complete line in one piece as a view
+    of the buffer. The partial line after them is moved to the front on the
+    next fill() or lines(), until then the view stays as it was.
+    """
+
+    def __init__(self, size=CHUNK):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.end = 0
+        self.overlong = 0
+        self._skipping = False
+        # bytes at the front already handed out by lines()
+        self._taken = 0
+
+    def _compact(self):
+        if self._taken:
+            rest = self.end - self._taken
+            # a memoryview to memoryview move, no copy in between
+            self.view[:rest] = self.view[self._taken:self.end]
+            self.end = rest
+            self._taken = 0
+
+    def fill(self, fd):
+        """Bytes read from fd, 0 at the end of the file"""
+        self._compact()
+        n = os.readv(fd, [self.view[self.end:]])
+        self.end += n
+        return n
+
+    def lines(self):
+        """
+        The complete lines as one memoryview of the buffer, None if there
+        are none yet. Good until the next fill() or lines().
+        """
+        self._compact()
+        start = 0
+        if self._skipping:
+            start = self.buf.find(b"\n", 0, self.end) + 1
+            if start == 0:
+                self.end = 0
+                return None
+            self._skipping = False
+        last = self.buf.rfind(b"\n", start, self.end)
+        if last < 0:
+            rest = self.end - start
+            if rest == len(self.buf):
+                # no newline in the whole buffer, drop the line up to its end
+                self.overlong += 1
+                self._skipping = True
+                self.end = 0
+                return None
+            self.view[:rest] = self.view[start:self.end]
+            self.end = rest
+            return None
+        if last + 1 == self.end:
+            # nothing after the lines, the next read starts at the front
+            self.end = 0
+        else:
+            self._taken = last + 1
+        return self.view[start:last]
+
+
+class Port:
+    """One serial port and what came in on it"""
+
+    def __init__(self, path, baud=BAUD):
+        self.path = path
+        self.baud = baud
+        self.connected = False
+        self.boot = None
+        self.seq = 0
+        self.lines = 0
+        self.malformed = 0
+        self.bytes = 0
+        self.reads = 0
+        self.last_malformed = None
+        self.error = None
+        self.buffer = LineBuffer()
+        # wall time minus Pico time, and the Pico ticks and wall time it was last updated at
+        self._offset = None
+        self._ticks = 0
+        self._anchored = 0.0
+
+    def opened(self):
+        self.connected = True
+        self.boot = random.getrandbits(16)
+        self.seq = 0
+        self.buffer = LineBuffer(len(self.buffer.buf))
+        self._offset = None
+
+    def samples(self, rows, now):
+        """Parsed rows -> Samples, numbered on from the last"""
+        newest = None
+        for row in reversed(rows):
+            if row[0] is not None:
+                newest = row[0]
+                break
+        if newest is not None:
+            self._anchor(newest, now)
+        out = []
+        seq = self.seq
+        for ticks, moisture, temp_c in rows:
+            t = now if ticks is None else self._offset + ticks / 1000
+            out.append(Sample(self.boot, seq, t, moisture, temp_c, 0, 1, 1, 0.0))
+            seq = (seq + 1) & 0xFFFFFFFF
+        self.seq = seq
+        return out
+
+    def _anchor(self, newest, now):
+        estimate = now - newest / 1000
+        if self._offset is None or newest < self._ticks:
+            # the first line, or the Pico rebooted (or its ticks wrapped)
+            self._offset = estimate
+        else:
+            self._offset = min(self._offset + DRIFT * (now - self._anchored), estimate)
+        self._ticks = newest
+        self._anchored = now
+
+
+class SerialIngest:
+    """
+    Reads the ports, publishes their samples and appends them to store
+    (a log_store.LogStore, or None for no log). run() is the coroutine,
+    start() runs it on a thread of its own, like sensor_stream.Receiver.
+    """
+
+    def __init__(self, ports, store=None, baud=BAUD, batch_s=BATCH_S, flush_s=FLUSH_S,
+                 retry_interval=1.0):
+        self.ports = [Port(p, baud) for p in ports]
+        self.store = store
+        self.batch_s = batch_s
+        self.flush_s = flush_s
+        self.retry_interval = retry_interval
+        self.subscribers = []
+        self.dropped = 0
+        self.running = False
+        self._pending = []
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    def subscribe(self, maxsize=SUBSCRIBER_BATCHES):
+        """A queue that gets (port path, [Samples]) for every batch, call from the loop"""
+        queue = asyncio.Queue(maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.remove(queue)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.running = True
+        tasks = [asyncio.create_task(self._read(port)) for port in self.ports]
+        flush = asyncio.create_task(self._flush())
+        try:
+            await self._stopped.wait()
+        finally:
+            self.running = False
+            for task in tasks + [flush]:
+                task.cancel()
+            await asyncio.gather(*tasks, flush, return_exceptions=True)
+            await self._write()
+
+    def start(self):
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """From any thread, the log gets what's left before run() returns"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    # ======================
+    # Ports
+    # ======================
+
+    async def _read(self, port):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                ser = serial.Serial(port.path, port.baud, timeout=0)
+            except (OSError, serial.SerialException) as e:
+                # once, not every retry while it's unplugged
+                if port.error != str(e):
+                    print(f"serial ingest: can't open {port.path}:", e)
+                    port.error = str(e)
+                metrics.sensor_serial_errors.inc()
+                await asyncio.sleep(self.retry_interval)
+                continue
+            fd = ser.fileno()
+            port.opened()
+            port.error = None
+            try:
+                while True:
+                    await _readable(loop, fd)
+                    try:
+                        n = port.buffer.fill(fd)
+                    except BlockingIOError:
+                        continue
+                    if not n:
+                        raise OSError("the port hung up, unplugged?")
+                    self._handle(port, n, time.time())
+                    # let the lines pile up, a read per batch rather than per line
+                    await asyncio.sleep(self.batch_s)
+            except OSError as e:
+                print(f"serial ingest: lost {port.path}:", e)
+                metrics.sensor_serial_errors.inc()
+            finally:
+                port.connected = False
+                ser.close()
+            await asyncio.sleep(self.retry_interval)
+
+    def _handle(self, port, n, now):
+        port.reads += 1
+        port.bytes += n
+        metrics.sensor_serial_bytes.inc(n)
+        overlong = port.buffer.overlong
+        chunk = port.buffer.lines()
+        if port.buffer.overlong != overlong:
+            self._malformed(port, [b"<line longer than %d bytes>" % len(port.buffer.buf)])
+        if chunk is None:
+            return
+        rows, bad = parse_lines(chunk)
+        if bad:
+            self._malformed(port, bad)
+        if not rows:
+            return
+        samples = port.samples(rows, now)
+        port.lines += len(samples)
+        metrics.sensor_serial_lines.inc(len(samples))
+        if self.store is not None:
+            self._pending += samples
+        self._publish(port.path, samples)
+
+    def _malformed(self, port, lines):
+        for line in lines:
+            if port.malformed < MALFORMED_PRINTED:
+                print(f"serial ingest: malformed line on {port.path}:", bytes(line[:80]))
+            port.malformed += 1
+        port.last_malformed = lines[-1]
+        metrics.sensor_serial_malformed.inc(len(lines))
+
+    def _publish(self, path, samples):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+                metrics.sensor_serial_dropped.inc()
+            queue.put_nowait((path, samples))
+
+    # ======================
+    # Log store
+    # ======================
+
+    async def _flush(self):
+        while True:
+            await asyncio.sleep(self.flush_s)
+            await self._write()
+
+    async def _write(self):
+        if not self._pending:
+            return
+        samples, self._pending = self._pending, []
+        await asyncio.get_running_loop().run_in_executor(None, self.store.append, samples)
+
+    # ======================
+    # Report
+    # ======================
+
+    def report(self):
+        lines = ["port             lines  malformed  reads      bytes"]
+        for p in self.ports:
+            lines.append("%-14s %7d %10d %6d %10d%s" % (
+                p.path, p.lines, p.malformed, p.reads, p.bytes, "" if p.connected else "  (closed)"))
+        if self.dropped:
+            lines.append("%d batches dropped by slow subscribers" % self.dropped)
+        return "\n".join(lines)
@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gait_params
+import gaits
+import kinematics
+import motion
+
+# Serpentine parameter sweep on the kinematics.locomote friction model.
+#
+#   python sweep.py --alpha 20:90:8 --omega 1:4:4 --K_n 0.25:1.25:5 --top 5 --save
+#
+# Every (alpha, omega, K_n, gamma) point is simulated for a few gait cycles at
+# the ground station's send rate and scored on distance per cycle, lateral
+# drift and peak joint speed. Results are cached in sweep_cache.json, so
+# re-running with a bigger grid only simulates the new points. --save writes
+# the best points into gait_presets.json as sweep-1, sweep-2, ... which the
+# ground station can load with POST /presets/<name>/load.
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sweep_cache.json")
+
+# bump when the model or the metrics change so old cache entries are ignored
+MODEL_VERSION = 2
+
+# model settings that are not swept
+WAVING = [j for j, h in enumerate(motion.horizontal) if not h]
+N_JOINTS = len(WAVING)   # waving joints of the real snake, motion.py's n
+SEND_RATE = 20.0      # Hz, socket_sender_loop sleeps 0.05 s per frame
+CYCLES = 3            # gait cycles simulated per point, the first one is discarded
+MAX_JOINT_SPEED = 400.0  # deg/s, roughly what a hobby servo does under load
+
+
+def servo_angles(point, theta):
+    """
+    Servo angles (T, servos) of the serpentine gait at the phases theta,
+    the way motion.serpentine_angles computes them with point's parameters
+    (same gait spec, rounding, calibration and servo limits).
+    """
+    params = dict(to_preset(point), calibration=motion.calibration)
+    gait = gaits.compile_gait(gaits.serpentine(motion.horizontal), params)
+    return gait.evaluate(theta)
+
+
+def evaluate(point, link_length=kinematics.LINK_LENGTH, friction_ratio=kinematics.FRICTION_RATIO):
+    """
+    Simulate one parameter point (dict with alpha, omega, K_n, gamma, alpha
+    and gamma in degrees like motion.py) and return its metrics.
+    """
+    omega = point["omega"]
+    if omega <= 0:
+        return {"distance_per_cycle": 0.0, "drift_per_cycle": 0.0, "turn_per_cycle": 0.0,
+                "peak_joint_speed": 0.0}
+
+    period = 2 * math.pi / omega
+    dt = 1.0 / SEND_RATE
+    t = np.arange(0, CYCLES * period, dt)
+
+    servo = servo_angles(point, omega * t)
+    q = kinematics.servo_to_joint(servo, motion.calibration)[:, WAVING]
+    deg = np.degrees(q)
+
+    com, heading = kinematics.locomote(q, dt, link_length, friction_ratio)
+
+    # measure over the last CYCLES - 1 cycles so the start-up transient is ignored
+    first = int(round(period / dt))
+    if first >= len(t) - 1:
+        first = 0
+    cycles = (t[-1] - t[first]) / period
+    step = com[-1] - com[first]
+
+    # forward is the mean orientation of the body over the first cycle
+    points = kinematics.planar_chain(q[:first + 1])
+    axis = (points[:, -1] - points[:, 0]).mean(axis=0)
+    axis = axis / (np.linalg.norm(axis) or 1.0)
+    forward = float(step @ axis)
+    lateral = float(step[0] * -axis[1] + step[1] * axis[0])
+
+    return {
+        # plain floats, the same as what comes back out of the cache
+        "distance_per_cycle": float(forward / cycles),
+        "drift_per_cycle": float(abs(lateral) / cycles),
+        "turn_per_cycle": float(math.degrees(heading[-1] - heading[first]) / cycles),
+        "peak_joint_speed": float(np.abs(np.diff(deg, axis=0)).max() / dt) if len(t) > 1 else 0.0,
+    }
+
+
+def score(metrics, drift_weight=1.0, max_joint_speed=MAX_JOINT_SPEED):
+    """Higher is better, points the servos can't follow are ruled out"""
+    if metrics["peak_joint_speed"] > max_joint_speed:
+        return -math.inf
+    return metrics["distance_per_cycle"] - drift_weight * metrics["drift_per_cycle"]
+
+
+# ======================
+# Cache
+# ======================
+
+def cache_key(point):
+    key = json.dumps({
+        "model": MODEL_VERSION,
+        "rate": SEND_RATE,
+        "joints": N_JOINTS,
+        "cycles": CYCLES,
+        "link": kinematics.LINK_LENGTH,
+        "friction": kinematics.FRICTION_RATIO,
+        "point": {k: round(v, 9) for k, v in sorted(point.items())},
+    }, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def load_cache(path=CACHE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+# ======================
+# Sweep
+# ======================
+
+def parse_range(text):
+    """'1:4:4' -> [1, 2, 3, 4] (start:stop:count), '1,2.5' -> [1, 2.5]"""
+    if ":" in text:
+        start, stop, count = text.split(":")
+        return [float(x) for x in np.linspace(float(start), float(stop), int(count))]
+    return [float(x) for x in text.split(",")]
+
+
+def grid(alpha, omega, K_n, gamma):
+    for name, values in (("alpha", alpha), ("omega", omega), ("K_n", K_n), ("gamma", gamma)):
+        lo, hi = gait_params.LIMITS[name]
+        bad = [v for v in values if not lo <= v <= hi]
+        if bad:
+            raise ValueError(f"{name} values {bad} are outside {lo}..{hi}")
+    return [{"alpha": a, "omega": o, "K_n": k, "gamma": g}
+            for a, o, k, g in itertools.product(alpha, omega, K_n, gamma)]
+
+
+def run(points, workers=None, cache=None):
+    """Evaluate points in a process pool, skipping the ones already cached"""
+    if cache is None:
+        cache = {}
+    keys = [cache_key(p) for p in points]
+    todo = [(k, p) for k, p in zip(keys, points) if k not in cache]
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(todo) // (4 * (workers or os.cpu_count() or 1)))
+            for (k, _), result in zip(todo, pool.map(evaluate, [p for _, p in todo], chunksize=chunk)):
+                cache[k] = result
+
+    return [dict(point=p, **cache[k]) for k, p in zip(keys, points)], len(todo)
+
+
+def refine(best, workers, cache, rounds=4, drift_weight=1.0, max_joint_speed=MAX_JOINT_SPEED):
+    """
+    Pattern search around the best grid point: try +/- one step on every
+    parameter, move to the best neighbour, halve the steps when stuck.
+    """
+    steps = {"alpha": 8.0, "omega": 0.5, "K_n": 0.125, "gamma": 2.0}
+    current = best
+    simulated = 0
+    for _ in range(rounds * 3):
+        neighbours = []
+        for name, step in steps.items():
+            lo, hi = gait_params.LIMITS[name]
+            for sign in (-1, 1):
+                value = current["point"][name] + sign * step
+                if lo <= value <= hi:
+                    neighbours.append(dict(current["point"], **{name: value}))
+        results, n = run(neighbours, workers, cache)
+        simulated += n
+        top = max(results, key=lambda r: score(r, drift_weight, max_joint_speed))
+        if score(top, drift_weight, max_joint_speed) > score(current, drift_weight, max_joint_speed):
+            current = top
+        else:
+            steps = {k: v / 2 for k, v in steps.items()}
+    return current, simulated
+
+
+def to_preset(point):
+    """
+    Sweep point -> parameters in the gait_params preset format. beta only
+    shifts whole joints of a sine, so it is wrapped into beta's limits
+    without changing the gait (K_n above n would be past 2 pi).
+    """
+    n = N_JOINTS
+    return {
+        "alpha": point["alpha"],
+        "omega": point["omega"],
+        "K_n": point["K_n"],
+        "n": n,
+        "beta": math.fmod((2 * point["K_n"] * math.pi) / n, 2 * math.pi),
+        "gamma": point["gamma"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serpentine gait parameter sweep")
+    parser.add_argument("--alpha", default="20:80:7", help="degrees, start:stop:count or a,b,c")
+    parser.add_argument("--omega", default="1:4:4", help="rad/s")
+    parser.add_argument("--K_n", default="0.25:1.25:5")
+    parser.add_argument("--gamma", default="0", help="heading offset in degrees")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--drift-weight", type=float, default=1.0)
+    parser.add_argument("--max-joint-speed", type=float, default=MAX_JOINT_SPEED)
+    parser.add_argument("--refine", action="store_true", help="pattern search around the best point")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help="write the top points to gait_presets.json")
+    args = parser.parse_args()
+
+    points = grid(parse_range(args.alpha), parse_range(args.omega),
+                  parse_range(args.K_n), parse_range(args.gamma))
+    cache = load_cache()
+    results, simulated = run(points, args.workers, cache)
+    print(f"{len(points)} points, {simulated} simulated, {len(points) - simulated} from cache")
+
+    def rank(r):
+        return score(r, args.drift_weight, args.max_joint_speed)
+
+    results.sort(key=rank, reverse=True)
+    if args.refine and results:
+        best, n = refine(results[0], args.workers, cache,
+                         drift_weight=args.drift_weight, max_joint_speed=args.max_joint_speed)
+        print(f"refined best point with {n} more simulations")
+        results = [best] + [r for r in results if r["point"] != best["point"]]
+    save_cache(cache)
+
+    top = [r for r in results if rank(r) > -math.inf][:args.top]
+    print(f"{'alpha':>6} {'omega':>6} {'K_n':>6} {'gamma':>6} {'m/cycle':>8} {'drift':>7} {'deg/s':>6}")
+    for r in top:
+        p = r["point"]
+        print(f"{p['alpha']:6.1f} {p['omega']:6.2f} {p['K_n']:6.3f} {p['gamma']:6.1f} "
+              f"{r['distance_per_cycle']:8.4f} {r['drift_per_cycle']:7.4f} {r['peak_joint_speed']:6.0f}")
+
+    if args.save and top:
+        # validated like POST /presets/<name>, so the ground station can load them
+        for i, r in enumerate(top, 1):
+            motion.params.save_preset(f"sweep-{i}", to_preset(r["point"]))
+        print(f"saved sweep-1..sweep-{len(top)} to {motion.params.preset_file}")
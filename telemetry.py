@@ -0,0 +1,82 @@
+import time
+
+import metrics
+
+# Back-channel from the motor Pico. pico_wifi_motor.py sends one report line
+# per second on the frame socket:
+#
+#   T,seq,frames,skipped,lat_avg,lat_max,loop_avg,loop_max,age,mem_free,parse_errors
+#
+#   seq           sequence number of the last frame applied to the servos
+#   frames        frames applied since the client connected
+#   skipped       frames that arrived but were replaced by a newer one in the same read
+#   lat_avg/max   receive-to-apply time of the frames since the last report, us
+#   loop_avg/max  time spent handling one read since the last report, us
+#   age           time between applying frame seq and sending this report, us
+#   mem_free      gc.mem_free()
+#   parse_errors  lines the firmware could not parse since the client connected
+
+REPORT_FIELDS = ("seq", "frames", "skipped", "lat_avg", "lat_max", "loop_avg", "loop_max",
+                 "age", "mem_free", "parse_errors")
+
+# how many sent frames to remember for matching reports against
+SENT_WINDOW = 256
+
+
+def encode_report(values):
+    return ("T," + ",".join(str(int(values[k])) for k in REPORT_FIELDS) + "\r\n").encode()
+
+
+def parse_report(line):
+    """b"T,..." -> dict, None if the line is not a well formed report"""
+    parts = line.strip().split(b",")
+    if parts[0] != b"T" or len(parts) != len(REPORT_FIELDS) + 1:
+        return None
+    try:
+        return dict(zip(REPORT_FIELDS, (int(p) for p in parts[1:])))
+    except ValueError:
+        return None
+
+
+class Telemetry:
+    """
+    Matches reports from the Pico with the frames the transport sent and
+    publishes both into metrics. sent() is called from the sending thread,
+    handle_line() from the transport's reader thread.
+    """
+
+    def __init__(self):
+        # (seq, perf_counter send time) ring, seq % SENT_WINDOW picks the slot
+        self._sent = [(None, 0.0)] * SENT_WINDOW
+        self.latest = None
+
+    def sent(self, seq, now=None):
+        self._sent[seq % SENT_WINDOW] = (seq, time.perf_counter() if now is None else now)
+
+    def handle_line(self, line, now=None):
+        if now is None:
+            now = time.perf_counter()
+        report = parse_report(line)
+        if report is None:
+            metrics.pico_bad_reports.inc()
+            return None
+        self.latest = report
+        metrics.pico_reports.inc()
+
+        seq = report["seq"]
+        metrics.pico_last_seq.set(seq)
+        metrics.pico_frames_applied.set(report["frames"])
+        metrics.pico_frames_skipped.set(report["skipped"])
+        metrics.pico_apply_latency.set(report["lat_avg"] / 1e6)
+        metrics.pico_apply_latency_max.set(report["lat_max"] / 1e6)
+        metrics.pico_loop_time.set(report["loop_avg"] / 1e6)
+        metrics.pico_loop_time_max.set(report["loop_max"] / 1e6)
+        metrics.pico_mem_free.set(report["mem_free"])
+        metrics.pico_parse_errors.set(report["parse_errors"])
+
+        sent_seq, sent_at = self._sent[seq % SENT_WINDOW]
+        if sent_seq == seq:
+            # send -> applied -> report back, without the time the Pico sat
+            # on the report after applying the frame
+            metrics.control_rtt.observe(max(0.0, now - sent_at - report["age"] / 1e6))
+        return report
@@ -0,0 +1,148 @@
+# async_firmware_check.py (CPython)
+# Runs the uasyncio firmware (pico_async.py) on this machine through
+# upy_shim.py and checks that it serves several clients at once: frames from
+# the ground station transport, a sensor subscriber and a stop from a third
+# connection. Reports how long frames take from send() to the PWM write,
+# with and without the soil sensor being sampled in between, and how
+# regular the sensor samples are.
+#
+#   python testing/async_firmware_check.py
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import pico_async
+import transport
+from stemma_soil_sensor import StemmaSoilSensor
+
+RATE = 20        # Hz, frames from the ground station (gait_loop)
+SECONDS = 3.0
+# faster than on the robot to put the sensor in the way more often, and not a
+# multiple of the frame period so the two do not stay in step
+SAMPLE_MS = 97
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_firmware(sensor):
+    fw = pico_async.Firmware([0, 1, 2, 3, 4, 5], sensor)
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(fw.run(port),), daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    return fw, port
+
+
+def collect_lines(sock, out):
+    buffer = b""
+    while True:
+        try:
+            data = sock.recv(4096)
+        except OSError:
+            return
+        if not data:
+            return
+        buffer += data
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            out.append((time.perf_counter(), line.strip()))
+
+
+def stream(port):
+    """Frames at RATE, joint 0 different every frame. Returns [(send time, duty)]"""
+    link = transport.TcpTransport("127.0.0.1", port).connect()
+    sent = []
+    start = time.perf_counter()
+    for i in range(int(SECONDS * RATE)):
+        angle = 20 + i % 140
+        t = time.perf_counter()
+        link.send_frame([angle, 90, 90, 90, 90, 90])
+        sent.append((t, pico_async.angle_to_duty(angle)))
+        time.sleep(max(0.0, start + (i + 1) / RATE - time.perf_counter()))
+    time.sleep(0.1)
+    return link, sent
+
+
+def latencies(sent, since):
+    writes = [(t, duty) for t, pin, duty in upy_shim.PWM.writes[since:] if pin == 0]
+    out = []
+    k = 0
+    for t, duty in sent:
+        # a frame replaced before the servo task got to it has no write
+        j = k
+        while j < len(writes) and (writes[j][0] < t or writes[j][1] != duty):
+            j += 1
+        if j < len(writes):
+            out.append(writes[j][0] - t)
+            k = j
+    return np.array(out) * 1000
+
+
+def run(with_sensor):
+    pico_async.SAMPLE_MS = SAMPLE_MS
+    sensor = StemmaSoilSensor(upy_shim.FakeI2C(), reset=False) if with_sensor else None
+    fw, port = start_firmware(sensor)
+
+    samples = []
+    sub = socket.create_connection(("127.0.0.1", port))
+    sub.sendall(b"+sensor\n")
+    threading.Thread(target=collect_lines, args=(sub, samples), daemon=True).start()
+
+    since = len(upy_shim.PWM.writes)
+    link, sent = stream(port)
+    ms = latencies(sent, since)
+    assert len(ms) >= 0.95 * len(sent), f"only {len(ms)} of {len(sent)} frames reached the servos"
+    assert link.telemetry.latest is not None, "no telemetry report"
+    assert len(fw.clients) == 2
+
+    # a stop from another connection, frames after it are ignored until !R
+    other = socket.create_connection(("127.0.0.1", port))
+    other.sendall(transport.encode_stop([90] * 6))
+    time.sleep(0.05)
+    before = len(upy_shim.PWM.writes)
+    link.send(transport.encode_frame([10, 10, 10, 10, 10, 10]))
+    time.sleep(0.1)
+    assert fw.stopped and len(upy_shim.PWM.writes) == before, "frame applied while stopped"
+    other.sendall(transport.RESUME)
+    other.close()
+    link.close()
+    sub.close()
+
+    line = (f"sensor {'on ' if with_sensor else 'off'}: {len(ms)} frames, send to PWM "
+            f"p50 {np.percentile(ms, 50):.2f} ms p99 {np.percentile(ms, 99):.2f} ms "
+            f"max {ms.max():.2f} ms, {link.telemetry.latest['frames']} frames in the last report")
+    if with_sensor:
+        times = np.array([t for t, l in samples if l.startswith(b"M,")])
+        assert len(times) >= SECONDS * 1000 / SAMPLE_MS * 0.8, f"only {len(times)} samples"
+        gaps = np.diff(times) * 1000
+        line += (f"\n           {len(times)} samples, interval {gaps.mean():.1f} ms "
+                 f"(+-{gaps.std():.1f}, max {gaps.max():.1f})")
+    print(line)
+
+
+if __name__ == "__main__":
+    run(with_sensor=False)
+    run(with_sensor=True)
+    print("ok")
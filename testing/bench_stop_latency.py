@@ -0,0 +1,118 @@
+# bench_stop_latency.py (CPython)
+# Measures how long an emergency stop takes from the POST /stop request to
+# the stop command being applied on the Pico side, using fake_pico.py in
+# place of the real motor Pico and Flask's test client in place of a browser.
+# Then restarts a gait right after each stop, the way a double click on the
+# dashboard would: only one gait thread may be left driving the motor. And
+# stops on a link the gait thread has just closed, a send error, not a 500.
+#
+#   python testing/bench_stop_latency.py [runs]
+
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import app as ground_station
+import metrics
+import motion
+import transport
+from fake_pico import FakePico
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("timed out")
+        time.sleep(0.0005)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def bench(runs=200):
+    pico = FakePico().start()
+    motion.HOST_motor, motion.PORT = pico.host, pico.port
+    client = ground_station.app.test_client()
+    latencies = []
+    late_frames = 0
+
+    try:
+        for i in range(runs):
+            client.post("/start_serpentine")
+            # let a few frames go out, stopping at a different point in the
+            # 50 ms frame period every run
+            wait_for(lambda: motion.active_transport is not None and not pico.stopped)
+            time.sleep(0.06 + (i % 10) * 0.005)
+
+            stops = len(pico.stops)
+            t0 = time.perf_counter()
+            client.post("/stop")
+            wait_for(lambda: len(pico.stops) > stops)
+            latencies.append(pico.stops[-1][0] - t0)
+
+            # the gait thread may still squeeze out a frame, the Pico must ignore it
+            ignored = pico.ignored
+            wait_for(lambda: motion.active_transport is None)
+            late_frames += pico.ignored - ignored
+    finally:
+        motion.running = False
+        pico.stop()
+
+    return latencies, late_frames
+
+
+def check_restart(restarts=20):
+    pico = FakePico().start()
+    motion.HOST_motor, motion.PORT = pico.host, pico.port
+    client = ground_station.app.test_client()
+    try:
+        for _ in range(restarts):
+            client.post("/start_serpentine")
+            time.sleep(0.02)
+            client.post("/stop")
+            assert client.post("/start_serpentine").status_code == 200
+        time.sleep(0.2)
+        gaits = [t for t in threading.enumerate() if t.name == "serpentine_loop"]
+        assert len(gaits) == 1 and motion.running, gaits
+        assert not pico.stopped
+    finally:
+        motion.emergency_stop()
+        motion.gait_thread.join(1)
+        pico.stop()
+    print(f"restart: {restarts} starts straight after a stop, one gait thread left running")
+
+
+def check_closed_link():
+    pico = FakePico().start()
+    client = ground_station.app.test_client()
+    errors = metrics.send_errors.value
+    try:
+        # picked up by emergency_stop() just before the gait thread closed it
+        motion.active_transport = transport.TcpTransport(pico.host, pico.port).connect()
+        motion.active_transport.close()
+        r = client.post("/stop")
+    finally:
+        motion.active_transport = None
+        pico.stop()
+    assert r.status_code == 200 and metrics.send_errors.value == errors + 1, r.status_code
+    print("closed link: /stop answers 200 and counts a send error")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latencies, late_frames = bench(runs)
+    ms = [x * 1000 for x in latencies]
+    print(f"{runs} stops, HTTP request -> stop applied on the Pico:")
+    print(f"  p50 {percentile(ms, 50):.3f} ms  p90 {percentile(ms, 90):.3f} ms  "
+          f"p99 {percentile(ms, 99):.3f} ms  max {max(ms):.3f} ms")
+    print(f"  {late_frames} frames arrived after a stop and were ignored")
+    check_restart()
+    check_closed_link()
@@ -0,0 +1,70 @@
+"""
+sorted_csv.py
+Incremental reading of the dashboard's CSVs, see SortedCsv.
+"""
+import io
+import os
+import threading
+
+import pandas as pd
+
+
+class SortedCsv:
+    """
+    A CSV that only ever grows, kept as a DataFrame sorted by timestamp.
+    Each read() parses just the rows appended since the last one. Rows
+    usually arrive in time order and are simply added at the end; rows
+    backfilled by the sensor Pico after a Wi-Fi drop (log_store.py) belong
+    further back, and then only the history from the earliest of them on is
+    re-sorted, not all of it.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.offset = 0
+        self.header = b""
+        self.df = pd.DataFrame(columns=columns)
+        self.lock = threading.Lock()
+
+    def read(self):
+        # Dash runs callbacks on several threads
+        with self.lock:
+            return self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return self.df
+        if os.path.getsize(self.path) < self.offset:
+            # replaced by a new file, start over
+            self.offset = 0
+            self.df = pd.DataFrame(columns=self.columns)
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # a row still being written waits for the next read
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return self.df
+        data = data[:end]
+        if self.offset == 0:
+            self.header, _, data = data.partition(b"\n")
+            self.header += b"\n"
+        self.offset += end
+        if not data:
+            return self.df
+        new = pd.read_csv(io.BytesIO(self.header + data))
+        new["timestamp"] = new["timestamp"].astype(float)
+        new = new.sort_values("timestamp", kind="mergesort")
+        df = self.df
+        if df.empty:
+            self.df = new.reset_index(drop=True)
+            return self.df
+        first = new["timestamp"].iloc[0]
+        i = int(df["timestamp"].searchsorted(first, side="right"))
+        if i == len(df):
+            self.df = pd.concat([df, new], ignore_index=True)
+        else:
+            tail = pd.concat([df.iloc[i:], new]).sort_values("timestamp", kind="mergesort")
+            self.df = pd.concat([df.iloc[:i], tail], ignore_index=True)
+        return self.df
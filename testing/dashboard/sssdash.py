@@ -39,35 +39,30 @@ from dash import Dash, dcc, html, Input, Output, State, callback_context
 from dash import dash_table
 import plotly.graph_objects as go
 
+from sorted_csv import SortedCsv
+
 LIVE_CSV = "live.csv"
 IMU_CSV = "imu.csv"
 
 # ---------- Helpers for reading data ----------
 
+LIVE_COLUMNS = ["timestamp", "capacitance", "moisture_pct", "temperature_c"]
+IMU_COLUMNS = [
+    "timestamp", "ax", "ay", "az", "gx", "gy", "gz",
+    "mx", "my", "mz", "imu_temp_c", "pos_x_m", "pos_y_m"
+]
+
+
+live_log = SortedCsv(LIVE_CSV, LIVE_COLUMNS)
+imu_log = SortedCsv(IMU_CSV, IMU_COLUMNS)
+
+
 def read_live():
-    if not os.path.exists(LIVE_CSV):
-        return pd.DataFrame(columns=["timestamp", "capacitance", "moisture_pct", "temperature_c"])
-    df = pd.read_csv(LIVE_CSV)
-    # Ensure correct types & ordering
-    if "timestamp" in df.columns:
-        df["timestamp"] = df["timestamp"].astype(float)
-        df = df.sort_values("timestamp")
-    return df
+    return live_log.read()
 
 
 def read_imu():
-    if not os.path.exists(IMU_CSV):
-        return pd.DataFrame(
-            columns=[
-                "timestamp", "ax", "ay", "az", "gx", "gy", "gz",
-                "mx", "my", "mz", "imu_temp_c", "pos_x_m", "pos_y_m"
-            ]
-        )
-    df = pd.read_csv(IMU_CSV)
-    if "timestamp" in df.columns:
-        df["timestamp"] = df["timestamp"].astype(float)
-        df = df.sort_values("timestamp")
-    return df
+    return imu_log.read()
 
 
 # ---------- Wildfire risk rule (placeholder moisture-based thresholds) ----------
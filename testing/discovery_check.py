@@ -0,0 +1,129 @@
+# discovery_check.py (CPython)
+# Zero-config discovery (discovery.py) on localhost: the fake Pico announces
+# itself, the app finds it without a configured address, and after a
+# simulated reboot (new port, new boot id) the running gait carries on by
+# itself. Reports the time from the "rebooted" Pico announcing itself to
+# the first frame arriving at it, over several reboots.
+#
+#   python testing/discovery_check.py [reboots]
+
+import json
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import discovery
+import metrics
+from fake_pico import FakePico
+
+
+def boot_pico(registry):
+    """Fake motor Pico plus its announcer, like a freshly powered-up board"""
+    pico = FakePico(report_interval=0.05).start()
+    announcer = discovery.Announcer("motor", pico.port, target=("127.0.0.1", registry.port),
+                                    caps=["frames", "delta"], listen_port=0)
+    # probes from the registry have to reach this announcer
+    registry.probe_port = announcer.listen_port
+    return pico, announcer
+
+
+def wait_for_frame(pico, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not pico.frames and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    assert pico.frames, "no frames reached the rebooted Pico"
+    return pico.frames[0][0]
+
+
+def check_protocol():
+    msg = discovery.parse(discovery.encode_announcement("motor", "0.5", 8080, ["frames"], "ab", "cd"))
+    assert msg["role"] == "motor" and msg["port"] == 8080
+    assert discovery.parse(b"not json") is None
+    assert discovery.parse(b'{"sss": 99, "role": "motor"}') is None
+    for bad in ({"port": "x"}, {"port": 70000}, {"port": True}, {"role": ["motor"]}, {"role": ""},
+                {"caps": "frames"}, {"caps": [1]}, {"boot": {"a": 1}}, {"id": None}):
+        data = json.dumps(dict(json.loads(discovery.encode_announcement("motor", "0.5", 8080, [], "ab", "cd")),
+                               **bad)).encode()
+        assert discovery.parse(data) is None, bad
+
+    registry = discovery.Registry(ttl=1.0)
+    registry.handle(msg, "10.0.0.2", now=0.0)
+    first = registry.lookup("motor", now=0.5)
+    registry.handle(msg, "10.0.0.2", now=0.6)
+    assert registry.lookup("motor", now=0.7) is first, "a repeat is not a new device"
+    assert registry.lookup("motor", now=2.0) is None, "stale entry not dropped"
+    registry.handle(dict(msg, boot="ef"), "10.0.0.2", now=2.0)
+    assert registry.lookup("motor", now=2.0).first_seen == 2.0, "reboot not noticed"
+    print("protocol: parse, repeat, expiry and reboot ok")
+
+
+def check_bad_datagrams():
+    # junk on the discovery port doesn't stop the listener
+    registry = discovery.Registry(port=0, bind="127.0.0.1").start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for junk in (b'{"sss":1,"role":"motor","port":"x"}', b'{"sss":1,"role":{},"caps":7}',
+                     b'{"sss":1,"role":"motor","caps":null}', b"\xff\xfe", b"[1, 2]"):
+            sock.sendto(junk, ("127.0.0.1", registry.port))
+        sock.sendto(discovery.encode_announcement("motor", "0.5", 8081, ["frames"], "ab", "cd"),
+                    ("127.0.0.1", registry.port))
+        dev = registry.wait_for("motor", 2.0)
+    finally:
+        sock.close()
+        registry.stop()
+    assert dev is not None and dev.port == 8081, "listener died on a bad datagram"
+    print("bad datagrams: 5 dropped, the next announcement still found")
+
+
+def check_reboots(reboots):
+    import app as ground_station
+    import motion
+
+    registry = discovery.Registry(port=0, bind="127.0.0.1", probe_target="127.0.0.1").start()
+    motion.pico_registry = registry
+    # nothing listens here: only discovery can find the Pico
+    motion.HOST_motor, motion.PORT = "127.0.0.1", 9
+
+    pico, announcer = boot_pico(registry)
+    announcer.start()
+    client = ground_station.app.test_client()
+    client.post("/start_serpentine")
+    wait_for_frame(pico)
+    devices = client.get("/devices").get_json()
+    assert devices and devices[0]["port"] == pico.port, devices
+
+    times = []
+    for _ in range(reboots):
+        announcer.stop()
+        pico.stop()
+        time.sleep(0.2)  # the Pico is away for a bit
+        pico, announcer = boot_pico(registry)
+        t0 = time.perf_counter()
+        announcer.start()
+        times.append(wait_for_frame(pico) - t0)
+
+    client.post("/stop")
+    time.sleep(0.1)
+    announcer.stop()
+    pico.stop()
+    registry.stop()
+    motion.pico_registry = discovery.Registry()
+
+    ms = np.array(times) * 1000
+    print(f"reboots: {reboots}, announcement to first frame p50 {np.percentile(ms, 50):.1f} ms "
+          f"p90 {np.percentile(ms, 90):.1f} ms max {ms.max():.1f} ms, "
+          f"last recovery {metrics.motor_recovery.value:.3f} s")
+
+
+if __name__ == "__main__":
+    check_protocol()
+    check_bad_datagrams()
+    check_reboots(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
+    print("ok")
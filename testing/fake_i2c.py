@@ -0,0 +1,401 @@
+# fake_i2c.py (CPython)
+# An I2C bus with the same methods as machine.I2C on the Pico and a model of
+# the STEMMA soil sensor's seesaw chip behind it, so the drivers in
+# seesaw.py / stemma_soil_sensor.py can run on a PC. upy_shim.py uses it as
+# machine.I2C.
+#
+#   bus = FakeI2C(devices={0x36: Seesaw(moisture=640)})
+#   sensor = StemmaSoilSensor(bus)
+#
+# Devices get write(data) for every write transaction and read(n) for every
+# read, both as bytes. The bus counts transactions and bytes, and works
+# out how long each one takes on the wire (a start, the address byte and
+# the data bytes with their acks, a stop): busy_us in all, stats per
+# address, and with trace on every transaction with its time. With timing
+# on it also sleeps that long with time.sleep_us(), so with
+# upy_shim.virtual_time() it moves the simulated clock on.
+#
+# Seesaw answers at the register level, with the chip's conversion times:
+# read a moisture or temperature register too soon after selecting it and
+# it's all ones, and after a software reset it NAKs for BOOT_MS. It can
+# also misbehave, at random but repeatably (seed): noise on the moisture
+# counts, spikes, reads of all ones (a floating bus, the 65535 rows in
+# soil_data.csv) and NAKs, which the bus raises as OSError like the Pico.
+# Both device models run on upy_shim's clock when it is installed, so they
+# keep time with the drivers, virtual or not.
+#
+# ICM20948 is the IMU of icm20948.py: its register banks, the sample rate
+# divider, the FIFO (filled on clock(), read through FIFO_R_W, overwriting
+# when full) and the AK09916 magnetometer behind the chip's I2C master. What it measures comes from motion(t), replayed at
+# every sample time t, so a check can tell samples apart.
+
+import random
+import struct
+import time
+
+
+class FakeI2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, devices=None, timing=False,
+                 trace=False):
+        self.freq = freq
+        self.devices = {0x36: Seesaw()} if devices is None else devices
+        self.timing = timing
+        self.writes = 0
+        self.reads = 0
+        self.bytes = 0
+        self.busy_us = 0.0
+        # address: [transactions, bytes, us on the bus]
+        self.stats = {}
+        # (seconds, address, "w" or "r", data) of every transaction
+        self.trace = [] if trace else None
+
+    def transaction_us(self, n):
+        """How long n data bytes take on the bus, address and start/stop included"""
+        return (2 + 9 * (n + 1)) * 1000000 / self.freq
+
+    def _wire(self, addr, n):
+        us = self.transaction_us(n)
+        self.busy_us += us
+        stats = self.stats.get(addr)
+        if stats is None:
+            stats = self.stats[addr] = [0, 0, 0.0]
+        stats[0] += 1
+        stats[1] += n
+        stats[2] += us
+        if self.timing:
+            time.sleep_us(us)
+
+    def _log(self, addr, kind, data):
+        if self.trace is not None:
+            self.trace.append((now_s(), addr, kind, data))
+
+    def _device(self, addr):
+        dev = self.devices.get(addr)
+        if dev is None:
+            raise OSError(5, "EIO")  # what the Pico raises for a NAK
+        return dev
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def writeto(self, addr, buf, stop=True):
+        data = bytes(buf)
+        self._wire(addr, len(data))
+        self._log(addr, "w", data)
+        self._device(addr).write(data)
+        self.writes += 1
+        self.bytes += len(data)
+        return len(data)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._wire(addr, len(buf))
+        data = self._device(addr).read(len(buf))
+        self._log(addr, "r", data)
+        buf[:] = data
+        self.reads += 1
+        self.bytes += len(data)
+
+    def readfrom(self, addr, n, stop=True):
+        buf = bytearray(n)
+        self.readfrom_into(addr, buf, stop)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self.writeto(addr, bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, n):
+        self.writeto(addr, bytes([memaddr]))
+        return self.readfrom(addr, n)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self.writeto(addr, bytes([memaddr]))
+        self.readfrom_into(addr, buf)
+
+
+# seesaw register bases and registers, see seesaw.py
+STATUS_BASE = 0x00
+TOUCH_BASE = 0x0F
+STATUS_HW_ID = 0x01
+STATUS_VERSION = 0x02
+STATUS_TEMP = 0x04
+STATUS_SWRST = 0x7F
+TOUCH_CHANNEL_OFFSET = 0x10
+HW_ID_CODE = 0x55
+PRODUCT_CODE = 4026  # STEMMA soil sensor, upper half of STATUS_VERSION
+
+# ms from selecting a register to its value being there; a read before
+# that gets all ones, like the 65535 rows in soil_data.csv
+MOISTURE_MS = 5.0
+TEMP_MS = 5.0
+# ms the chip NAKs everything after a software reset
+BOOT_MS = 20.0
+
+
+def now_s():
+    """The clock the device models run on: upy_shim's ticks_us, virtual or not"""
+    ticks_us = getattr(time, "ticks_us", None)
+    return ticks_us() / 1000000 if ticks_us is not None else time.perf_counter()
+
+
+class Seesaw:
+    """
+    The registers of a STEMMA soil sensor the seesaw drivers use, with the
+    chip's conversion times: a register is selected by a write of base and
+    function, the moisture reading takes MOISTURE_MS to convert and the
+    temperature TEMP_MS. A write without both bytes selects nothing.
+    """
+
+    def __init__(self, moisture=620, temp_c=23.5, noise=0.0, spikes=0.0,
+                 ones=0.0, naks=0.0, seed=0, moisture_ms=MOISTURE_MS, temp_ms=TEMP_MS,
+                 clock=now_s):
+        self.moisture = moisture
+        self.temp_c = temp_c
+        # misbehaviour: standard deviation of the moisture counts, and the
+        # chance of a spike, an all-ones read and a NAK per transaction
+        self.noise = noise
+        self.spikes = spikes
+        self.ones = ones
+        self.naks = naks
+        self.random = random.Random(seed)
+        self.convert_ms = {(TOUCH_BASE, TOUCH_CHANNEL_OFFSET): moisture_ms,
+                           (STATUS_BASE, STATUS_TEMP): temp_ms}
+        self.clock = clock
+        self.reg = (0, 0)
+        self.selected = 0.0
+        self.booted = 0.0
+        self.resets = 0
+        self.early_reads = 0
+
+    def _nak(self):
+        if self.clock() < self.booted or self.naks and self.random.random() < self.naks:
+            raise OSError(5, "EIO")
+
+    def _moisture(self):
+        value = self.moisture
+        if self.noise:
+            value += self.random.gauss(0, self.noise)
+        if self.spikes and self.random.random() < self.spikes:
+            value += self.random.choice((-1, 1)) * self.random.uniform(200, 500)
+        return min(max(int(round(value)), 0), 0xFFFF)
+
+    def write(self, data):
+        self._nak()
+        if len(data) < 2:
+            self.reg = None
+            return
+        self.reg = (data[0], data[1])
+        self.selected = self.clock()
+        if self.reg == (STATUS_BASE, STATUS_SWRST):
+            self.resets += 1
+            self.booted = self.selected + BOOT_MS / 1000
+
+    def read(self, n):
+        self._nak()
+        if self.ones and self.random.random() < self.ones:
+            return b"\xff" * n
+        if self.reg is None:
+            return b"\xff" * n
+        wait_ms = self.convert_ms.get(self.reg)
+        if wait_ms and round((self.clock() - self.selected) * 1000000) < wait_ms * 1000:
+            self.early_reads += 1
+            return b"\xff" * n
+        if self.reg == (STATUS_BASE, STATUS_HW_ID):
+            data = bytes([HW_ID_CODE])
+        elif self.reg == (STATUS_BASE, STATUS_VERSION):
+            data = struct.pack(">HH", PRODUCT_CODE, 0x2A51)  # date code
+        elif self.reg == (STATUS_BASE, STATUS_TEMP):
+            # 16.16 fixed point
+            data = struct.pack(">I", int(self.temp_c * 65536))
+        elif self.reg == (TOUCH_BASE, TOUCH_CHANNEL_OFFSET):
+            data = struct.pack(">H", self._moisture())
+        else:
+            data = b""
+        return data.ljust(n, b"\0")[:n]
+
+
+# ICM-20948 registers, see icm20948.py: (bank, register)
+ICM_WHO_AM_I = (0, 0x00)
+ICM_USER_CTRL = (0, 0x03)
+ICM_PWR_MGMT_1 = (0, 0x06)
+ICM_I2C_MST_STATUS = (0, 0x17)
+ICM_ACCEL_XOUT_H = (0, 0x2D)
+ICM_EXT_SLV_SENS_DATA_00 = (0, 0x3B)
+ICM_FIFO_EN_1 = (0, 0x66)
+ICM_FIFO_EN_2 = (0, 0x67)
+ICM_FIFO_RST = (0, 0x68)
+ICM_FIFO_COUNTH = (0, 0x70)
+ICM_FIFO_R_W = (0, 0x72)
+ICM_GYRO_SMPLRT_DIV = (2, 0x00)
+ICM_GYRO_CONFIG_1 = (2, 0x01)
+ICM_ACCEL_CONFIG = (2, 0x14)
+ICM_I2C_SLV0_ADDR = (3, 0x03)
+ICM_I2C_SLV4_ADDR = (3, 0x13)
+ICM_REG_BANK_SEL = 0x7F
+ICM_FIFO_SIZE = 512
+
+
+def still(t):
+    """motion() of an IMU lying flat: accel (g), gyro (deg/s), mag (uT), temp (degC)"""
+    return (0.0, 0.0, 1.0), (0.0, 0.0, 0.0), (20.0, -5.0, 40.0), 25.0
+
+
+class AK09916:
+    """The magnetometer inside the ICM-20948"""
+
+    def __init__(self):
+        self.regs = bytearray(0x40)
+        self.regs[0x00] = 0x48
+        self.regs[0x01] = 0x09
+        self.field = (0.0, 0.0, 0.0)
+
+    def read(self, reg):
+        if 0x11 <= reg <= 0x16:
+            data = struct.pack("<3h", *(int(round(v / 0.15)) for v in self.field))
+            return data[reg - 0x11]
+        return self.regs[reg]
+
+    def write(self, reg, value):
+        if reg == 0x32 and value & 1:
+            self.regs[0x31] = 0
+        else:
+            self.regs[reg] = value
+
+
+class ICM20948:
+    """An ICM-20948 sampling motion(t) into its FIFO on clock()"""
+
+    def __init__(self, motion=still, clock=now_s):
+        self.motion = motion
+        self.clock = clock
+        self.mag = AK09916()
+        self.reg = 0
+        self.fifo_reads = 0
+        self._reset()
+
+    def _reset(self):
+        self.banks = [bytearray(0x80) for _ in range(4)]
+        self.bank = 0
+        self.banks[0][0x00] = 0xEA
+        self.banks[0][0x06] = 0x41  # asleep
+        self.banks[2][0x01] = 0x01
+        self.banks[2][0x14] = 0x01
+        self.fifo = bytearray()
+        self.overflows = 0
+        self._restart()
+
+    def _restart(self):
+        # samples are taken at start + k / rate
+        self.start = self.clock()
+        self.taken = 0
+
+    def _get(self, reg):
+        return self.banks[reg[0]][reg[1]]
+
+    def rate(self):
+        return 1125 / (1 + self._get(ICM_GYRO_SMPLRT_DIV))
+
+    def running(self):
+        return not self._get(ICM_PWR_MGMT_1) & 0x40
+
+    def _record(self, t):
+        """Accel, gyro and temp registers and the slave 0 data of a sample at t"""
+        accel, gyro, field, temp_c = self.motion(t)
+        a_fs = 2 << (self._get(ICM_ACCEL_CONFIG) >> 1 & 3)
+        g_fs = 250 << (self._get(ICM_GYRO_CONFIG_1) >> 1 & 3)
+        counts = [a * 32768 / a_fs for a in accel] + [g * 32768 / g_fs for g in gyro]
+        counts.append((temp_c - 21) * 333.87)
+        data = struct.pack(">7h", *(min(max(int(round(c)), -32768), 32767) for c in counts))
+        self.mag.field = field
+        ext = b""
+        addr, reg, ctrl = self.banks[3][0x03:0x06]
+        if ctrl & 0x80 and addr == 0x80 | 0x0C and self._get(ICM_USER_CTRL) & 0x20:
+            ext = bytes(self.mag.read(reg + i) for i in range(ctrl & 0x0F))
+        return data, ext
+
+    def _advance(self):
+        """Take the samples due by now into the FIFO"""
+        if not self.running():
+            return
+        due = int((self.clock() - self.start) * self.rate())
+        if due <= self.taken:
+            return
+        fifo_on = self._get(ICM_USER_CTRL) & 0x40
+        # older samples than a FIFO's worth would be overwritten anyway
+        first = max(self.taken, due - ICM_FIFO_SIZE // 14 - 1)
+        for k in range(first, due):
+            data, ext = self._record(self.start + k / self.rate())
+            if not fifo_on:
+                continue
+            en2 = self._get(ICM_FIFO_EN_2)
+            if en2 & 0x10:
+                self.fifo += data[0:6]
+            for axis in range(3):
+                if en2 & 2 << axis:
+                    self.fifo += data[6 + 2 * axis:8 + 2 * axis]
+            if en2 & 0x01:
+                self.fifo += data[12:14]
+            if self._get(ICM_FIFO_EN_1) & 0x01:
+                self.fifo += ext
+            if len(self.fifo) > ICM_FIFO_SIZE:
+                # stream mode: the oldest bytes go
+                del self.fifo[:len(self.fifo) - ICM_FIFO_SIZE]
+                self.overflows += 1
+        self.taken = due
+        self.banks[0][0x2D:0x3B] = data
+        self.banks[0][0x3B:0x3B + len(ext)] = ext
+
+    def _slv4(self):
+        bank3 = self.banks[3]
+        addr, reg, ctrl, out = bank3[0x13:0x17]
+        bank3[0x15] = ctrl & 0x7F
+        status = self.banks[0]
+        if addr & 0x7F != 0x0C or not self._get(ICM_USER_CTRL) & 0x20:
+            status[0x17] |= 0x10  # SLV4_NACK
+            return
+        if addr & 0x80:
+            bank3[0x17] = self.mag.read(reg)
+        else:
+            self.mag.write(reg, out)
+        status[0x17] |= 0x40  # SLV4_DONE
+
+    def write(self, data):
+        self._advance()
+        self.reg = data[0]
+        for value in data[1:]:
+            self._write(self.reg, value)
+            self.reg += 1
+
+    def _write(self, reg, value):
+        if reg == ICM_REG_BANK_SEL:
+            self.bank = value >> 4 & 3
+            return
+        key = (self.bank, reg)
+        if key == ICM_PWR_MGMT_1 and value & 0x80:
+            self._reset()
+            return
+        was_running = self.running()
+        self.banks[self.bank][reg] = value
+        if key == ICM_FIFO_RST and value & 0x1F:
+            self.fifo = bytearray()
+        elif key == ICM_PWR_MGMT_1 and not was_running or key == ICM_GYRO_SMPLRT_DIV:
+            self._restart()
+        elif key == (3, 0x15) and value & 0x80:
+            self._slv4()
+
+    def read(self, n):
+        self._advance()
+        key = (self.bank, self.reg)
+        if key == ICM_FIFO_R_W:
+            data = bytes(self.fifo[:n]).ljust(n, b"\0")
+            del self.fifo[:n]
+            self.fifo_reads += 1
+            return data
+        if key == ICM_FIFO_COUNTH:
+            data = struct.pack(">H", len(self.fifo))
+        else:
+            regs = self.banks[self.bank]
+            data = bytes(regs[self.reg:self.reg + n])
+            if key == ICM_I2C_MST_STATUS:
+                regs[0x17] = 0  # cleared by reading
+        self.reg += n
+        return data[:n].ljust(n, b"\0")
@@ -0,0 +1,170 @@
+# fake_i2c_check.py (CPython)
+# The fake I2C bus and seesaw model of fake_i2c.py, which the soil sensor
+# drivers and the checks around them run on instead of a Pico:
+#   - the machine.I2C methods, and a NAK for an address nobody answers
+#   - scan_i2c.py and pico_sensor.py, run as they are on the Pico
+#   - the seesaw's conversion times (too early is all ones), its reset
+#     (NAKs while it boots) and the injected faults at their rates
+#   - latency and bus time of the soil sensor reads on the virtual clock,
+#     the same on every run, with budgets a driver change has to stay in
+#
+#   python testing/fake_i2c_check.py
+
+import contextlib
+import io
+import os
+import runpy
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import seesaw
+from fake_i2c import BOOT_MS, MOISTURE_MS, FakeI2C, Seesaw
+from soil_sampler import SoilSampler
+from stemma_soil_sensor import StemmaSoilSensor
+
+BUS_HZ = 100000   # pico_async.py's soil sensor bus
+READS = 1000
+
+# ms per reading on the virtual clock, what the drivers have now plus a little
+BUDGETS = {"get_moisture": 7.0, "get_temp": 6.0, "split moisture": 7.0, "sample burst": 72.0}
+
+
+def run_script(name):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        runpy.run_path(os.path.join(HERE, name), run_name="__main__")
+    return out.getvalue().strip()
+
+
+def check_bus():
+    clock = upy_shim.virtual_time()
+    chip = Seesaw(moisture=640)
+    bus = FakeI2C(devices={0x36: chip})
+    assert bus.scan() == [0x36]
+    bus.writeto(0x36, bytes([0x0F, 0x10]))
+    clock.sleep_ms(MOISTURE_MS)
+    buf = bytearray(2)
+    bus.readfrom_into(0x36, buf)
+    assert buf == b"\x02\x80"
+    # writeto_mem() with the function as its data selects a register,
+    # readfrom_mem() only sends the base
+    bus.writeto_mem(0x36, 0x00, b"\x01")
+    assert bus.readfrom(0x36, 1) == b"\x55"              # HW_ID
+    bus.writeto_mem(0x36, 0x00, b"\x02")
+    assert bus.readfrom(0x36, 4)[:2] == b"\x0f\xba"      # product 4026
+    assert bus.readfrom_mem(0x36, 0x00, 2) == b"\xff\xff"
+    try:
+        bus.writeto(0x49, b"\x00")
+        raise AssertionError("nobody at 0x49 but no NAK")
+    except OSError as e:
+        assert e.args[0] == 5
+    upy_shim.real_time()
+    print(f"bus: {bus.writes} writes, {bus.reads} reads, {bus.bytes} bytes, "
+          f"{bus.busy_us:.0f} us at {bus.freq // 1000} kHz")
+
+
+def check_scripts():
+    # machine.I2C() is a fake bus with a soil sensor at 0x36
+    assert run_script("scan_i2c.py") == "['0x36']"
+    # a one byte register address doesn't select anything on a seesaw,
+    # which wants base and function: the script reads all ones
+    out = run_script("pico_sensor.py")
+    assert out.startswith("Firmware version register: 65535"), out
+    print(f"scan_i2c.py: {run_script('scan_i2c.py')}; pico_sensor.py: {out}")
+
+
+def check_timing_model():
+    clock = upy_shim.virtual_time()
+    chip = Seesaw(moisture=640)
+    bus = FakeI2C(devices={0x36: chip})
+    sensor = StemmaSoilSensor(bus, reset=False)
+
+    # a moisture read the driver doesn't wait long enough for
+    buf = bytearray(2)
+    sensor._read(seesaw.TOUCH_BASE, 0x10, buf, delay_ms=2)
+    assert buf == b"\xff\xff" and chip.early_reads == 1
+    assert sensor.get_moisture() == 640 and chip.early_reads == 1
+
+    # the chip is gone for a while after a reset, the driver waits it out
+    sensor._write8(seesaw.STATUS_BASE, 0x7F, 0xFF)
+    try:
+        bus.readfrom(0x36, 1)
+        raise AssertionError("answered while rebooting")
+    except OSError:
+        pass
+    clock.sleep_ms(BOOT_MS)
+    t0 = clock.us
+    sensor.sw_reset()
+    assert chip.resets == 2 and clock.us - t0 >= 500000
+    upy_shim.real_time()
+    print("seesaw: a read 2 ms after selecting moisture is 0xffff, NAKs while rebooting")
+
+
+def check_faults():
+    clock = upy_shim.virtual_time()
+    chip = Seesaw(moisture=640, ones=0.1, naks=0.05, seed=3)
+    bus = FakeI2C(devices={0x36: chip})
+    ones = naks = 0
+    buf = bytearray(2)
+    for _ in range(READS):
+        try:
+            bus.writeto(0x36, bytes([0x0F, 0x10]))
+            clock.sleep_ms(MOISTURE_MS)
+            bus.readfrom_into(0x36, buf)
+            ones += buf == b"\xff\xff"
+        except OSError:
+            naks += 1
+    upy_shim.real_time()
+    # a NAK on either transaction ends the read, one in ten reads is all ones
+    assert 0.07 < naks / READS < 0.13 and 0.07 < ones / (READS - naks) < 0.13, (naks, ones)
+    print(f"faults: {naks / READS:.1%} of reads NAKed, {ones / (READS - naks):.1%} of the rest all ones")
+
+
+def bench(name, read, clock, bus, n):
+    t0, busy0, tx0 = clock.us, bus.busy_us, bus.writes + bus.reads
+    for _ in range(n):
+        read()
+    ms = (clock.us - t0) / 1000 / n
+    busy = (bus.busy_us - busy0) / n
+    tx = (bus.writes + bus.reads - tx0) / n
+    assert ms <= BUDGETS[name], f"{name} takes {ms:.2f} ms, over its {BUDGETS[name]} ms budget"
+    print(f"  {name:15}  {ms:8.2f}  {busy:7.0f}  {busy / 10 / ms:8.1f}%  {tx:12.1f}")
+
+
+def check_latency():
+    clock = upy_shim.virtual_time()
+    bus = FakeI2C(freq=BUS_HZ, timing=True, devices={0x36: Seesaw(moisture=640, noise=2.0)})
+    sensor = StemmaSoilSensor(bus, reset=False)
+    sampler = SoilSampler(sensor)
+
+    def split_moisture():
+        clock.sleep_ms(sensor.start_moisture())
+        while sensor.poll_moisture() is None:
+            clock.sleep_ms(sensor.ready_in_ms() or 1)
+
+    def burst():
+        clock.sleep_ms(sampler.start())
+        while not sampler.poll():
+            clock.sleep_ms(sampler.ready_in_ms() or 1)
+
+    print(f"at {BUS_HZ // 1000} kHz      ms/reading  bus us  bus busy  transactions")
+    bench("get_moisture", sensor.get_moisture, clock, bus, READS)
+    bench("get_temp", sensor.get_temp, clock, bus, READS)
+    bench("split moisture", split_moisture, clock, bus, READS)
+    bench("sample burst", burst, clock, bus, READS // 10)
+    assert sampler.flags == 0 and bus.devices[0x36].early_reads == 0
+    upy_shim.real_time()
+
+
+if __name__ == "__main__":
+    check_bus()
+    check_scripts()
+    check_timing_model()
+    check_faults()
+    check_latency()
+    print("ok")
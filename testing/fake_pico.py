@@ -0,0 +1,230 @@
+# fake_pico.py (CPython)
+# Stand-in for the motor Pico running pico_wifi_motor.py. Listens on a TCP
+# port, parses frames the same way the firmware does and keeps the arrival
+# time of each one (and of every !S stop command), so the ground station
+# can be tested without hardware. Sends telemetry reports back like the
+# firmware does, every report_interval seconds.
+#
+#   python testing/fake_pico.py [port]
+#
+# or from another script:
+#
+#   pico = FakePico().start()
+#   ... point motion.HOST_motor / PORT at pico.host, pico.port ...
+#   pico.stop(); print(pico.frames)
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gaits
+import telemetry
+import trajectory
+
+
+class FakePico:
+    def __init__(self, host="127.0.0.1", port=0, keep=100000, report_interval=1.0):
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.host, self.port = self.server.getsockname()
+
+        self.keep = keep
+        self.report_interval = report_interval
+        self.reports_sent = 0
+        self.frames = []  # (perf_counter arrival time, [angles]) with deltas applied
+        self.frame_bytes = []  # wire size of each frame body
+        # last uploaded spline trajectory (trajectory.py) and when it started playing
+        self.upload = trajectory.UploadParser()
+        self.trajectory_started = None
+        # last uploaded gait period table (gaits.py) and when it started playing
+        self.wave = gaits.UploadParser()
+        self.wave_started = None
+        self.wave_uploads = 0
+        self.stops = []   # (perf_counter arrival time, [angles]) of !S commands
+        self.stopped = False
+        self.ignored = 0  # frames thrown away while stopped
+        self.parse_errors = 0
+        self.clients = 0
+        self.bytes_received = 0
+        self._running = False
+        self._thread = None
+        self._reset_stats()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.server.close()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _serve(self):
+        # like the firmware, but re-accepts so several runs can share one fake
+        while self._running:
+            try:
+                client, addr = self.server.accept()
+            except OSError:
+                break
+            self.clients += 1
+            with client:
+                self._handle(client)
+
+    def _handle(self, client):
+        buffer = b""
+        self._reset_stats()
+        client.settimeout(self.report_interval)
+        last_report = time.perf_counter()
+        while self._running:
+            try:
+                data = client.recv(4096)
+            except socket.timeout:
+                data = None
+            except OSError:
+                break
+            if data == b"":
+                break
+            now = time.perf_counter()
+            if data:
+                self.bytes_received += len(data)
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    self.handle_line(line, now)
+
+            if now - last_report >= self.report_interval:
+                last_report = now
+                try:
+                    client.sendall(self.report(now))
+                except OSError:
+                    break
+
+    def _reset_stats(self):
+        # a new client has to start with a keyframe
+        self.state = None
+        self.last_seq = 0
+        self.applied_at = time.perf_counter()
+        self.applied = 0
+        self.client_parse_errors = 0
+        self._lat = []
+
+    def report(self, now):
+        """Telemetry line for the current client, the fake has no loop time of its own"""
+        lat = self._lat
+        self._lat = []
+        self.reports_sent += 1
+        lat_avg = sum(lat) / len(lat) * 1e6 if lat else 0
+        lat_max = max(lat) * 1e6 if lat else 0
+        return telemetry.encode_report({
+            "seq": self.last_seq,
+            "frames": self.applied,
+            "skipped": 0,
+            "lat_avg": lat_avg,
+            "lat_max": lat_max,
+            "loop_avg": lat_avg,
+            "loop_max": lat_max,
+            "age": (now - self.applied_at) * 1e6,
+            "mem_free": 150000,
+            "parse_errors": self.client_parse_errors,
+        })
+
+    def handle_line(self, line, now):
+        line = line.strip()
+        if line.startswith(b"!"):
+            self.handle_priority(line, now)
+            return
+        if self.stopped:
+            self.ignored += 1
+            return
+        if line.startswith(b"@"):
+            # @P/@V/@W gait period table (gaits.py), the rest a spline trajectory
+            wave = line[:2] in (b"@P", b"@V", b"@W")
+            try:
+                (self.wave if wave else self.upload).handle_line(line)
+            except (ValueError, IndexError):
+                self.parse_errors += 1
+                self.client_parse_errors += 1
+                return
+            if wave and self.wave.ready:
+                self.wave_uploads += 1
+                self.wave_started, self.trajectory_started = now, None
+            elif not wave and self.upload.ready:
+                self.trajectory_started, self.wave_started = now, None
+            return
+        self.trajectory_started = self.wave_started = None
+        seq = None
+        if b":" in line:
+            seq, line = line.split(b":", 1)
+        try:
+            angles = self._apply(line)
+            seq = int(seq) if seq is not None else None
+        except (ValueError, IndexError):
+            self.parse_errors += 1
+            self.client_parse_errors += 1
+            return
+        self.applied += 1
+        self.applied_at = time.perf_counter()
+        self._lat.append(self.applied_at - now)
+        if seq is not None:
+            self.last_seq = seq
+        self.frames.append((now, angles))
+        self.frame_bytes.append(len(line))
+        if len(self.frames) > self.keep:
+            del self.frames[:len(self.frames) - self.keep]
+            del self.frame_bytes[:len(self.frame_bytes) - self.keep]
+
+    def _apply(self, body):
+        """Keyframe or delta body -> full joint state, like set_state() in the firmware"""
+        if body.startswith(b"~"):  # transport.DELTA
+            if self.state is None:
+                raise ValueError("delta before the first keyframe")
+            state = list(self.state)
+            for item in body[1:].split(b","):
+                j, v = item.split(b"=")
+                state[int(j)] = float(v)
+        else:
+            state = [float(x) for x in body.decode().split(",")]
+        self.state = state
+        return state
+
+    def handle_priority(self, line, now):
+        # same commands as pico_wifi_motor.py, see transport.py
+        if line == b"!R":
+            self.stopped = False
+        elif line.startswith(b"!S,"):
+            try:
+                angles = self._apply(line[3:])
+            except (ValueError, IndexError):
+                self.parse_errors += 1
+                self.client_parse_errors += 1
+                return
+            self.stopped = True
+            self.trajectory_started = self.wave_started = None
+            self.stops.append((now, angles))
+        else:
+            self.parse_errors += 1
+            self.client_parse_errors += 1
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    pico = FakePico("0.0.0.0", port).start()
+    print(f"fake pico listening on port {pico.port}, Ctrl-C to stop")
+    last = 0
+    try:
+        while True:
+            time.sleep(1)
+            count = len(pico.frames)
+            latest = pico.frames[-1][1] if pico.frames else None
+            print(f"{count - last} frames/s  parse errors: {pico.parse_errors}  last: {latest}")
+            last = count
+    except KeyboardInterrupt:
+        pico.stop()
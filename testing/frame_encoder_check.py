@@ -0,0 +1,49 @@
+# frame_encoder_check.py (CPython)
+# Runs the serpentine gait through transport.FrameEncoder at a few omegas,
+# decodes the result the way the firmware does (fake_pico.py) and checks the
+# Pico ends up with exactly the angles motion.py generated. Prints how many
+# bytes the delta frames save over sending every frame in full.
+#
+#   python testing/frame_encoder_check.py
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import motion
+import transport
+from fake_pico import FakePico
+
+SECONDS = 30
+RATE = 20  # Hz, gait_loop.PERIOD
+
+
+def check(omega):
+    motion.params.update({"omega": omega})
+    encoder = transport.FrameEncoder()
+    pico = FakePico()
+    full_bytes = sent_bytes = sent = 0
+
+    for i in range(SECONDS * RATE):
+        angles = motion.serpentine_angles(0.0, now=i / RATE)
+        full_bytes += len(transport.encode_frame(angles, i + 1))
+        data = encoder.encode(angles)
+        if data is not None:
+            sent += 1
+            sent_bytes += len(data)
+            pico.handle_line(data, 0.0)
+        assert pico.state == [float(a) for a in angles], f"tick {i}: {pico.state} != {angles}"
+
+    pico.server.close()
+    assert pico.parse_errors == 0
+    print(f"omega {omega:4.1f}: {sent:4d} of {SECONDS * RATE} frames sent, "
+          f"{sent_bytes:6d} bytes vs {full_bytes:6d} full ({sent_bytes / full_bytes:.0%})")
+
+
+if __name__ == "__main__":
+    for omega in (0.2, 0.5, 1.0, 2.0, 5.0):
+        check(omega)
+    print("ok")
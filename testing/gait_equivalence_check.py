@@ -0,0 +1,273 @@
+# gait_equivalence_check.py (CPython)
+# Checks that the declarative gaits in gaits.py reproduce the hand-written
+# serpentine_angles/sidewinding_angles they replaced, frame for frame, both
+# through the per-frame evaluator and the vectorized one. Also reports how
+# far the period lookup table (what the Pico plays on its own) is from the
+# exact gait, and runs an onboard gait through the app against the fake Pico.
+# Malformed specs and gaits.json entries are refused or skipped, never a crash,
+# and a gait the Pico can't play is refused before it starts.
+#
+#   python testing/gait_equivalence_check.py
+
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import gait_params
+import gaits
+from fake_pico import FakePico
+
+NUM_SERVOS = 6
+
+# specs compile_gait() must refuse with a ValueError
+BAD_SPECS = [
+    {"name": "x"},
+    {"name": "x", "joints": [{"offset": "nope"}]},
+    {"name": "x", "joints": [{"harmonics": [[1, 2]]}]},
+    {"name": "x", "joints": [5]},
+    {"name": "x", "envelope": 5, "joints": [{}]},
+    {"name": "x", "envelope": {"ramp": "slow"}, "joints": [{}]},
+    {"name": "x", "clamp": 7, "joints": [{}]},
+    {"name": "x", "clamp": [0, "180"], "joints": [{}]},
+    {"name": "x", "joints": [{"clamp": [120, 60]}]},
+    {"name": "x", "joints": [{"harmonics": [5]}]},
+    {"name": "x", "joints": [{"harmonics": 5}]},
+    {"name": "x", "joints": [{"offset": {"alpha": "2"}}]},
+    {"name": "x", "joints": [{"offset": {"const": [1]}}]},
+]
+CALIBRATION = [0, -20, 0, -30, 0, 0]
+HORIZONTAL = [0, 1, 0, 1, 0, 1]
+
+
+# ======================
+# The gaits as they were written in motion.py
+# ======================
+
+def reference_serpentine(params, now):
+    p = params.snapshot()
+    phase = params.phase(now, snapshot=p)
+    theta = [0] * NUM_SERVOS
+    for joint in range(NUM_SERVOS):
+        if HORIZONTAL[joint] == 0:
+            wave = p["alpha"] * math.sin(phase + joint * p["beta"]) + p["gamma"]
+            angle = round(wave, 0) + p["calibration"][joint]
+        else:
+            angle = p["calibration"][joint]
+        servo_angle = angle + 90
+        theta[joint] = max(0, min(180, servo_angle))
+    return theta
+
+
+def reference_sidewinding(t):
+    s1 = 5 + 5 * math.sin(2 * math.pi * t)
+    s2 = 22.5 + 22.5 * math.sin(2 * math.pi * t + math.pi / 2)
+    s3 = 0
+    s4 = 18 + 18 * math.sin(2 * math.pi * t + math.pi / 4)
+    s5 = 5 + 5 * math.sin(2 * math.pi * t)
+    return [max(0, min(180, round(a))) for a in [s1, s2, s3, s4, s5]]
+
+
+# ======================
+# Checks
+# ======================
+
+PARAM_SETS = [
+    {},
+    {"alpha": 90.0, "omega": 0.7},
+    {"alpha": 30.0, "gamma": 12.5, "K_n": 1.5},
+    {"alpha": 75.0, "gamma": -30.0, "omega": 11.0, "beta": -2.0},
+]
+
+
+def check_serpentine():
+    params = gait_params.GaitParams(60.0, 2.0, 0.5, 3, CALIBRATION, preset_file=os.devnull)
+    library = gaits.Library(params, [gaits.serpentine(HORIZONTAL), gaits.SIDEWINDING])
+    generate = library.angle_generator("serpentine")
+    frames = 0
+    now = 1000.0
+    params.reset_phase(now)
+
+    for changes in PARAM_SETS:
+        # mid-run updates, like POST /params
+        params.update(changes, now=now)
+        times = now + np.arange(0, 20, 0.05) + 0.0123
+        for t in times:
+            ref = reference_serpentine(params, t)
+            got = generate(0.0, t)
+            assert got == ref, f"serpentine {changes} at {t}: {got} != {ref}"
+            frames += 1
+
+        gait = library.get("serpentine")
+        theta = [params.phase(t) for t in times]
+        vec = gait.evaluate(theta)
+        ref = np.array([reference_serpentine(params, t) for t in times])
+        assert np.array_equal(vec, ref), f"vectorized serpentine differs for {changes}"
+        now = times[-1]
+    print(f"serpentine: {frames} frames identical over {len(PARAM_SETS)} parameter sets")
+
+
+def check_sidewinding():
+    params = gait_params.GaitParams(60.0, 2.0, 0.5, 3, CALIBRATION, preset_file=os.devnull)
+    library = gaits.Library(params, [gaits.serpentine(HORIZONTAL), gaits.SIDEWINDING])
+    generate = library.angle_generator("sidewinding")
+    times = np.arange(0, 60, 0.01) + 0.0037
+    for t in times:
+        assert generate(0.0, t) == reference_sidewinding(t), f"sidewinding at {t}"
+
+    gait = library.get("sidewinding")
+    vec = gait.evaluate(gait.omega * times)
+    assert np.array_equal(vec, np.array([reference_sidewinding(t) for t in times])), \
+        "vectorized sidewinding differs"
+    print(f"sidewinding: {len(times)} frames identical")
+
+
+def check_lookup_table():
+    params = gait_params.GaitParams(60.0, 2.0, 0.5, 3, CALIBRATION, preset_file=os.devnull)
+    library = gaits.Library(params, [gaits.serpentine(HORIZONTAL), gaits.SIDEWINDING])
+    for name in ("serpentine", "sidewinding"):
+        gait = library.get(name)
+        theta = np.linspace(0, 4 * math.pi, 5000)
+        exact = gait.evaluate(theta)
+        for size in (32, 64, 128, 256):
+            host = np.array([gait.lookup(x, size) for x in theta])
+            pico = gaits.UploadParser()
+            for line in gaits.encode_upload(gait, size=size).split(b"\n"):
+                if line.strip():
+                    pico.handle_line(line)
+            played = np.array([pico.angles_at(x / gait.omega) for x in theta])
+            print(f"{name:11s} table {size:3d}: lookup max error {np.abs(host - exact).max():.2f} deg, "
+                  f"Pico playback {np.abs(played - exact).max():.2f} deg, "
+                  f"upload {len(gaits.encode_upload(gait, size=size))} B")
+
+
+def check_user_gait():
+    # two harmonics, an envelope and a per-joint clamp: the two evaluators must agree
+    spec = {
+        "name": "wiggle",
+        "omega": 3.0,
+        "envelope": {"ramp": 2.0},
+        "joints": [
+            {"center": 90, "harmonics": [[1, 40, 0], [3, 10, 0.5]]},
+            {"center": {"calibration": 1, "const": 90}, "clamp": [60, 120],
+             "harmonics": [[1, "alpha", {"beta": 1}]]},
+        ],
+    }
+    params = gait_params.GaitParams(60.0, 2.0, 0.5, 3, CALIBRATION, preset_file=os.devnull)
+    library = gaits.Library(params, [spec])
+    gait = library.get("wiggle")
+    t = np.arange(0, 5, 0.01)
+    vec = gait.evaluate(gait.omega * t, t)
+    per_frame = np.array([gait.angles(gait.omega * x, x) for x in t])
+    assert np.array_equal(vec, per_frame), "vectorized and per-frame evaluators disagree"
+    assert vec[:, 1].min() >= 60 and vec[:, 1].max() <= 120, "per-joint clamp ignored"
+    assert np.all(vec[0] == [90, 70]), "envelope should start at zero amplitude"
+
+    # a parameter update recompiles
+    params.update({"alpha": 10.0})
+    assert library.get("wiggle").harmonics[1][0][1] == 10.0
+    for bad in BAD_SPECS:
+        try:
+            gaits.compile_gait(bad, params.snapshot())
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad} should not compile")
+    print(f"user gait: evaluators agree, clamp/envelope/recompile ok, {len(BAD_SPECS)} bad specs refused")
+
+
+def check_library_file(tmp):
+    # one broken entry in gaits.json must not keep motion.py from importing
+    params = gait_params.GaitParams(60.0, 2.0, 0.5, 3, CALIBRATION, preset_file=os.devnull)
+    good = {"name": "good", "joints": [{"center": 90}]}
+    entries = [good, {"joints": [{}]}, {"name": "bad", "joints": [5]}, 7,
+               {"name": "serpentine", "joints": [{}]}]
+    path = os.path.join(tmp, "gaits.json")
+    gaits.write_specs(entries, path)
+    library = gaits.Library(params, [gaits.serpentine(HORIZONTAL)] + gaits.load_specs(path))
+    assert library.names() == ["serpentine", "good"], library.names()
+    assert len(library.get("serpentine").offset) == NUM_SERVOS
+    # what was skipped is still written back, fixing a gait replaces it
+    assert library.user_specs() == [good] + entries[1:]
+    library.add({"name": "bad", "joints": [{"center": 80}]})
+    assert [s.get("name") if isinstance(s, dict) else s for s in library.user_specs()] == \
+        ["good", "bad", None, 7, "serpentine"]
+
+    for text in ("{not json", "5"):
+        open(path, "w").write(text)
+        assert gaits.load_specs(path) == []
+    print(f"library: {len(entries) - 1} bad gaits.json entries skipped and kept, a broken file is no gaits")
+
+
+def check_onboard():
+    import app as ground_station
+    import motion
+
+    pico = FakePico().start()
+    motion.HOST_motor, motion.PORT = pico.host, pico.port
+    client = ground_station.app.test_client()
+    client.post("/start_gait/serpentine?onboard=1")
+    deadline = time.time() + 2
+    while pico.wave_started is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert pico.wave_started is not None, "no period table arrived"
+    client.post("/params", json={"omega": 3.0})
+    time.sleep(0.3)
+    uploads = pico.wave_uploads
+    client.post("/stop")
+    time.sleep(0.1)
+    assert uploads >= 2, "parameter update was not re-uploaded"
+    assert pico.wave_started is None and pico.stops, "stop did not end playback"
+    client.post("/params", json={"omega": 2.0})
+    motion.gait_thread.join(1)
+
+    for bad in BAD_SPECS:
+        r = client.post("/gaits", json=bad)
+        assert r.status_code == 400, (bad, r.status_code)
+
+    # the Pico can't play an envelope: refused before anything starts
+    motion.gait_library.add({"name": "ramped", "envelope": {"ramp": 1.0}, "joints": [{"center": 90}]})
+    r = client.post("/start_gait/ramped?onboard=1")
+    assert r.status_code == 400 and "envelope" in r.get_json()["error"], r.data
+    assert not motion.running
+
+    # a gait that stops fitting the upload bytes halfway: the thread dies
+    # on the re-upload, the next gait still starts
+    motion.gait_library.add({"name": "tall", "omega": 1.0, "clamp": [0, 400],
+                             "joints": [{"center": {"alpha": 4}}]})
+    errors = []
+    hook, threading.excepthook = threading.excepthook, errors.append
+    try:
+        assert client.post("/start_gait/tall?onboard=1").status_code == 200
+        time.sleep(0.2)
+        client.post("/params", json={"alpha": 80.0})
+        motion.gait_thread.join(1)
+    finally:
+        threading.excepthook = hook
+    assert len(errors) == 1 and errors[0].exc_type is ValueError, errors
+    assert not motion.running
+    client.post("/params", json={"alpha": 60.0})
+    assert client.post("/start_gait/serpentine?onboard=1").status_code == 200
+    client.post("/stop")
+    motion.gait_thread.join(1)
+    pico.stop()
+    print(f"onboard: {uploads} uploads, {pico.bytes_received} bytes, stopped, an envelope refused "
+          f"with 400, a failed upload leaves the next gait free to start")
+
+
+if __name__ == "__main__":
+    check_serpentine()
+    check_sidewinding()
+    check_user_gait()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_library_file(tmp)
+    check_lookup_table()
+    check_onboard()
+    print("ok")
@@ -0,0 +1,160 @@
+# handoff_check.py (CPython)
+# Exercises pico_handoff.Handoff, the double buffer between the network and
+# actuation cores of pico_dual_core.py, with two threads standing in for the
+# two cores.
+#
+#   stress   both sides as fast as they can, every frame the reader gets has
+#            to be exactly one published frame (no mix of two), deltas included
+#   bursty   frames generated at 20 Hz but delivered the way Wi-Fi does, in
+#            clumps after stalls. Compares when the servos get written with
+#            the single-core firmware (on arrival) and the dual-core one
+#            (every SERVO_MS)
+#
+#   python testing/handoff_check.py
+
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from pico_handoff import Handoff
+
+JOINTS = 6
+SERVO_MS = 20
+RATE = 20  # Hz, gait_loop
+
+
+def frame(i, state):
+    """Frame i: a keyframe every 10th, otherwise a delta to one joint"""
+    if i % 10 == 0:
+        for j in range(JOINTS):
+            state[j] = float(i % 180)
+    else:
+        state[i % JOINTS] = float(i % 180)
+
+
+def reference(n):
+    state = [90.0] * JOINTS
+    out = [tuple(state)]
+    for i in range(1, n + 1):
+        frame(i, state)
+        out.append(tuple(state))
+    return out
+
+
+def check_stress(seconds=1.0):
+    h = Handoff(JOINTS)
+    n = 200000
+    ref = reference(n)
+    done = threading.Event()
+    seen = []
+
+    def reader():
+        out = array("f", [0.0] * JOINTS)
+        while not done.is_set():
+            meta = h.take(out)
+            if meta is not None:
+                seen.append((meta[0], tuple(out)))
+
+    t = threading.Thread(target=reader)
+    t.start()
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while i < n and time.perf_counter() < deadline:
+        i += 1
+        frame(i, h.back())
+        h.publish(i)
+    done.set()
+    t.join()
+
+    bad = [(seq, got) for seq, got in seen if got != ref[seq]]
+    assert not bad, f"{len(bad)} torn or wrong frames, first {bad[0]} expected {ref[bad[0][0]]}"
+    seqs = [seq for seq, _ in seen]
+    assert seqs == sorted(seqs), "frames went backwards"
+    assert h.taken + h.replaced == h.published or h.taken + h.replaced == h.published - 1
+    print(f"stress: {i} frames published, {len(seen)} taken, {h.replaced} replaced, none torn")
+
+
+def deliveries(seconds, seed=1):
+    """(arrival time, [frame numbers]) for frames made at RATE and sent over bursty Wi-Fi"""
+    rng = random.Random(seed)
+    out = []
+    t = 0.0
+    i = 1
+    stalled_until = 0.0
+    while t < seconds:
+        if t >= stalled_until and rng.random() < 0.08:
+            stalled_until = t + rng.uniform(0.05, 0.25)  # retries, power save, a busy AP
+        arrive = max(t, stalled_until) + rng.uniform(0.001, 0.004)
+        if out and arrive <= out[-1][0] + 0.001:
+            out[-1][1].append(i)  # arrived in the same read as the previous one
+        else:
+            out.append((arrive, [i]))
+        i += 1
+        t += 1 / RATE
+    return out
+
+
+def check_bursty(seconds=10.0):
+    plan = deliveries(seconds)
+    ref = reference(sum(len(f) for _, f in plan))
+    h = Handoff(JOINTS)
+    ticks = []  # (tick time, seq or None, arrival time)
+    arrival = {}
+    running = threading.Event()
+    running.set()
+
+    def actuation():
+        out = array("f", [0.0] * JOINTS)
+        next_tick = time.perf_counter()
+        while running.is_set():
+            meta = h.take(out)
+            now = time.perf_counter()
+            if meta is not None:
+                assert tuple(out) == ref[meta[0]], f"frame {meta[0]} torn"
+                ticks.append((now, meta[0], meta[1]))
+            next_tick += SERVO_MS / 1000
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    t = threading.Thread(target=actuation)
+    start = time.perf_counter()
+    t.start()
+    for at, frames in plan:
+        time.sleep(max(0.0, start + at - time.perf_counter()))
+        received = time.perf_counter()
+        buf = h.back()
+        for i in frames:
+            frame(i, buf)
+            arrival[i] = received
+        h.publish(frames[-1], received)
+    time.sleep(0.1)
+    running.clear()
+    t.join()
+
+    # single core: the servos are written once per read, when it arrives
+    single = np.diff([at for at, _ in plan]) * 1000
+    dual = np.diff([now for now, _, _ in ticks]) * 1000
+    stale = np.array([now - received for now, _, received in ticks]) * 1000
+    print(f"bursty: {sum(len(f) for _, f in plan)} frames in {len(plan)} reads over {seconds:.0f} s")
+    print(f"  single core, time between servo updates: p50 {np.percentile(single, 50):5.1f} ms "
+          f"p1 {np.percentile(single, 1):5.1f} ms max {single.max():5.1f} ms, "
+          f"{(single < 5).sum()} updates <5 ms after the previous one")
+    print(f"  dual core,   time between servo updates: p50 {np.percentile(dual, 50):5.1f} ms "
+          f"p1 {np.percentile(dual, 1):5.1f} ms max {dual.max():5.1f} ms, "
+          f"{(dual < 5).sum()} updates <5 ms after the previous one")
+    print(f"  dual core, arrival to servo write: p50 {np.percentile(stale, 50):.1f} ms "
+          f"max {stale.max():.1f} ms (at most one SERVO_MS), {h.replaced} frames replaced")
+    assert stale.max() < SERVO_MS + 10, "a frame waited longer than a tick"
+
+
+if __name__ == "__main__":
+    check_stress()
+    check_bursty()
+    print("ok")
@@ -0,0 +1,187 @@
+# i2c_scheduler.py (MicroPython, also runs on CPython with upy_shim.py)
+# Shares one I2C bus between devices that each want samples at their own
+# rate, e.g. the soil sensor (seesaw at 0x36) and the IMU (icm20948.py) on
+# I2C(0, scl=Pin(1), sda=Pin(0)). Each device's blocking read sleeps
+# through its conversions while the bus sits idle, and the other device
+# waits: a soil burst is about 65 ms, longer than the IMU's FIFO lasts at
+# 562.5 Hz. Here a device is a job split into phases instead, and the
+# scheduler runs one phase at a time, whichever device is due, so one
+# device's transactions go in while another's chip converts.
+#
+#   sched = I2CScheduler()
+#   sched.add("imu", Call(lambda: imu.read_into(out)), rate_hz=50, priority=1)
+#   sched.add("soil", sampler, rate_hz=1, on_sample=keep)
+#   await sched.run()         # or sched.run_for(seconds), blocking
+#   print(sched.report())
+#
+# A job has the split-phase methods of soil_sampler.SoilSampler: start()
+# begins a sample and returns ms until poll() is worth calling, poll() does
+# the next phase and returns True once the sample is done, ready_in_ms()
+# says when to poll again. Call wraps a driver call that is done in one go.
+#
+# A sample is released every 1 / rate_hz; when several devices are due the
+# highest priority goes first, then the earliest deadline (the next
+# release). A device that falls more than a period behind skips the
+# releases it missed rather than bunching samples up, and counts them.
+# Time spent inside a job's calls counts as bus time, the calls block on
+# the I2C transfers.
+#
+# The bus runs at the speed of its slowest device. pico_async.py clocks
+# the soil sensor's at 100 kHz, where the IMU's FIFO records fit at 225 Hz
+# (half the bus) but not at 562.5 Hz; see i2c_scheduler_check.py.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import time
+
+
+class Call:
+    """A job that is one driver call, e.g. draining the IMU's FIFO"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def start(self):
+        self.fn()
+        return 0
+
+    def poll(self):
+        return True
+
+    def ready_in_ms(self):
+        return 0
+
+
+class Device:
+    def __init__(self, name, job, rate_hz, priority, on_sample):
+        self.name = name
+        self.job = job
+        self.rate_hz = rate_hz
+        self.period_us = int(1000000 / rate_hz)
+        self.priority = priority
+        self.on_sample = on_sample
+        # ticks_us the next sample is released, and while one is running
+        # (active) when its job is worth polling again
+        self.release = 0
+        self.active = False
+        self.due = 0
+        self.samples = 0
+        self.skipped = 0        # releases missed by running late
+        self.max_late_us = 0    # release to start of a sample
+        self.busy_us = 0        # in the job's calls
+
+
+class I2CScheduler:
+    def __init__(self):
+        self.devices = []
+        self.started = None
+        self.busy_us = 0
+
+    def add(self, name, job, rate_hz, priority=0, on_sample=None):
+        """
+        Schedule job at rate_hz samples a second, higher priority first.
+        on_sample(device, ticks_us) is called after each sample.
+        """
+        d = Device(name, job, rate_hz, priority, on_sample)
+        if self.started is not None:
+            d.release = time.ticks_us()
+        self.devices.append(d)
+        return d
+
+    def _pick(self, now):
+        best = None
+        for d in self.devices:
+            if time.ticks_diff(d.due if d.active else d.release, now) > 0:
+                continue
+            if best is None or d.priority > best.priority or (
+                    d.priority == best.priority
+                    and time.ticks_diff(d.release, best.release) + d.period_us < best.period_us):
+                best = d
+        return best
+
+    def step(self):
+        """Run the most urgent phase that is due, returns us until the next one"""
+        now = time.ticks_us()
+        if self.started is None:
+            self.started = now
+            for d in self.devices:
+                d.release = now
+        d = self._pick(now)
+        if d is None:
+            wait = None
+            for d in self.devices:
+                left = time.ticks_diff(d.due if d.active else d.release, now)
+                if wait is None or left < wait:
+                    wait = left
+            return 1000 if wait is None else wait
+        done = False
+        if d.active:
+            done = d.job.poll()
+        else:
+            late = time.ticks_diff(now, d.release)
+            if late > d.max_late_us:
+                d.max_late_us = late
+            d.active = True
+            d.job.start()
+        end = time.ticks_us()
+        busy = time.ticks_diff(end, now)
+        d.busy_us += busy
+        self.busy_us += busy
+        if done:
+            d.active = False
+            d.samples += 1
+            d.release = time.ticks_add(d.release, d.period_us)
+            behind = time.ticks_diff(end, d.release)
+            if behind >= d.period_us:
+                missed = behind // d.period_us
+                d.skipped += missed
+                d.release = time.ticks_add(d.release, missed * d.period_us)
+            if d.on_sample is not None:
+                d.on_sample(d, end)
+        else:
+            d.due = time.ticks_add(end, d.job.ready_in_ms() * 1000)
+        return 0
+
+    async def run(self):
+        while True:
+            wait = self.step()
+            if wait > 0:
+                await asyncio.sleep(wait / 1000000)
+
+    def run_for(self, seconds):
+        """Blocking, for scripts and checks"""
+        end = time.ticks_add(time.ticks_us(), int(seconds * 1000000))
+        while time.ticks_diff(end, time.ticks_us()) > 0:
+            wait = self.step()
+            if wait > 0:
+                time.sleep_us(min(wait, time.ticks_diff(end, time.ticks_us())))
+
+    # ======================
+    # Report
+    # ======================
+
+    def elapsed_us(self):
+        return time.ticks_diff(time.ticks_us(), self.started) if self.started is not None else 0
+
+    def rate(self, d):
+        """Samples a second d got so far"""
+        elapsed = self.elapsed_us()
+        return d.samples * 1000000 / elapsed if elapsed else 0.0
+
+    def utilization(self, d=None):
+        """Share of the time the bus was in use, by d or by anyone"""
+        elapsed = self.elapsed_us()
+        busy = self.busy_us if d is None else d.busy_us
+        return busy / elapsed if elapsed else 0.0
+
+    def report(self):
+        lines = ["device   target Hz  got Hz  skipped  max late ms    bus"]
+        for d in self.devices:
+            lines.append("%-8s %9.1f %7.1f %8d %12.1f %5.1f%%" % (
+                d.name, d.rate_hz, self.rate(d), d.skipped, d.max_late_us / 1000,
+                self.utilization(d) * 100))
+        lines.append("bus in use %.0f%% of %.1f s" % (self.utilization() * 100,
+                                                     self.elapsed_us() / 1000000))
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+# i2c_scheduler_check.py (CPython)
+# The soil sensor and the IMU on one I2C bus, simulated: fake_i2c.py's
+# seesaw and ICM-20948 behind a bus that takes as long as the real one per
+# transaction, on upy_shim.py's virtual clock, so a minute of bus traffic
+# runs in a few seconds and comes out the same every time.
+#   - today's way, a loop draining the IMU's FIFO every 20 ms that reads
+#     the soil sensor with the blocking burst (SoilSampler.read()) when a
+#     sample is due: the FIFO overflows during every burst
+#   - i2c_scheduler.py with the same targets: every IMU sample arrives and
+#     both devices get their rate
+#   - a soil rate the sensor can't keep up with: the soil device reports
+#     the shortfall, the IMU (higher priority) doesn't notice
+#   - bus speed against IMU rate: the reported bus use shows when the FIFO
+#     records alone fill the bus
+#
+#   python testing/i2c_scheduler_check.py
+
+import os
+import sys
+import time
+from array import array
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+from fake_i2c import FakeI2C, ICM20948 as FakeIMU, Seesaw
+from i2c_scheduler import Call, I2CScheduler
+from icm20948 import BURST, ICM20948, RECORD, VALUES
+from soil_sampler import Q_FAULT, SoilSampler
+from stemma_soil_sensor import StemmaSoilSensor
+
+SECONDS = 60.0
+BUS_HZ = 400000
+IMU_HZ = 562
+DRAIN_HZ = 50
+SOIL_HZ = 2
+
+
+class Rig:
+    """Both devices on a timed fake bus, on a fresh virtual clock"""
+
+    def __init__(self, bus_hz=BUS_HZ, imu_hz=IMU_HZ):
+        self.clock = upy_shim.virtual_time()
+        self.bus = FakeI2C(freq=bus_hz, timing=True, devices={
+            0x36: Seesaw(moisture=700, noise=2.0, seed=1),
+            0x69: FakeIMU()})
+        self.imu = ICM20948(self.bus, rate_hz=imu_hz)
+        self.sampler = SoilSampler(StemmaSoilSensor(self.bus))
+        self.out = array("h", [0] * (BURST * VALUES))
+        self.soil = 0
+        self.faults = 0
+        self.imu.reset_fifo()
+        self.start_us = time.ticks_us()
+        self.busy_start = self.bus.busy_us
+
+    def drain(self):
+        self.imu.read_into(self.out)
+
+    def soil_done(self, device=None, ticks=None):
+        self.soil += 1
+        if self.sampler.flags & Q_FAULT:
+            self.faults += 1
+
+    def seconds(self):
+        return (time.ticks_us() - self.start_us) / 1000000
+
+    def imu_share(self):
+        """IMU samples read out of those the chip took, the ones still in the FIFO count"""
+        waiting = self.imu.fifo_count() // RECORD
+        return (self.imu.samples + waiting) / int(self.seconds() * self.imu.rate_hz)
+
+    def bus_use(self):
+        return (self.bus.busy_us - self.busy_start) / (self.seconds() * 1000000)
+
+
+def run_blocking():
+    rig = Rig()
+    drain_us = 1000000 // DRAIN_HZ
+    soil_us = 1000000 // SOIL_HZ
+    next_drain = next_soil = time.ticks_us()
+    end = next_drain + int(SECONDS * 1000000)
+    while time.ticks_us() < end:
+        rig.drain()
+        next_drain += drain_us
+        if time.ticks_us() >= next_soil:
+            rig.sampler.read()
+            rig.soil_done()
+            next_soil += soil_us
+        time.sleep_us(next_drain - time.ticks_us())
+    return rig
+
+
+def run_scheduled(soil_hz=SOIL_HZ, bus_hz=BUS_HZ, imu_hz=IMU_HZ, drain_hz=DRAIN_HZ, seconds=SECONDS):
+    rig = Rig(bus_hz, imu_hz)
+    sched = I2CScheduler()
+    imu = sched.add("imu", Call(rig.drain), drain_hz, priority=1)
+    soil = sched.add("soil", rig.sampler, soil_hz, on_sample=rig.soil_done)
+    sched.run_for(seconds)
+    return rig, sched, imu, soil
+
+
+def check_blocking_against_scheduled():
+    blocking = run_blocking()
+    assert blocking.imu.overflows >= SECONDS * SOIL_HZ * 0.9, blocking.imu.overflows
+    rig, sched, imu, soil = run_scheduled()
+    print(sched.report())
+    assert rig.imu.overflows == 0 and rig.imu_share() > 0.999, (rig.imu.overflows, rig.imu_share())
+    assert abs(sched.rate(imu) - DRAIN_HZ) < 0.1 and abs(sched.rate(soil) - SOIL_HZ) < 0.05
+    assert rig.faults == 0 and soil.skipped == 0
+    # what the scheduler counted is what the bus model spent
+    assert abs(sched.utilization() - rig.bus_use()) < 0.01
+    print(f"{SECONDS:.0f} s, soil every {1000 // SOIL_HZ} ms, IMU drained every {1000 // DRAIN_HZ} ms:")
+    print("                   IMU samples kept  FIFO overflows  soil Hz  bus use")
+    for name, r in (("blocking reads", blocking), ("scheduler", rig)):
+        print(f"  {name:15}  {r.imu_share():16.1%}  {r.imu.overflows:14d}  "
+              f"{r.soil / r.seconds():7.2f}  {r.bus_use():7.0%}")
+
+
+def check_overload():
+    rig, sched, imu, soil = run_scheduled(soil_hz=20, seconds=10.0)
+    assert rig.imu.overflows == 0 and rig.imu_share() > 0.999
+    assert soil.skipped > 0 and sched.rate(soil) < 20
+    print(f"soil at 20 Hz: {sched.rate(soil):.1f} Hz achieved, {soil.skipped} releases skipped, "
+          f"IMU still {rig.imu_share():.1%} of its samples")
+
+
+def check_bus_speeds():
+    print("bus kHz  IMU Hz  drains/s  bus use  IMU samples kept")
+    for bus_hz, imu_hz in ((100000, 225), (100000, 562), (400000, 562), (400000, 1125)):
+        # about half a FIFO per drain
+        drain_hz = max(DRAIN_HZ, imu_hz // 11)
+        rig, sched, imu, soil = run_scheduled(bus_hz=bus_hz, imu_hz=imu_hz, drain_hz=drain_hz,
+                                              seconds=10.0)
+        print(f"  {bus_hz // 1000:5d}  {rig.imu.rate_hz:6.1f}  {drain_hz:8d}  "
+              f"{sched.utilization():7.0%}  {rig.imu_share():16.1%}")
+        if bus_hz == 100000 and imu_hz == 225:
+            assert rig.imu.overflows == 0 and sched.utilization() < 0.6
+        if bus_hz == 100000 and imu_hz == 562:
+            # 562.5 records of 22 bytes a second are more than 100 kHz carries
+            assert rig.imu_share() < 0.95 and sched.utilization() > 0.9
+
+
+if __name__ == "__main__":
+    wall = time.perf_counter()
+    check_blocking_against_scheduled()
+    check_overload()
+    check_bus_speeds()
+    upy_shim.real_time()
+    print(f"simulated in {time.perf_counter() - wall:.1f} s")
+    print("ok")
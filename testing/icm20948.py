@@ -0,0 +1,305 @@
+# icm20948.py (MicroPython, also runs on CPython with upy_shim.py)
+# Driver for the Adafruit ICM-20948 9-DoF IMU (accelerometer, gyroscope,
+# AK09916 magnetometer) that the dashboard's imu.csv is laid out for (see
+# dashboard/makeimucsv.py, its simulator).
+#
+#   imu = ICM20948(I2C(0, scl=Pin(1), sda=Pin(0), freq=400000))
+#   out = array("h", [0] * (BURST * VALUES))
+#   n = imu.read_into(out)     # every 20 ms or so: n samples, VALUES each
+#
+# Samples aren't read one register block at a time: the chip samples on its
+# own clock (562.5 Hz by default) into its hardware FIFO, the magnetometer
+# read along by the chip's own I2C master, and read_into() empties the FIFO
+# in one burst into a buffer allocated here, then decodes the bytes by hand
+# into the caller's array, like stemma_soil_sensor.py, so a read doesn't
+# allocate. Two bus transactions per burst (count, data) instead of two per
+# sample, and sample timing that doesn't depend on when the Pico gets
+# around to reading. A FIFO record is 22 bytes, about 0.5 ms of a 400 kHz
+# bus, so 562.5 Hz keeps the bus under a third busy.
+#
+# The FIFO holds 23 records, 41 ms at 562.5 Hz. A read that comes later
+# than that finds it overflowed, with records overwritten part way: the
+# FIFO is reset, the samples in it dropped and counted in overflows.
+
+import time
+
+import micropython
+
+_ADDR = const(0x69)  # Adafruit breakout, 0x68 with the AD0 jumper closed
+_MAG_ADDR = const(0x0C)
+
+# bank 0
+_WHO_AM_I = const(0x00)
+_USER_CTRL = const(0x03)
+_PWR_MGMT_1 = const(0x06)
+_PWR_MGMT_2 = const(0x07)
+_I2C_MST_STATUS = const(0x17)
+_ACCEL_XOUT_H = const(0x2D)
+_FIFO_EN_1 = const(0x66)
+_FIFO_EN_2 = const(0x67)
+_FIFO_RST = const(0x68)
+_FIFO_MODE = const(0x69)
+_FIFO_COUNTH = const(0x70)
+_FIFO_R_W = const(0x72)
+_REG_BANK_SEL = const(0x7F)  # in every bank
+# bank 2
+_GYRO_SMPLRT_DIV = const(0x00)
+_GYRO_CONFIG_1 = const(0x01)
+_ODR_ALIGN_EN = const(0x09)
+_ACCEL_SMPLRT_DIV_1 = const(0x10)
+_ACCEL_CONFIG = const(0x14)
+# bank 3, the chip's I2C master
+_I2C_MST_ODR_CONFIG = const(0x00)
+_I2C_MST_CTRL = const(0x01)
+_I2C_SLV0_ADDR = const(0x03)
+_I2C_SLV4_ADDR = const(0x13)
+
+# AK09916
+_MAG_WIA2 = const(0x01)
+_MAG_HXL = const(0x11)
+_MAG_CNTL2 = const(0x31)
+_MAG_CNTL3 = const(0x32)
+
+_WHO_AM_I_CODE = const(0xEA)
+_MAG_ID = const(0x09)
+_DEVICE_RESET = const(0x80)
+_CLK_AUTO = const(0x01)
+_I2C_MST_EN = const(0x20)
+_FIFO_ON = const(0x40)
+_SLV4_DONE = const(0x40)
+_SLV4_NACK = const(0x10)
+_MAG_100HZ = const(0x08)
+_MAG_HOFL = const(0x08)
+
+BASE_RATE_HZ = 1125
+FIFO_SIZE = 512
+# accel xyz, gyro xyz, temp (big-endian), then what the I2C master read
+# off the magnetometer: HXL .. HZH (little-endian), TMPS, ST2
+RECORD = 22
+BURST = FIFO_SIZE // RECORD
+# values per sample in read_into()'s array: ax ay az gx gy gz temp mx my mz
+VALUES = 10
+# mx, my, mz of a sample where the magnetometer overflowed (HOFL)
+MAG_OVERFLOW = -0x8000
+
+# full scale ranges, FS_SEL = index
+ACCEL_RANGES_G = (2, 4, 8, 16)
+GYRO_RANGES_DPS = (250, 500, 1000, 2000)
+
+GRAVITY = 9.80665
+MAG_UT = 0.15       # uT per count
+TEMP_LSB = 333.87   # counts per degC, 0 is 21 degC
+
+
+class ICM20948:
+    """Driver for the ICM-20948 IMU over I2C, sampling through its FIFO
+       :param I2C i2c: I2C bus, 400 kHz for rates above 200 Hz or so.
+       :param int addr: I2C address, 0x69 on the Adafruit breakout.
+       :param int rate_hz: sample rate, rounded to 1125 / (1 + div) Hz.
+       :param int accel_fs: accelerometer range, index into ACCEL_RANGES_G.
+       :param int gyro_fs: gyroscope range, index into GYRO_RANGES_DPS.
+       Setting up resets the chip and blocks for about 100 ms."""
+    def __init__(self, i2c, addr=_ADDR, rate_hz=562, accel_fs=1, gyro_fs=1):
+        self.i2c = i2c
+        self.addr = addr
+        div = int(BASE_RATE_HZ / rate_hz + 0.5) - 1
+        self.div = min(max(div, 0), 255)
+        self.rate_hz = BASE_RATE_HZ / (1 + self.div)
+        self.accel_fs = accel_fs
+        self.gyro_fs = gyro_fs
+        # m/s2, deg/s per count
+        self.accel_scale = ACCEL_RANGES_G[accel_fs] * GRAVITY / 32768
+        self.gyro_scale = GYRO_RANGES_DPS[gyro_fs] / 32768
+        self.overflows = 0
+        self.samples = 0
+        self._bank = -1
+        self._buf1 = bytearray(1)
+        self._buf2 = bytearray(2)
+        self._reg = bytearray(2)
+        self._raw = bytearray(BURST * RECORD)
+        mv = memoryview(self._raw)
+        # the burst buffer for every record count, slicing allocates
+        self._bursts = [mv[:k * RECORD] for k in range(BURST + 1)]
+        self.setup()
+
+    # ======================
+    # Registers
+    # ======================
+
+    def _select_bank(self, bank):
+        if bank != self._bank:
+            self._write(_REG_BANK_SEL, bank << 4)
+            self._bank = bank
+
+    def _write(self, reg, value):
+        self._reg[0] = reg
+        self._reg[1] = value
+        self.i2c.writeto(self.addr, self._reg)
+
+    def _read8(self, reg):
+        self.i2c.readfrom_mem_into(self.addr, reg, self._buf1)
+        return self._buf1[0]
+
+    def _mag_io(self, reg, value=None):
+        """One magnetometer register through the chip's I2C master, slave 4"""
+        self._select_bank(3)
+        if value is None:
+            self._write(_I2C_SLV4_ADDR, 0x80 | _MAG_ADDR)
+        else:
+            self._write(_I2C_SLV4_ADDR, _MAG_ADDR)
+            self._write(_I2C_SLV4_ADDR + 3, value)  # I2C_SLV4_DO
+        self._write(_I2C_SLV4_ADDR + 1, reg)        # I2C_SLV4_REG
+        self._write(_I2C_SLV4_ADDR + 2, 0x80)       # I2C_SLV4_CTRL: go
+        self._select_bank(0)
+        for _ in range(20):
+            status = self._read8(_I2C_MST_STATUS)
+            if status & _SLV4_NACK:
+                break
+            if status & _SLV4_DONE:
+                if value is not None:
+                    return value
+                self._select_bank(3)
+                value = self._read8(_I2C_SLV4_ADDR + 4)  # I2C_SLV4_DI
+                self._select_bank(0)
+                return value
+            time.sleep_ms(1)
+        raise OSError("ICM-20948: no answer from the magnetometer")
+
+    # ======================
+    # Setup
+    # ======================
+
+    def setup(self):
+        """Reset the chip, configure it and start the FIFO"""
+        self._bank = -1
+        self._select_bank(0)
+        self._write(_PWR_MGMT_1, _DEVICE_RESET)
+        time.sleep_ms(10)
+        for _ in range(10):
+            if not self._read8(_PWR_MGMT_1) & _DEVICE_RESET:
+                break
+            time.sleep_ms(10)
+        self._bank = -1
+        self._select_bank(0)
+        chip_id = self._read8(_WHO_AM_I)
+        if chip_id != _WHO_AM_I_CODE:
+            raise RuntimeError("ICM-20948 WHO_AM_I returned (0x{:x}), expected 0x{:x}. "
+                               "Please check your wiring.".format(chip_id, _WHO_AM_I_CODE))
+        self._write(_PWR_MGMT_1, _CLK_AUTO)
+        self._write(_PWR_MGMT_2, 0x00)  # every axis on
+        time.sleep_ms(20)
+
+        # sample rate and ranges, DLPF_CFG 1: 152 Hz (gyro) and 246 Hz
+        # (accel) bandwidth, under half of 562.5 Hz
+        self._select_bank(2)
+        self._write(_ODR_ALIGN_EN, 1)
+        self._write(_GYRO_SMPLRT_DIV, self.div)
+        self._write(_GYRO_CONFIG_1, 1 << 3 | self.gyro_fs << 1 | 1)
+        self._write(_ACCEL_SMPLRT_DIV_1, self.div >> 8)
+        self._write(_ACCEL_SMPLRT_DIV_1 + 1, self.div & 0xFF)
+        self._write(_ACCEL_CONFIG, 1 << 3 | self.accel_fs << 1 | 1)
+
+        # the I2C master reads the magnetometer at 137 Hz, above its 100 Hz
+        self._select_bank(0)
+        self._write(_USER_CTRL, _I2C_MST_EN)
+        self._select_bank(3)
+        self._write(_I2C_MST_CTRL, 0x17)  # 345.6 kHz, stop between reads
+        self._write(_I2C_MST_ODR_CONFIG, 3)
+        self._mag_io(_MAG_CNTL3, 1)  # soft reset
+        time.sleep_ms(10)
+        mag_id = self._mag_io(_MAG_WIA2)
+        if mag_id != _MAG_ID:
+            raise RuntimeError("AK09916 id returned (0x{:x}), expected 0x{:x}"
+                               .format(mag_id, _MAG_ID))
+        self._mag_io(_MAG_CNTL2, _MAG_100HZ)
+        # slave 0: HXL .. ST2 into the FIFO with every sample, reading ST2
+        # lets the magnetometer update the data registers again
+        self._select_bank(3)
+        self._write(_I2C_SLV0_ADDR, 0x80 | _MAG_ADDR)
+        self._write(_I2C_SLV0_ADDR + 1, _MAG_HXL)
+        self._write(_I2C_SLV0_ADDR + 2, 0x80 | 8)
+
+        self._select_bank(0)
+        self._write(_FIFO_EN_1, 0x01)  # slave 0
+        self._write(_FIFO_EN_2, 0x1F)  # accel, gyro x y z, temp
+        self._write(_FIFO_MODE, 0)     # stream: overwrite when full
+        self.reset_fifo()
+        self._write(_USER_CTRL, _I2C_MST_EN | _FIFO_ON)
+
+    def reset_fifo(self):
+        self._select_bank(0)
+        self._write(_FIFO_RST, 0x1F)
+        self._write(_FIFO_RST, 0x00)
+
+    # ======================
+    # Reading
+    # ======================
+
+    def fifo_count(self):
+        """Bytes in the FIFO"""
+        self._select_bank(0)
+        buf = self._buf2
+        self.i2c.readfrom_mem_into(self.addr, _FIFO_COUNTH, buf)
+        return (buf[0] & 0x1F) << 8 | buf[1]
+
+    def read_into(self, out, at=0):
+        """
+        Burst-read the whole samples in the FIFO into out (array "h") from
+        sample at on, VALUES counts per sample; out needs room for BURST of
+        them. Returns the number of samples, the last one is the newest.
+        """
+        count = self.fifo_count()
+        if count > BURST * RECORD:
+            # full, and the next record was written over the oldest
+            self.reset_fifo()
+            self.overflows += 1
+            return 0
+        n = count // RECORD
+        if n == 0:
+            return 0
+        self.i2c.readfrom_mem_into(self.addr, _FIFO_R_W, self._bursts[n])
+        self._unpack(out, n, at)
+        self.samples += n
+        return n
+
+    @micropython.native
+    def _unpack(self, out, n, at):
+        raw = self._raw
+        i = 0
+        j = at * VALUES
+        for _ in range(n):
+            for _ in range(7):
+                v = raw[i] << 8 | raw[i + 1]
+                out[j] = v - 0x10000 if v & 0x8000 else v
+                i += 2
+                j += 1
+            if raw[i + 7] & _MAG_HOFL:
+                out[j] = out[j + 1] = out[j + 2] = MAG_OVERFLOW
+                j += 3
+            else:
+                for k in range(0, 6, 2):
+                    v = raw[i + k] | raw[i + k + 1] << 8
+                    out[j] = v - 0x10000 if v & 0x8000 else v
+                    j += 1
+            i += 8
+
+    def read_registers(self, out, at=0):
+        """One sample straight from the data registers, without the FIFO"""
+        self._select_bank(0)
+        self.i2c.readfrom_mem_into(self.addr, _ACCEL_XOUT_H, self._bursts[1])
+        self._unpack(out, 1, at)
+
+    def values(self, out, i):
+        """
+        Sample i of out in the units of imu.csv: (ax, ay, az) m/s2, (gx, gy,
+        gz) deg/s, (mx, my, mz) uT or None, temperature degC. Allocates.
+        """
+        j = i * VALUES
+        a = self.accel_scale
+        g = self.gyro_scale
+        mag = None
+        if out[j + 7] != MAG_OVERFLOW:
+            mag = (out[j + 7] * MAG_UT, out[j + 8] * MAG_UT, out[j + 9] * MAG_UT)
+        return ((out[j] * a, out[j + 1] * a, out[j + 2] * a),
+                (out[j + 3] * g, out[j + 4] * g, out[j + 5] * g),
+                mag, out[j + 6] / TEMP_LSB + 21)
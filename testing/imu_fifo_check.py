@@ -0,0 +1,190 @@
+# imu_fifo_check.py (CPython, or MicroPython on a Pico with the IMU)
+# The ICM-20948 driver (icm20948.py) reading its FIFO in bursts, against
+# reading the data registers once per sample:
+#   - setting up the chip and the magnetometer behind it, and the units
+#   - FIFO bursts every DRAIN_MS for a few seconds: every sample arrives,
+#     none twice, at 562.5 Hz, and the bus transactions, bus time and CPU
+#     time per sample
+#   - the same with a register read per sample at the same rate, timed by
+#     the Pico's sleeps rather than the chip's clock
+#   - a read that comes too late finds the FIFO overflowed, resets it and
+#     carries on
+#
+# On CPython the fake bus (fake_i2c.ICM20948) samples a motion whose gyro x
+# counts the samples, so a gap or a repeat shows; the CPU time includes
+# the fake chip's, bus time is worked out from the bytes. On the Pico the
+# real chip is read for a few seconds and gc.mem_alloc() is watched around
+# it.
+#
+#   python testing/imu_fifo_check.py
+#   mpremote run testing/imu_fifo_check.py   (icm20948.py on the Pico)
+
+import sys
+import time
+from array import array
+
+SECONDS = 3.0
+DRAIN_MS = 20
+I2C_HZ = 400000
+
+if sys.implementation.name == "micropython":
+    import gc
+    from machine import I2C, Pin
+    from icm20948 import BURST, ICM20948, VALUES
+
+    imu = ICM20948(I2C(0, scl=Pin(1), sda=Pin(0), freq=I2C_HZ))
+    out = array("h", [0] * (BURST * VALUES))
+    imu.read_into(out)
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    start = time.ticks_ms()
+    n = 0
+    while time.ticks_diff(time.ticks_ms(), start) < SECONDS * 1000:
+        n += imu.read_into(out)
+        time.sleep_ms(DRAIN_MS)
+    used = gc.mem_alloc() - before
+    gc.enable()
+    print("%d samples in %.1f s (%.1f Hz), %d overflows, %d bytes allocated"
+          % (n, SECONDS, n / SECONDS, imu.overflows, used))
+    print(imu.values(out, 0))
+    sys.exit()
+
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import icm20948
+from fake_i2c import FakeI2C, ICM20948 as FakeIMU
+from icm20948 import BURST, ICM20948, VALUES
+
+COUNT_DPS = 1.0   # gyro x goes up by this per sample
+COUNT_WRAP = 400  # and wraps, the +-500 deg/s range
+
+
+def counting(rate):
+    def motion(t):
+        k = int(round(t * rate)) % COUNT_WRAP
+        return (0.1, -0.2, 1.0), (k * COUNT_DPS, 5.0, -5.0), (20.0, -5.0, 40.0), 30.0
+    return motion
+
+
+def sample_number(out, i, imu):
+    return int(round(out[i * VALUES + 3] * imu.gyro_scale / COUNT_DPS))
+
+
+def setup():
+    fake = FakeIMU()
+    bus = FakeI2C(devices={0x69: fake})
+    imu = ICM20948(bus)
+    fake.motion = counting(imu.rate_hz)
+    return imu, bus, fake
+
+
+def check_setup():
+    imu, bus, fake = setup()
+    assert imu.rate_hz == 562.5 and fake.rate() == 562.5
+    assert fake.mag.regs[0x31] == 0x08, "magnetometer not at 100 Hz"
+    out = array("h", [0] * (BURST * VALUES))
+    time.sleep(0.01)
+    n = imu.read_into(out)
+    accel, gyro, mag, temp_c = imu.values(out, n - 1)
+    assert abs(accel[2] - icm20948.GRAVITY) < 0.01 and abs(accel[1] + 0.2 * icm20948.GRAVITY) < 0.01
+    assert abs(gyro[1] - 5.0) < 0.02 and all(abs(a - b) < 0.1 for a, b in zip(mag, (20, -5, 40)))
+    assert abs(temp_c - 30.0) < 0.01
+    print(f"setup: {bus.writes} writes, {bus.reads} reads, {imu.rate_hz} Hz, "
+          f"accel {accel[2]:.3f} m/s2, mag {mag[0]:.2f} uT, {temp_c:.2f} degC")
+
+
+def bus_time(bus, writes, reads, nbytes):
+    # every transaction is a start, the address byte, its bytes and a stop
+    # (9 bits a byte with the ack)
+    transactions = bus.writes - writes + bus.reads - reads
+    return (bus.bytes - nbytes + transactions) * 9 / I2C_HZ, transactions
+
+
+def check_continuity(seen):
+    steps = [(b - a) % COUNT_WRAP for a, b in zip(seen, seen[1:])]
+    missed = sum(s - 1 for s in steps if s > 1)
+    repeated = steps.count(0)
+    return missed, repeated
+
+
+def run_fifo():
+    imu, bus, fake = setup()
+    out = array("h", [0] * (BURST * VALUES))
+    imu.reset_fifo()
+    marks = bus.writes, bus.reads, bus.bytes
+    seen = []
+    cpu = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        time.sleep(DRAIN_MS / 1000)
+        c = time.thread_time()
+        n = imu.read_into(out)
+        cpu += time.thread_time() - c
+        seen += [sample_number(out, i, imu) for i in range(n)]
+    elapsed = time.perf_counter() - start
+    busy, transactions = bus_time(bus, *marks)
+    missed, repeated = check_continuity(seen)
+    assert imu.overflows == 0 and missed == 0 and repeated == 0, (imu.overflows, missed, repeated)
+    assert len(seen) / elapsed >= 500, len(seen) / elapsed
+    return len(seen) / elapsed, transactions / len(seen), busy / elapsed, cpu / len(seen), missed, repeated
+
+
+def run_registers():
+    """One register read per sample, paced by sleeps"""
+    imu, bus, fake = setup()
+    out = array("h", [0] * VALUES)
+    marks = bus.writes, bus.reads, bus.bytes
+    seen = []
+    cpu = 0.0
+    period = 1 / imu.rate_hz
+    start = next_at = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        next_at += period
+        c = time.thread_time()
+        imu.read_registers(out)
+        cpu += time.thread_time() - c
+        seen.append(sample_number(out, 0, imu))
+        wait = next_at - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+    elapsed = time.perf_counter() - start
+    busy, transactions = bus_time(bus, *marks)
+    missed, repeated = check_continuity(seen)
+    return ((len(seen) - repeated) / elapsed, transactions / len(seen), busy / elapsed,
+            cpu / len(seen), missed, repeated)
+
+
+def check_overflow():
+    imu, bus, fake = setup()
+    out = array("h", [0] * (BURST * VALUES))
+    imu.reset_fifo()
+    time.sleep(0.1)  # 56 samples, the FIFO holds 23
+    assert imu.read_into(out) == 0 and imu.overflows == 1
+    seen = []
+    for _ in range(10):
+        time.sleep(DRAIN_MS / 1000)
+        n = imu.read_into(out)
+        seen += [sample_number(out, i, imu) for i in range(n)]
+    assert imu.overflows == 1 and check_continuity(seen) == (0, 0)
+    print(f"overflow: a read after 100 ms resets the FIFO, {len(seen)} samples in order after it")
+
+
+if __name__ == "__main__":
+    check_setup()
+    fifo = run_fifo()
+    regs = run_registers()
+    check_overflow()
+    print(f"{SECONDS:.0f} s at {icm20948.BASE_RATE_HZ / 2} Hz     samples/s  transactions/sample  "
+          f"bus busy  CPU us/sample  missed  repeated")
+    for name, (rate, tps, busy, cpu, missed, repeated) in (
+            (f"FIFO every {DRAIN_MS} ms ", fifo), ("register reads     ", regs)):
+        print(f"  {name}   {rate:9.1f}  {tps:19.2f}  {busy:7.0%}  {cpu * 1e6:13.1f}  "
+              f"{missed:6d}  {repeated:8d}")
+    print("ok")
@@ -0,0 +1,80 @@
+# kinematics_check.py (CPython)
+# The forward kinematics of kinematics.py against the MATLAB scripts it was
+# ported from (testing/matlab), and against the gaits motion.py sends:
+#   - sidewinding_sim2.m's three stage shapes, the numbers its formulas give,
+#     and planar_chain() drawing stage 1 and 3 from joint angles
+#   - the joints serpentine waves are yaw joints in axes_from_horizontal()
+#   - sample_gait() at an explicit phase gives the same angles whenever it
+#     is called, and matches serpentine_joint_angles() up to the rounding
+#
+#   python testing/kinematics_check.py
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import kinematics
+import motion
+
+L = kinematics.LINK_LENGTH
+
+
+def check_stages():
+    stage1, stage2, stage3 = kinematics.sidewinding_stages()
+    # pt2 = [2L sin(-5pi/4), 2L cos(-5pi/4)], pt3 and pt4 on from there
+    d = 2 * L * math.sqrt(0.5)
+    assert np.allclose(stage1, [[0, 0], [d, -d], [2 * d, 0], [3 * d, -d]]), stage1
+    # stage 2 pulls link 2 level and brings pt1 back onto the y axis
+    assert np.allclose(stage2[1], [2 * d - 2 * L, 0]) and np.allclose(stage2[0], [0, d])
+    assert np.allclose(stage2[2:], stage1[2:])
+    assert np.allclose(stage3, stage1 + [0, d])
+
+    # the same shapes out of the chain: the .m angles are from the y axis,
+    # headings here are from the x axis, so heading = pi/2 - angle
+    headings = [math.pi / 2 + 5 * math.pi / 4, math.pi / 2 + 7 * math.pi / 4, math.pi / 2 + 5 * math.pi / 4]
+    joints = np.diff(headings)[None, :]
+    points = kinematics.planar_chain(joints, 2 * L, heading0=headings[0])[0]
+    assert np.allclose(points, stage1), points
+    assert np.allclose(points + [0, d], stage3)
+    print(f"stages: sidewinding_sim2.m's shapes, planar_chain() draws stage 1 and 3 from joint angles")
+
+
+def check_axes():
+    axes = kinematics.axes_from_horizontal(motion.horizontal)
+    gait = motion.gait_library.get("serpentine")
+    swings = np.ptp(kinematics.sample_gait(gait, np.linspace(0, 2 * math.pi / gait.omega, 50)), axis=0) > 0
+    assert [a == "yaw" for a in axes] == list(swings), (axes, swings)
+    print(f"axes: {axes}, yaw on the joints serpentine waves")
+
+
+def check_sample_phase():
+    gait = motion.gait_library.get("serpentine")
+    times = np.linspace(0, 3, 61)
+    first = kinematics.sample_gait(gait, times, theta0=0.3)
+    time.sleep(0.05)
+    assert np.array_equal(first, kinematics.sample_gait(gait, times, theta0=0.3))
+
+    p = motion.params.snapshot()
+    waving = [j for j, h in enumerate(motion.horizontal) if not h]
+    joints = kinematics.servo_to_joint(first, motion.calibration)[:, waving]
+    # serpentine waves joints 0, 2, 4 with joint * beta, the lag between
+    # waving joints is 2 * beta
+    expected = kinematics.serpentine_joint_angles(
+        times + 0.3 / p["omega"], math.radians(p["alpha"]), p["omega"], 2 * p["beta"], len(waving),
+        math.radians(p["gamma"]))
+    worst = np.degrees(np.abs(joints - expected)).max()
+    assert worst <= 0.5 + 1e-9, worst
+    print(f"sample_gait: the same angles on every call at theta0=0.3, within {worst:.2f} deg "
+          f"(the rounding) of serpentine_joint_angles")
+
+
+if __name__ == "__main__":
+    check_stages()
+    check_axes()
+    check_sample_phase()
+    print("ok")
@@ -0,0 +1,58 @@
+# metrics_check.py (CPython)
+# The ground station metrics (metrics.py):
+#   - a counter bumped from several threads at once keeps every increment,
+#     threads that come and go included, and /metrics renders the total
+#   - what an increment costs, it runs in the 100 Hz gait loop
+#
+#   python testing/metrics_check.py
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import metrics
+
+THREADS = 8
+INCREMENTS = 100000
+INC_BUDGET_US = 2.0
+
+
+def check_threads():
+    counter = metrics.Counter("snake_check_total", "Check counter")
+    start = threading.Barrier(THREADS)
+
+    def bump(n):
+        start.wait()
+        for _ in range(INCREMENTS):
+            counter.inc(n)
+
+    # two rounds, the second one's threads may reuse the first one's idents
+    for _ in range(2):
+        threads = [threading.Thread(target=bump, args=(i % 2 + 1,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    expected = 2 * INCREMENTS * sum(i % 2 + 1 for i in range(THREADS))
+    assert counter.value == expected, (counter.value, expected)
+    assert counter.render()[-1] == f"snake_check_total {expected}"
+    print(f"threads: {THREADS} threads x {INCREMENTS} increments twice, none lost")
+
+
+def bench_inc(n=200000):
+    counter = metrics.Counter("snake_bench_total", "Bench counter")
+    t0 = time.perf_counter()
+    for _ in range(n):
+        counter.inc()
+    per_inc = (time.perf_counter() - t0) / n * 1e6
+    assert per_inc < INC_BUDGET_US, f"{per_inc:.3f} us per inc"
+    print(f"bench: {per_inc:.3f} us per inc")
+
+
+if __name__ == "__main__":
+    check_threads()
+    bench_inc()
+    print("ok")
@@ -1,30 +1,54 @@
-import serial
-import csv
-from datetime import datetime
+import asyncio
+import os
+import sys
 
-ser = serial.Serial('/dev/ttyACM1', 115200)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import log_store
+import serial_ingest
 
-csv_file = "soil_data.csv"
+# Logs the soil samples of sensor Picos on USB serial to the dashboard's
+# live.csv (log_store.py), see serial_ingest.py. Give the ports to read:
+#
+#   python testing/pi_sensor.py /dev/ttyACM1 /dev/ttyACM2
 
-# Create file with header if needed
-try:
-    open(csv_file, "x").write("timestamp,moisture,temperature\n")
-except FileExistsError:
-    pass
+ports = sys.argv[1:] or ['/dev/ttyACM1']
+
+REPORT_S = 5.0
+
+
+async def main(store):
+    ingest = serial_ingest.SerialIngest(ports, store, baud=115200)
+    live = ingest.subscribe()
+    latest = {}
+
+    async def keep_latest():
+        while True:
+            port, samples = await live.get()
+            latest[port] = samples[-1]
 
-while True:
-    line = ser.readline().decode().strip()
-    if not line:
-        print("No data received, retrying...")
-        continue
+    async def show():
+        # the newest sample of every port, and how the ports are doing
+        while True:
+            await asyncio.sleep(REPORT_S)
+            for port, s in latest.items():
+                print("Logged:", port, s.moisture, s.temp_c)
+            print(ingest.report())
+
+    tasks = [asyncio.create_task(keep_latest()), asyncio.create_task(show())]
     try:
-        moisture, temp = line.split(",")
-    except ValueError:
-        print("Malformed line:", line)
-        continue
+        await ingest.run()
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
-    with open(csv_file, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([datetime.now(), moisture, temp])
+try:
+    store = log_store.LogStore()
+except (OSError, ValueError) as e:
+    # e.g. a live.csv from dashboard/makesencsv.py, which has fewer columns
+    sys.exit(f"can't log the samples: {e}")
 
-    print("Logged:", moisture, temp)
\ No newline at end of file
+try:
+    asyncio.run(main(store))
+except KeyboardInterrupt:
+    pass
@@ -1,7 +1,11 @@
-import serial, time, math
+import os, sys, time, math
 
-# Open serial connection to Pico
-ser = serial.Serial('/dev/ttyACM1', 115200)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import transport
+
+# Open serial connection to Pico, writes happen on the transport's own thread
+# so a slow port can't hold up the loop below
+link = transport.SerialTransport('/dev/ttyACM1', 115200).connect()
 
 # Calibration offsets for each servo
 calibration = [0, -20, 0, -30, 0, 0]  # calibration for all motors
@@ -50,7 +54,5 @@ while True:
         theta[joint] = max(0, min(180, servo_angle))
 
     # Servo target angles
-    message = ",".join(map(str, theta)) + "\r\n"
-    ser.write(message.encode("utf-8"))
-    print(message)
+    link.send(transport.encode_frame(theta))
     time.sleep(0.05)
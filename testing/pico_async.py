@@ -0,0 +1,439 @@
+# pico_async.py (MicroPython)
+# uasyncio firmware for either Pico, so one board can drive servos and read
+# the soil sensor at the same time instead of blocking in client.recv().
+# Copy it to the Pico as main.py, together with picozero.py, pico_net.py,
+# pico_discovery.py, seesaw.py, stemma_soil_sensor.py, soil_sampler.py and
+# pico_stream.py, and set the constants below for the board.
+#
+# Tasks:
+#   server     any number of ground station connections (asyncio.start_server)
+#   servos     writes the joint state at most every SERVO_MS, however fast frames come
+#   sensor     a burst of soil sensor readings every SAMPLE_MS (soil_sampler.py),
+#              pushes the cleaned sample to subscribers
+#   telemetry  the T report of telemetry.py to every client sending frames, each REPORT_MS
+#   network    keeps the Wi-Fi up and announces the board (pico_net.py, pico_discovery.py)
+#
+# The protocol is the motor Pico's (transport.py): frames "seq:a,b,c" and
+# deltas "seq:~j=v", "!S,angles" / "!R". The sensor Pico's one-angle lines
+# (motion.socket_to_motor) are frames for its single servo. Added here:
+#   +sensor   subscribe this connection to samples
+#             "M,ticks_ms,moisture,temp_c,flags,kept,n,spread": the mean of the
+#             kept readings out of n, flags the Q_* bits of soil_sampler.py (0 is
+#             clean), spread the robust standard deviation in counts. moisture
+#             and temp_c are empty when there was no usable reading.
+#   ?         reply with the latest sample once
+#   +stream[,boot,seq]
+#             send this connection the samples as binary batches instead
+#             (pico_stream.py, format in sensor_stream.py on the ground
+#             station), every BATCH_N samples or BATCH_MS. Samples of this
+#             boot from seq on that were taken before the connection, all of
+#             them without seq, are backfilled alongside from the ring.
+#   +ack,boot,seq   the ground station has every sample below seq
+#
+# Runs unchanged on CPython with testing/upy_shim.py, see async_firmware_check.py.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import gc
+from time import ticks_ms, ticks_us, ticks_diff
+
+from machine import Pin, PWM, I2C
+from soil_sampler import SoilSampler, Q_FAULT
+from pico_stream import SampleRing, BATCH_N, BACKFILL_N, BACKFILL
+
+# which board this is
+ROLE = "motor"
+PORT = 8080
+SERVO_PINS = [0, 1, 2, 3, 4, 5]
+# (i2c id, scl pin, sda pin) of the soil sensor, None without one.
+# The sensor Pico: ROLE = "sensor", SERVO_PINS = [27], SENSOR_I2C = (0, 1, 0)
+SENSOR_I2C = None
+
+SERVO_MS = 20     # one PWM period, writing faster changes nothing
+SAMPLE_MS = 1000
+REPORT_MS = 1000
+BATCH_MS = 5000   # longest a sample waits for its batch to fill up
+STREAM_MS = 100   # batches go out at most this often, one backfill batch each time
+NET_MS = 50       # Wi-Fi and announcement polling
+
+# wifi credentials
+ssid = 'OLIN-DEVICES'
+password = 'BestOval4Engineers!'
+# (ip, netmask, gateway, dns) skips DHCP on every (re)connect, None for DHCP
+STATIC = None
+
+
+def angle_to_duty(angle):
+    # Map 0–180° to duty cycle (adjust for your servos)
+    # servo specific range (min = 0, max = 180)
+    mini_range = 1000
+    max_range = 2600
+    # convert angle to pulse width
+    p_width = mini_range + (max_range - mini_range) * angle/180
+    # convert pulse width to duty_u16
+    duty = int(p_width * 65535/20000)
+    return duty
+
+
+class Servos:
+    def __init__(self, pins):
+        self.pwm = [PWM(Pin(p)) for p in pins]
+        for s in self.pwm:
+            s.freq(50)  # Standard servo frequency
+        # last full state of the joints, delta frames are applied on top of it
+        self.state = [90.0] * len(pins)
+        self.written = [None] * len(pins)
+        self.changed = asyncio.Event()
+        # ticks_us the newest unwritten frame arrived, and how many are waiting
+        self.received = 0
+        self.pending = 0
+
+    def set_state(self, body):
+        # "a,b,c" keyframe or "~j=v,j=v" delta, see transport.py
+        if body.startswith(b"~"):
+            for item in body[1:].split(b","):
+                j, v = item.split(b"=")
+                self.state[int(j)] = float(v)
+        else:
+            for j, x in enumerate(body.split(b",")):
+                self.state[j] = float(x)
+
+    def write(self):
+        # only touch the servos whose angle actually changed
+        for j in range(len(self.pwm)):
+            if self.state[j] != self.written[j]:
+                self.pwm[j].duty_u16(angle_to_duty(self.state[j]))
+                self.written[j] = self.state[j]
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.buffer = b""
+        self.subscribed = False
+        self.streaming = False
+        # next sample to stream live, and the backfill still to send
+        self.live = 0
+        self.backfill = 0
+        self.backfill_end = 0
+        self.last_seq = 0
+        self.frames = 0
+        self.parse_errors = 0
+
+    async def flush(self):
+        try:
+            await self.writer.drain()
+        except OSError:
+            pass
+
+
+class Firmware:
+    def __init__(self, servo_pins=SERVO_PINS, sensor=None):
+        self.servos = Servos(servo_pins)
+        self.sensor = sensor
+        self.sampler = SoilSampler(sensor) if sensor is not None else None
+        self.ring = SampleRing(self.sampler.n_moisture) if sensor is not None else None
+        self.clients = []
+        # set by a !S stop command, frames are ignored until !R
+        self.stopped = False
+        self.sample = None
+        self.sample_errors = 0
+        self.applied_at = ticks_us()
+        # since the last report
+        self.skipped = 0
+        self.lat_sum = self.lat_max = self.lat_n = 0
+        self.loop_sum = self.loop_max = self.loops = 0
+
+    # ======================
+    # Network server
+    # ======================
+
+    async def serve(self, reader, writer):
+        c = Client(writer)
+        self.clients.append(c)
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                received = ticks_us()
+                self.handle(c, data, received)
+                loop = ticks_diff(ticks_us(), received)
+                self.loops += 1
+                self.loop_sum += loop
+                self.loop_max = max(self.loop_max, loop)
+                await c.flush()
+        except OSError:
+            pass
+        finally:
+            self.clients.remove(c)
+            writer.close()
+
+    def handle(self, c, data, received):
+        c.buffer += data
+        lines = c.buffer.split(b"\n")
+        c.buffer = lines.pop()
+
+        # priority commands win over every frame that arrived before them
+        for i in range(len(lines) - 1, -1, -1):
+            line = lines[i].strip()
+            if line.startswith(b"!"):
+                try:
+                    self.priority(line)
+                except Exception as e:
+                    c.parse_errors += 1
+                    print("Parse error:", e, line)
+                lines = lines[i + 1:]
+                break
+
+        count = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(b"!"):
+                continue
+            if line == b"+sensor":
+                c.subscribed = True
+                continue
+            if line.startswith(b"+stream") or line.startswith(b"+ack,"):
+                try:
+                    self.stream_command(c, line)
+                except Exception as e:
+                    c.parse_errors += 1
+                    print("Parse error:", e, line)
+                continue
+            if line == b"?":
+                if self.sample:
+                    c.writer.write(self.sample)
+                continue
+            if self.stopped:
+                continue
+            try:
+                # "seq:body", the sequence number is optional
+                seq = 0
+                if b":" in line:
+                    seq, line = line.split(b":", 1)
+                    seq = int(seq)
+                self.servos.set_state(line)
+            except Exception as e:
+                c.parse_errors += 1
+                print("Parse error:", e, line)
+                continue
+            count += 1
+            c.frames += 1
+            if seq:
+                c.last_seq = seq
+
+        if count:
+            # the servo task writes the newest state, frames it never wrote
+            # were skipped
+            self.skipped += self.servos.pending + count - 1
+            self.servos.pending = 1
+            self.servos.received = received
+            self.servos.changed.set()
+
+    def priority(self, line):
+        if line.startswith(b"!S"):
+            # straight to the servos, not through the servo task
+            self.stopped = True
+            self.servos.pending = 0
+            self.servos.set_state(line[3:])
+            self.servos.write()
+            self.applied_at = ticks_us()
+        elif line == b"!R":
+            self.stopped = False
+
+    # ======================
+    # Servos
+    # ======================
+
+    async def servo_task(self):
+        servos = self.servos
+        while True:
+            await servos.changed.wait()
+            servos.changed.clear()
+            if not servos.pending:
+                continue  # a stop came in and wrote them already
+            servos.write()
+            servos.pending = 0
+            self.applied_at = ticks_us()
+            lat = ticks_diff(self.applied_at, servos.received)
+            self.lat_n += 1
+            self.lat_sum += lat
+            self.lat_max = max(self.lat_max, lat)
+            await asyncio.sleep(SERVO_MS / 1000)
+
+    # ======================
+    # Soil sensor
+    # ======================
+
+    async def _collect(self, wait_ms, poll):
+        # split-phase read: the chip converts while the other tasks run
+        while True:
+            await asyncio.sleep(wait_ms / 1000)
+            value = poll()
+            if value is not None:
+                return value
+            wait_ms = self.sensor.ready_in_ms() or 1
+
+    async def sensor_task(self):
+        sensor = self.sensor
+        sampler = self.sampler
+        try:
+            await self._collect(sensor.start_reset(), lambda: sensor.poll_reset() or None)
+        except (OSError, RuntimeError) as e:
+            print("Sensor not found:", e)
+            return
+        next_at = ticks_ms()
+        while True:
+            # the sampler catches bus errors itself, they end up in the flags
+            await self._collect(sampler.start(), lambda: sampler.poll() or None)
+            if sampler.flags & Q_FAULT:
+                self.sample_errors += 1
+            now = ticks_ms()
+            self.sample = sampler.record(now)
+            self.ring.add(now, sampler)
+            for c in self.clients:
+                if c.subscribed:
+                    c.writer.write(self.sample)
+            for c in self.clients:
+                if c.subscribed:
+                    await c.flush()
+            # keep to the schedule, a slow read doesn't push the next one back
+            next_at += SAMPLE_MS
+            wait = ticks_diff(next_at, ticks_ms())
+            if wait < 0:
+                next_at = ticks_ms()
+                wait = 0
+            await asyncio.sleep(wait / 1000)
+
+    # ======================
+    # Sample stream
+    # ======================
+
+    def stream_command(self, c, line):
+        ring = self.ring
+        if ring is None:
+            return
+        parts = line.split(b",")
+        same_boot = len(parts) == 3 and int(parts[1]) == ring.boot
+        if parts[0] == b"+ack":
+            if same_boot:
+                ring.ack(int(parts[2]))
+            return
+        c.streaming = True
+        c.live = c.backfill_end = ring.seq
+        # what the ground station already has, everything kept if it has
+        # nothing of this boot
+        c.backfill = int(parts[2]) if same_boot else 0
+        if same_boot:
+            ring.ack(c.backfill)
+
+    async def stream_task(self):
+        ring = self.ring
+        while True:
+            await asyncio.sleep(STREAM_MS / 1000)
+            now = ticks_ms()
+            streaming = False
+            for c in self.clients:
+                if not c.streaming:
+                    continue
+                streaming = True
+                live = ring.first(c.live)
+                if live < ring.seq and (ring.seq - live >= BATCH_N or live < ring.oldest()
+                                        or ring.age(live, now) + STREAM_MS > BATCH_MS):
+                    data, c.live = ring.batch(live, BATCH_N, now)
+                    c.writer.write(data)
+                # the backfill shares the link with the live samples, a
+                # batch at a time, so new samples are never held up by it
+                if c.backfill < c.backfill_end:
+                    seq = ring.first(c.backfill)
+                    if seq >= c.backfill_end:
+                        c.backfill = c.backfill_end
+                    else:
+                        data, c.backfill = ring.batch(
+                            seq, min(BACKFILL_N, c.backfill_end - seq), now, BACKFILL)
+                        c.writer.write(data)
+            if streaming:
+                for c in self.clients:
+                    if c.streaming:
+                        await c.flush()
+
+    # ======================
+    # Telemetry
+    # ======================
+
+    def report(self, c):
+        # format documented in telemetry.py on the ground station
+        return ("T,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d\r\n" % (
+            c.last_seq, c.frames, self.skipped,
+            self.lat_sum // self.lat_n if self.lat_n else 0, self.lat_max,
+            self.loop_sum // self.loops if self.loops else 0, self.loop_max,
+            ticks_diff(ticks_us(), self.applied_at), gc.mem_free(), c.parse_errors)).encode()
+
+    async def telemetry_task(self):
+        while True:
+            await asyncio.sleep(REPORT_MS / 1000)
+            senders = [c for c in self.clients if c.frames or c.parse_errors]
+            for c in senders:
+                c.writer.write(self.report(c))
+            self.skipped = 0
+            self.lat_sum = self.lat_max = self.lat_n = 0
+            self.loop_sum = self.loop_max = self.loops = 0
+            for c in senders:
+                await c.flush()
+
+    # ======================
+    # Wi-Fi and discovery
+    # ======================
+
+    async def network_task(self, net, announcer):
+        was_down = False
+        while True:
+            if net is not None and not net.poll():
+                was_down = True
+            elif announcer is not None:
+                if was_down:
+                    was_down = False
+                    announcer.restart()
+                announcer.poll()
+            await asyncio.sleep(NET_MS / 1000)
+
+    async def run(self, port=PORT, net=None, announcer=None):
+        # listens on every interface, nothing to rebind when the address changes
+        await asyncio.start_server(self.serve, "0.0.0.0", port)
+        tasks = [asyncio.create_task(self.servo_task()),
+                 asyncio.create_task(self.telemetry_task())]
+        if self.sensor is not None:
+            tasks.append(asyncio.create_task(self.sensor_task()))
+            tasks.append(asyncio.create_task(self.stream_task()))
+        if net is not None or announcer is not None:
+            tasks.append(asyncio.create_task(self.network_task(net, announcer)))
+        print("Serving on port", port)
+        while True:
+            await asyncio.sleep(3600)
+
+
+def make_sensor():
+    if SENSOR_I2C is None:
+        return None
+    from stemma_soil_sensor import StemmaSoilSensor
+    i2c_id, scl, sda = SENSOR_I2C
+    # reset by sensor_task() without blocking
+    return StemmaSoilSensor(I2C(i2c_id, scl=Pin(scl), sda=Pin(sda), freq=100000), addr=0x36,
+                            reset=False)
+
+
+if __name__ == "__main__":
+    from pico_discovery import Announcer, FW_VERSION
+    from pico_net import Net
+
+    net = Net(ssid, password, STATIC, fw=FW_VERSION)
+    net.connect()
+    sensor = make_sensor()
+    caps = ["frames", "seq", "delta", "stop", "telemetry", "multi"]
+    if sensor is not None:
+        caps += ["sensor", "stream"]
+    announcer = Announcer(ROLE, PORT, caps)
+    asyncio.run(Firmware(SERVO_PINS, sensor).run(PORT, net, announcer))
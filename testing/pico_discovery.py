@@ -0,0 +1,78 @@
+# pico_discovery.py (MicroPython)
+# Pico side of the discovery protocol in discovery.py on the ground station.
+# Copy it to the Pico next to picozero.py. After the Wi-Fi is up:
+#
+#   announcer = Announcer("motor", 8080, ["frames", "delta"])
+#   ...
+#   announcer.poll()   # call often, never blocks
+#
+# It announces a burst right away (so a rebooted Pico is found within
+# milliseconds), then every INTERVAL_MS, and answers probes immediately.
+
+import json
+import os
+import socket
+from time import ticks_ms, ticks_diff
+
+import machine
+
+DISCOVERY_PORT = 8089
+BROADCAST = "255.255.255.255"
+PROTOCOL = 1
+FW_VERSION = "0.5"
+
+BURST_MS = (0, 50, 100, 200, 400, 800, 1600)
+INTERVAL_MS = 2000
+
+
+def _hex(b):
+    return "".join("%02x" % x for x in b)
+
+
+class Announcer:
+    def __init__(self, role, port, caps=(), fw=FW_VERSION):
+        self.role = role
+        msg = {"sss": PROTOCOL, "role": role, "fw": fw, "port": port, "caps": list(caps),
+               "id": _hex(machine.unique_id()), "boot": _hex(os.urandom(4))}
+        # built once, poll() must not allocate in the motor loop
+        self.message = json.dumps(msg).encode()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        except (OSError, AttributeError):
+            pass  # older ports broadcast without it
+        self.sock.bind(("0.0.0.0", DISCOVERY_PORT))
+        self.sock.setblocking(False)
+        self.start = ticks_ms()
+        self.burst = 0
+        self.last = self.start
+
+    def announce(self, addr=(BROADCAST, DISCOVERY_PORT)):
+        try:
+            self.sock.sendto(self.message, addr)
+        except OSError:
+            pass
+
+    def poll(self):
+        now = ticks_ms()
+        if self.burst < len(BURST_MS):
+            if ticks_diff(now, self.start) >= BURST_MS[self.burst]:
+                self.burst += 1
+                self.last = now
+                self.announce()
+        elif ticks_diff(now, self.last) >= INTERVAL_MS:
+            self.last = now
+            self.announce()
+
+        # answer probes straight away
+        try:
+            data, addr = self.sock.recvfrom(128)
+        except OSError:
+            return
+        if b'"probe"' in data and (b'"*"' in data or self.role.encode() in data):
+            self.announce((addr[0], DISCOVERY_PORT))
+
+    def restart(self):
+        """Announce a fresh burst, e.g. after the Wi-Fi came back"""
+        self.start = ticks_ms()
+        self.burst = 0
@@ -0,0 +1,227 @@
+# pico_dual_core.py (MicroPython)
+# Variant of pico_wifi_motor.py that uses both RP2040 cores: one receives
+# and parses frames, the other writes the servos every SERVO_MS from a
+# double buffer (pico_handoff.py), so bursty Wi-Fi no longer turns into
+# bursty servo motion. Same protocol and telemetry as pico_wifi_motor.py,
+# without the trajectory and gait table uploads.
+#
+# The cyw43 Wi-Fi driver and lwIP are serviced on core 0, so by default the
+# network loop stays there and actuation runs on core 1. NETWORK_ON_CORE1
+# swaps them.
+
+from machine import Pin, PWM
+from array import array
+import _thread
+import errno
+import gc
+from time import sleep_ms, ticks_ms, ticks_us, ticks_add, ticks_diff
+from pico_discovery import Announcer, FW_VERSION
+from pico_handoff import Handoff
+from pico_net import Net
+
+# wifi credentials
+ssid = 'OLIN-DEVICES'
+password = 'BestOval4Engineers!'
+# (ip, netmask, gateway, dns) skips DHCP on every (re)connect, None for DHCP
+STATIC = None
+
+NETWORK_ON_CORE1 = False
+SERVO_MS = 20  # one PWM period
+REPORT_MS = 1000
+
+net = Net(ssid, password, STATIC, fw=FW_VERSION)
+
+def angle_to_duty(angle):
+    # Map 0–180° to duty cycle (adjust for your servos)
+    # servo specific range (min = 0, max = 180)
+    mini_range = 1000
+    max_range = 2600
+    # convert angle to pulse width
+    p_width = mini_range + (max_range - mini_range) * angle/180
+    # convert pulse width to duty_u16
+    duty = int(p_width * 65535/20000)
+    return duty
+
+# Setup 6 servos on GPIO pins
+pins = [0, 1, 2, 3, 4, 5]
+servos = [PWM(Pin(p)) for p in pins]
+for s in servos:
+    s.freq(50)  # Standard servo frequency
+
+handoff = Handoff(len(servos))
+
+# ======================
+# Actuation core
+# ======================
+
+# written by the actuation loop only, read by the network loop for reports
+applied_at = ticks_us()
+applied = 0
+lat_sum = lat_max = 0
+# the network loop bumps this after reading the window maxima
+report_gen = 0
+
+def actuation_loop():
+    global applied_at, applied, lat_sum, lat_max
+    target = array("f", [90.0] * len(servos))
+    written = [None] * len(servos)
+    gen = report_gen
+    next_tick = ticks_ms()
+    while True:
+        meta = handoff.take(target)
+        if meta is not None:
+            for j in range(len(servos)):
+                if target[j] != written[j]:
+                    servos[j].duty_u16(angle_to_duty(target[j]))
+                    written[j] = target[j]
+            now = ticks_us()
+            if gen != report_gen:
+                gen = report_gen
+                lat_max = 0
+            lat = ticks_diff(now, meta[1])
+            applied_at = now
+            applied += 1
+            lat_sum += lat
+            lat_max = max(lat_max, lat)
+
+        # fixed cadence: sleep to the next tick, don't drift when one is late
+        next_tick = ticks_add(next_tick, SERVO_MS)
+        wait = ticks_diff(next_tick, ticks_ms())
+        if wait > 0:
+            sleep_ms(wait)
+        else:
+            next_tick = ticks_ms()
+
+# ======================
+# Network core
+# ======================
+
+announcer = Announcer("motor", 8080, ["frames", "seq", "delta", "stop", "telemetry"])
+
+def set_state(buf, body):
+    # "a,b,c" keyframe or "~j=v,j=v" delta, see transport.py
+    if body.startswith(b"~"):
+        for item in body[1:].split(b","):
+            j, v = item.split(b"=")
+            buf[int(j)] = float(v)
+    else:
+        for j, x in enumerate(body.split(b",")):
+            buf[j] = float(x)
+
+def network_loop():
+    global report_gen
+    net.connect()
+    net.listen(8080)
+    # set by a !S stop command, frames are ignored until !R
+    stopped = False
+    while True:
+        client, addr = net.accept(announcer)
+        print('Client connected from', addr)
+        client.settimeout(REPORT_MS / 1000)
+        buffer = b""
+        last_seq = 0
+        skipped = parse_errors = 0
+        replaced = handoff.replaced
+        applied_start = applied
+        lat_start = (lat_sum, applied)
+        loop_sum = loop_max = loops = 0
+        last_report = ticks_ms()
+
+        while True:
+            try:
+                data = client.recv(1024)
+            except OSError as e:
+                if e.args[0] != errno.ETIMEDOUT:
+                    print("Client lost:", e)
+                    break
+                data = None  # timed out, nothing arrived
+            if data == b"":
+                print("Client disconnected")
+                break
+            announcer.poll()
+
+            if data:
+                received = ticks_us()
+                buffer += data
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+
+                # priority commands win over every frame before them
+                for i in range(len(lines) - 1, -1, -1):
+                    line = lines[i].strip()
+                    if line.startswith(b"!"):
+                        try:
+                            if line.startswith(b"!S"):
+                                stopped = True
+                                set_state(handoff.back(), line[3:])
+                                handoff.publish(last_seq, received)
+                            elif line == b"!R":
+                                stopped = False
+                        except Exception as e:
+                            parse_errors += 1
+                            print("Parse error:", e, line)
+                        lines = lines[i + 1:]
+                        break
+
+                count = 0
+                if not stopped:
+                    buf = handoff.back()
+                    for line in lines:
+                        line = line.strip()
+                        if not line or line.startswith(b"!") or line.startswith(b"@"):
+                            continue
+                        try:
+                            seq = 0
+                            if b":" in line:
+                                seq, line = line.split(b":", 1)
+                                seq = int(seq)
+                            set_state(buf, line)
+                        except Exception as e:
+                            parse_errors += 1
+                            print("Parse error:", e, line)
+                            continue
+                        count += 1
+                        if seq:
+                            last_seq = seq
+                    if count:
+                        skipped += count - 1
+                        handoff.publish(last_seq, received)
+
+                loop = ticks_diff(ticks_us(), received)
+                loops += 1
+                loop_sum += loop
+                loop_max = max(loop_max, loop)
+
+            if ticks_diff(ticks_ms(), last_report) >= REPORT_MS:
+                last_report = ticks_ms()
+                if not net.poll():
+                    print("Wi-Fi lost")
+                    break
+                # format documented in telemetry.py on the ground station
+                n = applied - lat_start[1]
+                report = "T,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d\r\n" % (
+                    last_seq, applied - applied_start,
+                    skipped + handoff.replaced - replaced,
+                    (lat_sum - lat_start[0]) // n if n else 0, lat_max,
+                    loop_sum // loops if loops else 0, loop_max,
+                    ticks_diff(ticks_us(), applied_at), gc.mem_free(), parse_errors)
+                report_gen += 1
+                lat_start = (lat_sum, applied)
+                skipped = 0
+                replaced = handoff.replaced
+                loop_sum = loop_max = loops = 0
+                try:
+                    client.send(report.encode())
+                except OSError:
+                    pass
+
+        client.close()
+        print("Socket closed")
+
+
+if NETWORK_ON_CORE1:
+    _thread.start_new_thread(network_loop, ())
+    actuation_loop()
+else:
+    _thread.start_new_thread(actuation_loop, ())
+    network_loop()
@@ -0,0 +1,75 @@
+# pico_handoff.py (MicroPython, also runs on CPython)
+# Hands joint frames from the network core to the actuation core of the
+# RP2040, see pico_dual_core.py. Lock-protected double buffer:
+#
+#   network core                      actuation core (every SERVO_MS)
+#   buf = h.back()                    if h.take(target):
+#   ... parse the frame into buf ...      write target to the servos
+#   h.publish(seq, received)
+#
+# The writer fills the back buffer without the lock and only takes it to
+# swap the two, the reader copies the front buffer under the lock (a few
+# floats), so neither side waits for the other for more than that copy.
+# Frames published between two take()s replace each other, the servos only
+# ever see the newest one. Tested on CPython by testing/handoff_check.py.
+
+from array import array
+import _thread
+
+
+class Handoff:
+    def __init__(self, joints, initial=90.0):
+        self.joints = joints
+        self._bufs = [array("f", [initial] * joints), array("f", [initial] * joints)]
+        self._back = 0  # only the writer changes this, under the lock
+        self._lock = _thread.allocate_lock()
+        self._fresh = False
+        # what the newest published frame was, read together with it
+        self.seq = 0
+        self.received = 0
+        # counters for telemetry
+        self.published = 0
+        self.taken = 0
+        self.replaced = 0
+
+    def back(self):
+        """Buffer to fill with the next frame, writer side only"""
+        return self._bufs[self._back]
+
+    def publish(self, seq=0, received=0):
+        """Make the back buffer the newest frame, writer side only"""
+        lock = self._lock
+        lock.acquire()
+        if self._fresh:
+            self.replaced += 1
+        self._back ^= 1
+        self._fresh = True
+        self.seq = seq
+        self.received = received
+        self.published += 1
+        lock.release()
+        # deltas build on the frame just published: start the new back
+        # buffer from it. The reader only ever copies the other buffer.
+        front = self._bufs[self._back ^ 1]
+        back = self._bufs[self._back]
+        for j in range(self.joints):
+            back[j] = front[j]
+
+    def take(self, out):
+        """
+        Copy the newest frame into out if one was published since the last
+        take(). Returns (seq, received) of it, None if nothing new.
+        """
+        lock = self._lock
+        lock.acquire()
+        if not self._fresh:
+            lock.release()
+            return None
+        front = self._bufs[self._back ^ 1]
+        for j in range(self.joints):
+            out[j] = front[j]
+        self._fresh = False
+        self.taken += 1
+        meta = (self.seq, self.received)
+        lock.release()
+        return meta
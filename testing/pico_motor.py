@@ -20,22 +20,35 @@ def angle_to_duty(angle):
     duty = int(p_width * 65535/20000)
     return duty
 
+# set by a !S stop command, frames are ignored until !R (see transport.py)
+stopped = False
+
+def parse_angles(tokens):
+    angles = []
+    for x in tokens:
+        if x:  # skip empty strings
+            angles.append(float(x))
+    return angles
+
 while True:
     line = input() #sys.stdin.readline()  # Read from USB serial
-    print("Raw:", repr(line))
     if not line:
         continue
     try:
-        tokens = line.strip().split(",")
-        #angles = [float(x) for x in line.strip().split(",")] # may change to int
-        angles = []
-        for x in tokens:
-            if x:  # skip empty strings
-                angles.append(float(x))
+        line = line.strip()
+        if line.startswith("!"):
+            if line.startswith("!S"):
+                stopped = True
+                angles = parse_angles(line[3:].split(","))
+            else:
+                stopped = False
+                continue
+        elif stopped:
+            continue
+        else:
+            # drop the optional "seq:" prefix, there is no back-channel over USB
+            angles = parse_angles(line.split(":")[-1].split(","))
         for servo, angle in zip(servos, angles):
-            duty = angle_to_duty(angle)
-            print("Angle:", angle, "Duty:", duty)
-            servo.duty_u16(duty)
-            #servo.duty_u16(angle_to_duty(angle))
+            servo.duty_u16(angle_to_duty(angle))
     except Exception as e:
         print("Parse error:", e, line)
\ No newline at end of file
@@ -0,0 +1,200 @@
+# pico_net.py (MicroPython)
+# Wi-Fi for the Picos that comes back by itself. Copy it to the Pico next to
+# picozero.py and pico_discovery.py.
+#
+#   net = Net(ssid, password, static=("192.168.34.119", "255.255.252.0",
+#                                     "192.168.32.1", "192.168.32.1"))
+#   ip = net.connect()   # blocks until the first connection
+#   net.listen(8080)
+#   client, addr = net.accept(announcer)   # keeps the link up meanwhile
+#   ...
+#   if not net.poll():   # call often, only blocks for a scan
+#       ...              # link is down, reconnecting in the background
+#
+# The access point that worked last time (BSSID and channel) is cached in
+# CACHE_FILE, so after a reboot or a dropped link the Pico associates with
+# it straight away instead of scanning. With a static address there is no
+# DHCP round either. Only when the cached AP doesn't answer within FAST_MS
+# does it fall back to a scan over every AP with our SSID.
+#
+# Every (re)connect is printed and appended to LOG_FILE as
+#   fw,event,path,ms
+# (event boot/reconnect, path cached/scan, ms from losing the link or from
+# power-up to having an address) so it can be compared across firmware versions.
+
+import json
+import os
+import socket
+import sys
+from time import sleep, ticks_ms, ticks_diff
+
+import network
+import rp2
+from picozero import pico_led
+
+CACHE_FILE = "wifi.json"
+LOG_FILE = "net_log.csv"
+LOG_MAX = 4096  # bytes, the log is rotated to LOG_FILE + ".old" after that
+FAST_MS = 3000  # give the cached AP this long before scanning
+RETRY_MS = 10000  # then scan again this often while the link stays down
+ACCEPT_S = 0.1  # accept() timeout, the link and the announcer are polled in between
+
+
+def _hex(b):
+    return "".join("%02x" % x for x in b)
+
+
+def log(fw, event, path, ms):
+    print("wifi %s (%s) in %d ms" % (event, path, ms))
+    try:
+        if os.stat(LOG_FILE)[6] > LOG_MAX:
+            os.rename(LOG_FILE, LOG_FILE + ".old")
+    except OSError:
+        pass
+    try:
+        with open(LOG_FILE, "a") as f:
+            f.write("%s,%s,%s,%d\n" % (fw, event, path, ms))
+    except OSError:
+        pass
+
+
+class Net:
+    def __init__(self, ssid, password, static=None, fw=""):
+        self.ssid = ssid
+        self.password = password
+        # (ip, netmask, gateway, dns) or None for DHCP
+        self.static = static
+        self.fw = fw
+        self.wlan = network.WLAN(network.STA_IF)
+        self.bssid = None
+        self.channel = None
+        self.ip = None
+        self.up = False
+        self.down_at = 0
+        self.attempt_at = 0
+        self.path = None
+        self.port = None
+        self.server = None
+        # the address self.server is bound to
+        self._bound = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(CACHE_FILE) as f:
+                cache = json.load(f)
+            if cache.get("ssid") == self.ssid:
+                self.bssid = bytes(int(cache["bssid"][i:i + 2], 16) for i in range(0, 12, 2))
+                self.channel = cache.get("channel")
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        try:
+            with open(CACHE_FILE, "w") as f:
+                json.dump({"ssid": self.ssid, "bssid": _hex(self.bssid),
+                           "channel": self.channel}, f)
+        except OSError:
+            pass
+
+    def _start(self, cached):
+        """Start associating, returns right away"""
+        self.wlan.active(True)
+        if self.static:
+            self.wlan.ifconfig(self.static)
+        if cached and self.bssid:
+            self.path = "cached"
+            self.wlan.connect(self.ssid, self.password, bssid=self.bssid)
+        else:
+            # strongest AP with our SSID, remembered for next time
+            self.path = "scan"
+            best = None
+            for ssid, bssid, channel, rssi, _, _ in self.wlan.scan():
+                if ssid.decode() == self.ssid and (best is None or rssi > best[2]):
+                    best = (bssid, channel, rssi)
+            if best is None:
+                self.wlan.connect(self.ssid, self.password)
+            else:
+                if best[0] != self.bssid:
+                    self.bssid, self.channel = best[0], best[1]
+                    self._save()
+                self.wlan.connect(self.ssid, self.password, bssid=self.bssid)
+        self.attempt_at = ticks_ms()
+        print('Waiting for connection (%s)...' % self.path)
+
+    def _connected(self, event, since):
+        self.up = True
+        self.ip = self.wlan.ifconfig()[0]
+        pico_led.on()
+        log(self.fw, event, self.path, ticks_diff(ticks_ms(), since))
+
+    def connect(self):
+        """First connection after power-up, blinks the LED while waiting"""
+        start = ticks_ms()
+        self._start(cached=True)
+        while not self.wlan.isconnected():
+            if rp2.bootsel_button() == 1:
+                sys.exit()
+            if self.wlan.status() < 0 or ticks_diff(ticks_ms(), self.attempt_at) > (
+                    FAST_MS if self.path == "cached" else RETRY_MS):
+                self.wlan.disconnect()
+                self._start(cached=False)
+            pico_led.toggle()
+            sleep(0.1)
+        self._connected("boot", start)
+        print(f'Connected on {self.ip}')
+        return self.ip
+
+    def poll(self):
+        """True while the link is up, otherwise drives the reconnect along"""
+        if self.wlan.isconnected():
+            if not self.up:
+                self._connected("reconnect", self.down_at)
+            return True
+        now = ticks_ms()
+        if self.up:
+            # just lost it: straight back to the AP we know
+            self.up = False
+            self.down_at = now
+            pico_led.off()
+            self.wlan.disconnect()
+            self._start(cached=True)
+        elif self.wlan.status() < 0 or ticks_diff(now, self.attempt_at) > (
+                FAST_MS if self.path == "cached" else RETRY_MS):
+            self.wlan.disconnect()
+            self._start(cached=False)
+        return False
+
+    def listen(self, port):
+        """Listening socket on our address, call after connect()"""
+        self.port = port
+        self.server = socket.socket()
+        self.server.bind((self.ip, port))
+        self.server.listen(1)
+        self.server.settimeout(ACCEPT_S)
+        self._bound = self.ip
+
+    def accept(self, announcer=None):
+        """
+        Wait for a client, returns (client, addr). Keeps the Wi-Fi up while
+        nobody is connected and the announcer (pico_discovery.py) going; a
+        new address after a reconnect gets a new listening socket.
+        """
+        was_down = False
+        while True:
+            if not self.poll():
+                was_down = True
+                sleep(0.05)
+                continue
+            if was_down:
+                was_down = False
+                if announcer is not None:
+                    announcer.restart()
+                if self.ip != self._bound:
+                    self.server.close()
+                    self.listen(self.port)
+            try:
+                return self.server.accept()
+            except OSError:
+                if announcer is not None:
+                    announcer.poll()
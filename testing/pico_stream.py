@@ -0,0 +1,196 @@
+# pico_stream.py (MicroPython, also runs on CPython)
+# Keeps the soil samples of the sensor Pico and packs them into the binary
+# batches of sensor_stream.py on the ground station, which documents the
+# format. pico_async.py sends them to every "+stream" connection.
+#
+#   ring = SampleRing(sampler.n_moisture)
+#   ring.add(ticks_ms(), sampler)             # after every sample
+#   data, end = ring.batch(seq, count, ticks_ms())
+#
+# Every sample gets a sequence number counting up from boot and stays in a
+# RAM ring of the last RING_N samples, so a ground station that reconnects
+# after a Wi-Fi drop can ask for what it missed (a backfill). With
+# SPILL_FILE set, samples the ground station hasn't acknowledged that are
+# about to be overwritten go to flash instead of being lost, up to
+# SPILL_MAX of them. Adding a sample doesn't allocate (spilling aside);
+# batch() makes the bytes object that goes out.
+
+from array import array
+import os
+import ustruct
+from time import ticks_diff
+
+VERSION = 2
+# "SB", version, count, n, kind, boot, seq, age (sensor_stream.HEADER,
+# without the s code older MicroPython lacks)
+_HEADER = "<BBBBBBHII"
+_SAMPLE = "<HHhBBB"
+HEADER_SIZE = 16
+SAMPLE_SIZE = 9
+NO_MOISTURE = 0xFFFF
+NO_TEMP = -0x8000
+LIVE = 0
+BACKFILL = 1
+
+BATCH_N = 10       # samples per live batch
+BACKFILL_N = 50    # samples per backfill batch
+RING_N = 1000      # 11 kB, about 17 minutes at one sample a second
+SPILL_FILE = "samples.bin"
+SPILL_MAX = 20000  # 300 kB of flash
+
+# a spilled sample: seq, ticks, then the fields of _SAMPLE after dt
+_SPILL = "<IIHhBBB"
+_SPILL_SIZE = 15
+
+
+class SampleRing:
+    def __init__(self, n, size=RING_N, spill=SPILL_FILE):
+        self.n = n
+        self.size = size
+        # tells this boot's sequence numbers from the last one's
+        self.boot = ustruct.unpack("<H", os.urandom(2))[0]
+        self.ticks = array("L", [0] * size)
+        self.moisture = array("H", [0] * size)
+        self.temp = array("h", [0] * size)
+        self.meta = bytearray(3 * size)  # flags, kept, spread
+        # sequence number of the next sample
+        self.seq = 0
+        # everything below this has reached the ground station ("+ack")
+        self.acked = 0
+        self.buf = bytearray(HEADER_SIZE + BACKFILL_N * SAMPLE_SIZE)
+        self._mv = memoryview(self.buf)
+        # flash spill: samples spill_first .. spill_first + spilled - 1
+        self.spill = spill
+        self.spill_first = 0
+        self.spilled = 0
+        self.lost = 0  # unacknowledged samples neither RAM nor flash could keep
+        self._spill_rec = bytearray(_SPILL_SIZE)
+        self._spill_f = None
+        if spill:
+            try:
+                os.remove(spill)  # the last boot's, its sequence numbers are gone
+            except OSError:
+                pass
+
+    def oldest(self):
+        """Oldest sample still in RAM"""
+        return self.seq - self.size if self.seq > self.size else 0
+
+    def add(self, ticks, sampler):
+        """Keep the sampler's last sample, returns its sequence number"""
+        seq = self.seq
+        i = seq % self.size
+        if seq >= self.size and seq - self.size >= self.acked:
+            self._spill_out(seq - self.size, i)
+        m = sampler.moisture
+        t = sampler.temp_c
+        spread = int(sampler.spread * 4)
+        self.ticks[i] = ticks
+        self.moisture[i] = NO_MOISTURE if m is None else int(m * 16 + 0.5)
+        self.temp[i] = NO_TEMP if t is None else int(round(t * 100))
+        j = 3 * i
+        self.meta[j] = sampler.flags
+        self.meta[j + 1] = sampler.kept
+        self.meta[j + 2] = spread if spread < 255 else 255
+        self.seq = seq + 1
+        return seq
+
+    def ack(self, seq):
+        if self.acked < seq <= self.seq:
+            self.acked = seq
+            if self.spilled and seq >= self.spill_first + self.spilled:
+                self._spill_reset()
+
+    # ======================
+    # Flash spill
+    # ======================
+
+    def _spill_out(self, seq, i):
+        if not self.spill:
+            self.lost += 1
+            return
+        if self.spilled and seq != self.spill_first + self.spilled:
+            # the ack moved past what is on flash: start the file over
+            self._spill_reset()
+        if self.spilled >= SPILL_MAX:
+            self.lost += 1
+            return
+        try:
+            if self._spill_f is None:
+                self._spill_f = open(self.spill, "w+b")
+            j = 3 * i
+            ustruct.pack_into(_SPILL, self._spill_rec, 0, seq, self.ticks[i], self.moisture[i],
+                              self.temp[i], self.meta[j], self.meta[j + 1], self.meta[j + 2])
+            self._spill_f.seek(self.spilled * _SPILL_SIZE)
+            self._spill_f.write(self._spill_rec)
+        except OSError:
+            self.lost += 1
+            return
+        if not self.spilled:
+            self.spill_first = seq
+        self.spilled += 1
+
+    def _spill_reset(self):
+        self.spilled = 0
+        if self._spill_f is not None:
+            self._spill_f.close()
+            self._spill_f = None
+
+    def _spilled(self, seq):
+        # (ticks, moisture, temp, flags, kept, spread) of a sample on flash
+        f = self._spill_f
+        f.flush()
+        f.seek((seq - self.spill_first) * _SPILL_SIZE)
+        f.readinto(self._spill_rec)
+        return ustruct.unpack_from(_SPILL, self._spill_rec, 0)[1:]
+
+    # ======================
+    # Batches
+    # ======================
+
+    def first(self, seq):
+        """The first sample at or after seq that is still kept, RAM or flash"""
+        if self.spilled and seq < self.spill_first + self.spilled:
+            return seq if seq > self.spill_first else self.spill_first
+        oldest = self.oldest()
+        return seq if seq > oldest else oldest
+
+    def batch(self, seq, count, now, kind=LIVE):
+        """
+        Up to count samples from seq (which first() has to have returned) as
+        a batch, and the sequence number after its last sample
+        """
+        if count > BACKFILL_N:
+            count = BACKFILL_N
+        on_flash = self.spilled and seq < self.spill_first + self.spilled
+        if on_flash:
+            end = self.spill_first + self.spilled
+        else:
+            end = self.seq
+        if count > end - seq:
+            count = end - seq
+        buf = self.buf
+        off = HEADER_SIZE
+        first = prev = 0
+        for k in range(count):
+            if on_flash:
+                ticks, m, t, flags, kept, spread = self._spilled(seq + k)
+            else:
+                i = (seq + k) % self.size
+                j = 3 * i
+                ticks, m, t = self.ticks[i], self.moisture[i], self.temp[i]
+                flags, kept, spread = self.meta[j], self.meta[j + 1], self.meta[j + 2]
+            if k == 0:
+                first = prev = ticks
+            dt = ticks_diff(ticks, prev)
+            ustruct.pack_into(_SAMPLE, buf, off, dt if dt < 0xFFFF else 0xFFFF,
+                              m, t, flags, kept, spread)
+            prev = ticks
+            off += SAMPLE_SIZE
+        ustruct.pack_into(_HEADER, buf, 0, 0x53, 0x42, VERSION, count, self.n, kind,
+                          self.boot, seq, ticks_diff(now, first) if count else 0)
+        return bytes(self._mv[:off]), seq + count
+
+    def age(self, seq, now):
+        """ms since sample seq (in RAM) was taken"""
+        return ticks_diff(now, self.ticks[seq % self.size])
@@ -1,41 +1,20 @@
 from machine import Pin, PWM
-import sys
-import network
-import socket
-from time import sleep
+from array import array
+import errno
+import gc
+from time import ticks_ms, ticks_us, ticks_diff
 from picozero import pico_led
+from pico_discovery import Announcer, FW_VERSION
+from pico_net import Net
 import machine
-import rp2
 
 # wifi credentials
 ssid = 'OLIN-DEVICES'
 password = 'BestOval4Engineers!'
+# (ip, netmask, gateway, dns) skips DHCP on every (re)connect, None for DHCP
+STATIC = None
 
-def connect():
-    #Connect to WLAN
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(ssid, password)
-    while wlan.isconnected() == False:
-        if rp2.bootsel_button() == 1:
-            sys.exit()
-        print('Waiting for connection...')
-        pico_led.on()
-        sleep(0.5)
-        pico_led.off()
-        sleep(0.5)
-    ip = wlan.ifconfig()[0]
-    print(f'Connected on {ip}')
-    pico_led.on()
-    return ip
-
-def open_socket(ip):
-    # Open a socket
-    address = (ip, 8080)
-    connection = socket.socket()
-    connection.bind(address)
-    connection.listen(1)
-    return connection
+net = Net(ssid, password, STATIC, fw=FW_VERSION)
 
 def angle_to_duty(angle):
     # Map 0–180° to duty cycle (adjust for your servos)
@@ -51,9 +30,8 @@ def angle_to_duty(angle):
     return duty
 
 
-ip = connect()
-print(ip)
-connection = open_socket(ip)
+net.connect()
+net.listen(8080)
 
 # Setup 5 servos on GPIO pins
 pins = [0, 1, 2, 3, 4, 5]
@@ -61,36 +39,272 @@ servos = [PWM(Pin(p)) for p in pins]
 for s in servos:
     s.freq(50)  # Standard servo frequency
 
-client, addr = connection.accept()
-print('Client connected from', addr)
+# tell the ground station where we are (discovery.py), keep announcing while
+# waiting for it to connect
+announcer = Announcer("motor", 8080, ["frames", "seq", "delta", "stop", "telemetry", "traj", "wave"])
 
-buffer = b""
+# telemetry back-channel, format documented in telemetry.py on the ground station
+REPORT_MS = 1000
 
-while True:
-    data = client.recv(1024)
-    print("RAW:", data)
+# set by a !S stop command, frames are ignored until !R. Kept across
+# clients, a new gait sends !R first anyway
+stopped = False
+
+# last full state of the joints, delta frames are applied on top of it
+state = [90.0] * len(servos)
+written = [None] * len(servos)
+
+def write_servos():
+    # only touch the servos whose angle actually changed
+    for j in range(len(servos)):
+        if state[j] != written[j]:
+            servos[j].duty_u16(angle_to_duty(state[j]))
+            written[j] = state[j]
+
+def set_state(body):
+    # "a,b,c" keyframe or "~j=v,j=v" delta, see transport.py
+    if body.startswith(b"~"):
+        for item in body[1:].split(b","):
+            j, v = item.split(b"=")
+            state[int(j)] = float(v)
+    else:
+        for j, x in enumerate(body.split(b",")):
+            state[j] = float(x)
+
+# uploaded spline trajectory, see trajectory.py on the ground station.
+# Per joint a flat array of t0, dur, c0, c1, c2, c3 per segment (times in ms)
+TRAJ_MS = 20  # servo update rate while playing
+traj = None
+traj_pos = None
+traj_start = 0
+traj_end = 0
+playing = False
+last_step = 0
+
+# uploaded gait period table, see encode_upload() in gaits.py. One bytearray
+# of whole-degree angles per joint covering one period of the phase theta.
+TWO_PI = 6.283185307179586
+wave = None
+wave_size = 0
+wave_omega = 0.0
+wave_theta0 = 0.0
+# table being uploaded, swapped in on @W: (table, size, omega, theta0)
+wave_next = None
+# what play_step() plays, "traj" or "wave"
+mode = None
+
+def handle_upload(line):
+    global traj, traj_pos, traj_end, traj_start, playing, last_step, mode
+    global wave, wave_size, wave_omega, wave_theta0, wave_next
+    parts = line.split(b",")
+    if parts[0] == b"@P":
+        # a re-upload keeps the old table playing until its @W arrives
+        size = int(parts[2])
+        wave_next = ([bytearray(size) for _ in range(int(parts[1]))],
+                     size, float(parts[3]), float(parts[4]))
+    elif parts[0] == b"@V":
+        row = wave_next[0][int(parts[1])]
+        for i, x in enumerate(parts[2:]):
+            row[i] = int(x)
+    elif parts[0] == b"@W":
+        wave, wave_size, wave_omega, wave_theta0 = wave_next
+        wave_next = None
+        traj_start = last_step = ticks_ms()
+        mode = "wave"
+        playing = True
+        client.settimeout(TRAJ_MS / 1000)
+    elif parts[0] == b"@B":
+        playing = False
+        traj = None
+        gc.collect()
+        traj = [array("f") for _ in range(int(parts[1]))]
+        traj_pos = [0] * len(traj)
+        traj_end = int(parts[2])
+    elif parts[0] == b"@S":
+        segs = traj[int(parts[1])]
+        for x in parts[2:8]:
+            segs.append(float(x))
+    elif parts[0] == b"@G":
+        traj_start = last_step = ticks_ms()
+        mode = "traj"
+        playing = True
+        client.settimeout(TRAJ_MS / 1000)
+
+def stop_playing():
+    global playing
+    if playing:
+        playing = False
+        client.settimeout(1)
+
+def play_step(now):
+    if mode == "wave":
+        play_wave(now)
+        return
+    # evaluate every joint's current segment, Horner form
+    t = ticks_diff(now, traj_start)
+    for j in range(len(traj)):
+        segs = traj[j]
+        k = traj_pos[j]
+        while k + 6 < len(segs) and t >= segs[k + 6]:
+            k += 6
+        traj_pos[j] = k
+        if not segs:
+            continue
+        u = (t - segs[k]) / segs[k + 1]
+        u = 0.0 if u < 0 else 1.0 if u > 1 else u
+        a = segs[k + 2] + u * (segs[k + 3] + u * (segs[k + 4] + u * segs[k + 5]))
+        # a cubic can overshoot between samples, angle_to_duty doesn't clamp
+        state[j] = 0.0 if a < 0 else 180.0 if a > 180 else a
+    write_servos()
+    if t >= traj_end:
+        stop_playing()
 
-    if not data:
-        print("Client disconnected")
-        break
+def play_wave(now):
+    # phase -> position in the table, linear interpolation between entries
+    theta = wave_theta0 + wave_omega * ticks_diff(now, traj_start) / 1000
+    x = (theta % TWO_PI) * (wave_size / TWO_PI)
+    i = int(x)
+    frac = x - i
+    i %= wave_size
+    nxt = (i + 1) % wave_size
+    for j in range(len(wave)):
+        row = wave[j]
+        state[j] = row[i] + (row[nxt] - row[i]) * frac
+    write_servos()
 
-    buffer += data
+def send_report():
+    global frames_since_report, lat_sum, lat_max, loop_sum, loop_max, loops
+    n = frames_since_report
+    report = "T,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d\r\n" % (
+        last_seq, frames, skipped,
+        lat_sum // n if n else 0, lat_max,
+        loop_sum // loops if loops else 0, loop_max,
+        ticks_diff(ticks_us(), applied_at), gc.mem_free(), parse_errors)
+    client.send(report.encode())
+    frames_since_report = 0
+    lat_sum = lat_max = 0
+    loop_sum = loop_max = loops = 0
 
-    while b"\n" in buffer:
-        line, buffer = buffer.split(b"\n", 1)
+# serve one ground station connection at a time, for as long as the Pico runs
+while True:
+    client, addr = net.accept(announcer)
+    print('Client connected from', addr)
+    # wake up at least once per report so reports keep coming while idle
+    client.settimeout(1)
+
+    buffer = b""
+    last_seq = 0
+    applied_at = ticks_us()
+    frames = 0
+    skipped = 0
+    parse_errors = 0
+    frames_since_report = 0
+    lat_sum = lat_max = 0
+    loop_sum = loop_max = loops = 0
+    last_report = ticks_ms()
+
+    while True:
         try:
-            tokens = line.decode().strip().split(",")
-            angles = [float(x) for x in tokens]
+            data = client.recv(1024)
+        except OSError as e:
+            if e.args[0] != errno.ETIMEDOUT:
+                print("Client lost:", e)
+                break
+            data = None  # timed out, nothing arrived
+
+        if data == b"":
+            print("Client disconnected")
+            break
+
+        announcer.poll()
+
+        if data:
+            received = ticks_us()
+            buffer += data
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+
+            # priority commands (see transport.py) win over every frame that
+            # arrived before them, so look for the newest one first
+            for i in range(len(lines) - 1, -1, -1):
+                line = lines[i].strip()
+                if line.startswith(b"!"):
+                    try:
+                        if line.startswith(b"!S"):
+                            stopped = True
+                            stop_playing()
+                            set_state(line[3:])
+                            write_servos()
+                        elif line == b"!R":
+                            stopped = False
+                    except Exception as e:
+                        parse_errors += 1
+                        print("Parse error:", e, line)
+                    lines = lines[i + 1:]
+                    break
+
+            if not stopped:
+                # every frame goes into the state in order (deltas build on each
+                # other), the servos are written once for the newest state
+                count = 0
+                for line in lines:
+                    line = line.strip()
+                    if not line or line.startswith(b"!"):
+                        continue
+                    if line.startswith(b"@"):
+                        try:
+                            handle_upload(line)
+                        except Exception as e:
+                            parse_errors += 1
+                            print("Upload error:", e, line)
+                        continue
+                    stop_playing()
+                    try:
+                        # "seq:body", the sequence number is optional
+                        seq = 0
+                        if b":" in line:
+                            seq, line = line.split(b":", 1)
+                            seq = int(seq)
+                        set_state(line)
+                    except Exception as e:
+                        parse_errors += 1
+                        print("Parse error:", e, line)
+                        continue
+                    count += 1
+                    if seq:
+                        last_seq = seq
+
+                if count:
+                    write_servos()
+                    applied_at = ticks_us()
+                    frames += 1
+                    skipped += count - 1
+                    frames_since_report += 1
+                    lat = ticks_diff(applied_at, received)
+                    lat_sum += lat
+                    lat_max = max(lat_max, lat)
+                    pico_led.toggle()
 
-            pico_led.toggle()
+            loop = ticks_diff(ticks_us(), received)
+            loops += 1
+            loop_sum += loop
+            loop_max = max(loop_max, loop)
 
-            for servo, angle in zip(servos, angles):
-                duty = angle_to_duty(angle)
-                print(f'servo: {servo}, angle: {angle}')
-                servo.duty_u16(duty)
+        if playing and ticks_diff(ticks_ms(), last_step) >= TRAJ_MS:
+            last_step = ticks_ms()
+            play_step(last_step)
 
-        except Exception as e:
-            print("Parse error:", e, line)
+        if ticks_diff(ticks_ms(), last_report) >= REPORT_MS:
+            last_report = ticks_ms()
+            if not net.poll():
+                print("Wi-Fi lost")
+                break
+            try:
+                send_report()
+            except OSError:
+                pass
 
-client.close()
-print("Socket closed")
\ No newline at end of file
+    # nobody is watching any more, don't keep playing an upload
+    stop_playing()
+    client.close()
+    print("Socket closed")
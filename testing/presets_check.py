@@ -0,0 +1,68 @@
+# presets_check.py (CPython)
+# The gait preset API of app.py (gait_params.py underneath) through Flask's
+# test client, with the presets in a temporary file:
+#   - saving the live parameters and a given set, loading one back, deleting
+#   - what is saved is the validated set, e.g. n as an int, so loading a
+#     preset applies exactly what was saved
+#   - bodies that aren't a parameter object (not JSON, a list, unknown,
+#     out of range or non-finite values) are a 400 and save or set nothing
+#
+#   python testing/presets_check.py
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app as ground_station
+import motion
+
+
+def check_presets(path):
+    motion.params.preset_file = path
+    client = ground_station.app.test_client()
+
+    r = client.post("/presets/live")
+    assert r.status_code == 200, r.data
+    live = motion.params.public()
+    assert r.get_json() == {k: v for k, v in live.items() if k != "version"}
+
+    # a preset is the validated set, n=2.7 is saved as 2
+    r = client.post("/presets/slow", json={"omega": 1.5, "n": 2.7})
+    assert r.status_code == 200 and r.get_json() == {"omega": 1.5, "n": 2}, r.data
+    assert json.load(open(path))["slow"] == {"omega": 1.5, "n": 2}
+    r = client.post("/presets/slow/load")
+    assert r.status_code == 200 and r.get_json()["omega"] == 1.5 and r.get_json()["n"] == 2
+
+    # GET /params can be saved as it is
+    r = client.post("/presets/copy", json=client.get("/params").get_json())
+    assert r.status_code == 200, r.data
+
+    for body in (b"{not json", b"[1, 2]", b'"fast"', b'{"omega": 99}', b'{"speed": 1}',
+                 b'{"calibration": [1, 2]}'):
+        r = client.post("/presets/bad", data=body, content_type="application/json")
+        assert r.status_code == 400, (body, r.status_code, r.data)
+        assert "error" in r.get_json()
+    assert "bad" not in client.get("/presets").get_json()
+
+    assert client.delete("/presets/slow").status_code == 200
+    assert client.post("/presets/slow/load").status_code == 404
+    assert client.delete("/presets/slow").status_code == 404
+    assert sorted(client.get("/presets").get_json()) == ["copy", "live"]
+    # Python's JSON parser reads NaN and Infinity, none of them gets through
+    for body in (b'{"n": Infinity}', b'{"n": NaN}', b'{"alpha": NaN}', b'{"omega": -Infinity}',
+                 b'{"calibration": [0, NaN, 0, 0, 0, 0]}', b'{"calibration": [0, 0, 0, Infinity, 0, 0]}'):
+        for url in ("/params", "/presets/bad"):
+            r = client.post(url, data=body, content_type="application/json")
+            assert r.status_code == 400, (url, body, r.status_code, r.data)
+    assert "bad" not in client.get("/presets").get_json()
+    print("presets: saved live and given sets, validated values stored, 6 bad bodies refused with 400, "
+          "6 non-finite ones by /params and presets")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        check_presets(os.path.join(tmp, "gait_presets.json"))
+    print("ok")
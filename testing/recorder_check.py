@@ -0,0 +1,135 @@
+# recorder_check.py (CPython)
+# The flight recorder (recorder.py), on files in a temporary directory:
+#   - the ring wraps: a small ring keeps the newest records in order, and
+#     a reopened file numbers on from where it left off
+#   - the CSV dump has every record still in the ring, values and commands
+#   - dump and replay open recordings read-only: a truncated copy or a file
+#     that isn't a recording is an error and stays as it was
+#   - importing motion doesn't create flight.rec
+#   - a replay after a stop is played: the Pico is latched by the stop
+#     until replay.py resumes it (fake_pico.py)
+#   - one frame costs less than FRAME_BUDGET_US
+#
+#   python testing/recorder_check.py
+
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import recorder
+import replay
+import transport
+from fake_pico import FakePico
+
+CAPACITY = 100
+FRAME_BUDGET_US = 10.0
+
+
+def check_ring(path):
+    rec = recorder.FlightRecorder(path, capacity=CAPACITY)
+    assert not os.path.exists(path), "made before the first record"
+    for i in range(250):
+        rec.frame([90, i % 180, 45.5])
+    rec.command("stop")
+    records = rec.records()
+    assert [r["seq"] for r in records] == list(range(152, 252)), [r["seq"] for r in records[:3]]
+    assert records[0]["values"] == [90, 151 % 180, 45.5]
+    assert records[-1]["kind"] == "command" and records[-1]["command"] == "stop"
+    assert os.path.getsize(path) == recorder.HEADER.size + CAPACITY * recorder.RECORD.size
+    rec.close()
+
+    rec = recorder.FlightRecorder(path, capacity=CAPACITY)
+    rec.frame([1, 2, 3])
+    assert rec.records()[-1]["seq"] == 252
+    rec.close()
+    print(f"ring: 251 records in a ring of {CAPACITY}, the newest {CAPACITY} kept in order, "
+          f"seq goes on after reopening")
+
+
+def check_dump(path, out):
+    rec = recorder.open_file(path)
+    count = rec.dump_csv(out)
+    rec.close()
+    rows = list(csv.DictReader(open(out, newline="")))
+    assert count == len(rows) == CAPACITY
+    assert rows[-2]["command"] == "stop" and rows[-1]["kind"] == "frame"
+    assert [rows[-1][f"v{i}"] for i in range(3)] == ["1", "2", "3"] and not rows[-1]["v3"]
+    assert rows[0]["v2"] == "45.5"
+    # replay reads the CSV and the recording alike
+    assert replay.load_frames(out) == replay.load_frames(path)
+    print(f"dump: {count} records to CSV, the same frames replay.py reads from the recording")
+
+
+def check_readonly(path, tmp):
+    data = open(path, "rb").read()
+    cases = {
+        "truncated.rec": data[:len(data) // 2],
+        "header.rec": data[:recorder.HEADER.size - 10],
+        "notes.rec": b"not a recording\n" * 1000,
+        "empty.rec": b"",
+    }
+    for name, content in cases.items():
+        copy = os.path.join(tmp, name)
+        open(copy, "wb").write(content)
+        for read in (recorder.open_file, replay.load_frames):
+            try:
+                read(copy)
+                raise AssertionError(f"{name} read without an error")
+            except ValueError:
+                pass
+        assert open(copy, "rb").read() == content, f"{name} was changed"
+    out = subprocess.run([sys.executable, os.path.join(ROOT, "recorder.py"), "dump",
+                          os.path.join(tmp, "truncated.rec"), os.path.join(tmp, "t.csv")],
+                         capture_output=True, text=True)
+    assert out.returncode == 1 and "can't read" in out.stderr, out
+    print(f"read-only: {len(cases)} damaged recordings refused and left untouched")
+
+
+def check_import():
+    # a fresh interpreter, nothing in it has recorded anything yet
+    out = subprocess.run([sys.executable, "-c",
+                          "import motion; print(motion.flight._mm is None)"],
+                         cwd=ROOT, capture_output=True, text=True)
+    assert out.stdout.strip() == "True", out
+    print("import: motion doesn't open flight.rec until something is recorded")
+
+
+def check_replay_after_stop(path):
+    frames = replay.load_frames(path)[-20:]
+    pico = FakePico().start()
+    try:
+        with transport.TcpTransport(pico.host, pico.port) as link:
+            link.send_priority(transport.encode_stop([90] * 3))
+        with transport.TcpTransport(pico.host, pico.port) as link:
+            stats = replay.replay(frames, link, speed=None)
+        deadline = time.time() + 2
+        while len(pico.frames) < len(frames) and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        pico.stop()
+    assert pico.stops and stats["frames"] == len(frames)
+    assert len(pico.frames) == len(frames) and pico.ignored == 0, (len(pico.frames), pico.ignored)
+    assert [a for _, a in pico.frames] == [[float(v) for v in a] for _, a in frames]
+    print(f"replay: {len(frames)} frames after a stop, all applied")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flight.rec")
+        check_ring(path)
+        check_dump(path, os.path.join(tmp, "flight.csv"))
+        check_readonly(path, tmp)
+        check_replay_after_stop(path)
+    check_import()
+    per_frame = recorder.bench() * 1e6
+    assert per_frame < FRAME_BUDGET_US, f"{per_frame:.2f} us per frame"
+    print(f"bench: {per_frame:.2f} us per frame")
+    print("ok")
@@ -39,6 +39,11 @@ Implementation Notes
 **Software and Dependencies:**
 * MicroPython firmware: https://micropython.org
 
+Changed for the snake: preallocated buffers instead of a new bytearray per
+transfer, time.sleep_ms() delays, and split-phase reads: _start() selects
+a register and returns, the result is collected once ready() without
+blocking in between (see StemmaSoilSensor.start_moisture()).
+
 **Tested on:**
 * Hardware: Adafruit HUZZAH32 - ESP32 Feather https://learn.adafruit.com/adafruit-huzzah32-esp32-feather/overview
 * Firmware: MicroPython v1.12 https://micropython.org/resources/firmware/esp32-idf3-20191220-v1.12.bin
@@ -54,45 +59,124 @@ _STATUS_SWRST = const(0x7F)
 
 _HW_ID_CODE = const(0x55)
 
+_RESET_MS = const(500)
+
+# what a split-phase read in flight is for, see _start()
+IDLE = const(0)
+RESETTING = const(1)
+RESET_ID = const(2)
+
 class Seesaw:
     """Driver for SeeSaw I2C generic conversion trip.
        :param I2C i2c: I2C bus the SeeSaw is connected to.
-       :param int addr: I2C address of the SeeSaw device."""
-    def __init__(self, i2c, addr):
+       :param int addr: I2C address of the SeeSaw device.
+       :param bool reset: reset the chip now, blocking for 500 ms. Without it
+       call start_reset() and poll_reset() before the first reading.
+       Register reads and writes go through buffers allocated here once, so
+       a reading doesn't allocate and can't trigger a GC pause."""
+    def __init__(self, i2c, addr, reset=True):
         self.i2c = i2c
         self.addr = addr
-        self.sw_reset()
+        # the one split-phase read in flight (the chip has one register
+        # pointer) and when its result is ready, in ticks_us
+        self.pending = IDLE
+        self._due = 0
+        # register base, register and up to 4 bytes of payload
+        self._cmd = bytearray(6)
+        self._cmd_mv = memoryview(self._cmd)
+        self._select_cmd = self._cmd_mv[:2]
+        self._write8_cmd = self._cmd_mv[:3]
+        # read buffers for 1, 2 and 4 byte registers
+        self._buf1 = bytearray(1)
+        self._buf2 = bytearray(2)
+        self._buf4 = bytearray(4)
+        if reset:
+            self.sw_reset()
 
     def sw_reset(self):
         """Trigger a software reset of the SeeSaw chip"""
-        self._write8(STATUS_BASE, _STATUS_SWRST, 0xFF)
-        time.sleep(.500)
+        self.start_reset()
+        while not self.poll_reset():
+            time.sleep_ms(self.ready_in_ms())
 
-        chip_id = self._read8(STATUS_BASE, _STATUS_HW_ID)
+    def start_reset(self):
+        """Start a software reset, returns ms until poll_reset() can finish it"""
+        self._write8(STATUS_BASE, _STATUS_SWRST, 0xFF)
+        self.pending = RESETTING
+        self._due = time.ticks_add(time.ticks_us(), _RESET_MS * 1000)
+        return self.ready_in_ms()
+
+    def poll_reset(self):
+        """True once the chip is back and answered with the right id"""
+        if not self.ready():
+            return False
+        if self.pending == RESETTING:
+            self.pending = IDLE
+            self._start(STATUS_BASE, _STATUS_HW_ID, RESET_ID)
+            return False
+        self.pending = IDLE
+        self.i2c.readfrom_into(self.addr, self._buf1)
+        chip_id = self._buf1[0]
 
         if chip_id != _HW_ID_CODE:
             raise RuntimeError("SeeSaw hardware ID returned (0x{:x}) is not "
                                "correct! Expected 0x{:x}. Please check your wiring."
                                .format(chip_id, _HW_ID_CODE))
+        return True
+
+    def _start(self, reg_base, reg, what, delay_ms=5):
+        """First half of a read: select the register, the chip needs delay_ms to convert"""
+        if self.pending != IDLE and self.pending != what:
+            raise RuntimeError("SeeSaw is busy with another read")
+        self._select(reg_base, reg)
+        self.pending = what
+        self._due = time.ticks_add(time.ticks_us(), delay_ms * 1000)
+
+    def cancel(self):
+        """Forget the read in flight, e.g. after it failed"""
+        self.pending = IDLE
+
+    def ready(self):
+        return time.ticks_diff(self._due, time.ticks_us()) <= 0
+
+    def ready_in_ms(self):
+        """ms until the read in flight can be collected, 0 if it can be now"""
+        left = time.ticks_diff(self._due, time.ticks_us())
+        return (left + 999) // 1000 if left > 0 else 0
 
     def _write8(self, reg_base, reg, value):
-        self._write(reg_base, reg, bytearray([value]))
+        cmd = self._cmd
+        cmd[0] = reg_base
+        cmd[1] = reg
+        cmd[2] = value
+        self.i2c.writeto(self.addr, self._write8_cmd)
 
     def _read8(self, reg_base, reg):
-        ret = bytearray(1)
-        self._read(reg_base, reg, ret)
-        return ret[0]
+        self._read(reg_base, reg, self._buf1)
+        return self._buf1[0]
 
-    def _read(self, reg_base, reg, buf, delay=.005):
-        self._write(reg_base, reg)
+    def _read(self, reg_base, reg, buf, delay_ms=5):
+        """Select the register, wait for the conversion, read into buf"""
+        self._select(reg_base, reg)
 
-        time.sleep(delay)
+        time.sleep_ms(delay_ms)
 
         self.i2c.readfrom_into(self.addr, buf)
 
-    def _write(self, reg_base, reg, buf=None):
-        full_buffer = bytearray([reg_base, reg])
-        if buf is not None:
-            full_buffer += buf
+    def _select(self, reg_base, reg):
+        cmd = self._cmd
+        cmd[0] = reg_base
+        cmd[1] = reg
+        self.i2c.writeto(self.addr, self._select_cmd)
 
-        self.i2c.writeto(self.addr, full_buffer)
\ No newline at end of file
+    def _write(self, reg_base, reg, buf=None):
+        if buf is None:
+            self._select(reg_base, reg)
+            return
+        # not used on the reading path, the slice below allocates
+        cmd = self._cmd
+        cmd[0] = reg_base
+        cmd[1] = reg
+        for i in range(len(buf)):
+            cmd[2 + i] = buf[i]
+        self.i2c.writeto(self.addr, self._cmd_mv[:2 + len(buf)])
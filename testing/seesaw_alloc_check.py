@@ -0,0 +1,165 @@
+# seesaw_alloc_check.py (CPython, or MicroPython on a Pico with the sensor)
+# Counts what one soil sensor reading allocates with the drivers in
+# seesaw.py and stemma_soil_sensor.py, since every allocation brings the
+# next GC pause closer, for the blocking and the split-phase reads. Also
+# checks that a split-phase read retries bad readings and refuses to start
+# while another read is in flight.
+#
+# On CPython the fake bus (fake_i2c.py) stands in for the sensor, and every
+# bytearray, bytes, memoryview, concatenation and struct unpack (a tuple)
+# the drivers make is counted by shadowing those names in the driver
+# modules. A float result counts too: floats are heap objects on the Pico.
+# On the Pico, gc.mem_alloc() is read around a batch of real readings with
+# the GC switched off.
+#
+#   python testing/seesaw_alloc_check.py
+#   mpremote run testing/seesaw_alloc_check.py   (seesaw.py, stemma_soil_sensor.py on the Pico)
+
+import sys
+
+READS = 1000
+
+if sys.implementation.name == "micropython":
+    import gc
+    from machine import I2C, Pin
+    from stemma_soil_sensor import StemmaSoilSensor
+
+    sensor = StemmaSoilSensor(I2C(0, scl=Pin(1), sda=Pin(0), freq=100000))
+    for name in ("get_moisture", "get_temp", "get_temp_raw"):
+        read = getattr(sensor, name, None)
+        if read is None:
+            continue
+        read()
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(READS):
+            read()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        print("%-13s %6.1f bytes per reading" % (name, used / READS))
+    sys.exit()
+
+import os
+import struct
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import seesaw
+import stemma_soil_sensor
+from fake_i2c import FakeI2C, Seesaw
+
+counts = {}
+
+
+def count(what):
+    counts[what] = counts.get(what, 0) + 1
+
+
+class CountedBytearray(bytearray):
+    def __add__(self, other):
+        count("bytearray +")
+        return CountedBytearray(bytearray(self) + other)
+
+    def __iadd__(self, other):
+        count("bytearray +=")  # grows the buffer, a new block on the Pico
+        return super().__iadd__(other)
+
+
+def counted(what, make):
+    def f(*args, **kwargs):
+        count(what)
+        return make(*args, **kwargs)
+    return f
+
+
+# sleeping only moves the clock on, the drivers and the fake chip share it
+clock = upy_shim.virtual_time()
+
+
+def instrument():
+    for module in (seesaw, stemma_soil_sensor):
+        module.bytearray = counted("bytearray()", CountedBytearray)
+        module.bytes = counted("bytes()", bytes)
+        module.memoryview = counted("memoryview()", memoryview)
+    stemma_soil_sensor.ustruct = types.SimpleNamespace(
+        unpack=counted("unpack tuple", struct.unpack), pack=counted("bytes()", struct.pack),
+        unpack_from=counted("unpack tuple", struct.unpack_from))
+
+
+def split(start, poll):
+    """A split-phase read the way pico_async.py drives it"""
+    def read():
+        clock.sleep_ms(start())
+        while True:
+            value = poll()
+            if value is not None:
+                return value
+            clock.sleep_ms(1)
+    return read
+
+
+def measure(sensor, name, read=None):
+    read = read or getattr(sensor, name)
+    read()
+    counts.clear()
+    results = 0
+    for _ in range(READS):
+        if isinstance(read(), float):
+            results += 1
+    if results:
+        counts["float result"] = results
+    per = {k: v / READS for k, v in counts.items()}
+    total = sum(per.values())
+    detail = ", ".join(f"{k} {v:g}" for k, v in sorted(per.items())) or "nothing"
+    print(f"{name:14s} {total:4.1f} allocations per reading ({detail})")
+    return per
+
+
+if __name__ == "__main__":
+    instrument()
+    bus = FakeI2C(devices={0x36: Seesaw(moisture=640, temp_c=24.25)})
+    sensor = stemma_soil_sensor.StemmaSoilSensor(bus)
+    assert sensor.get_moisture() == 640
+    assert abs(sensor.get_temp() - 24.25) < 1e-3
+
+    moisture = measure(sensor, "get_moisture")
+    temp = measure(sensor, "get_temp")
+    assert sensor.get_temp_raw() == int(24.25 * 65536)
+    raw = measure(sensor, "get_temp_raw")
+    split_moisture = measure(sensor, "split moisture",
+                             split(sensor.start_moisture, sensor.poll_moisture))
+    split_raw = measure(sensor, "split temp raw",
+                        split(sensor.start_temp, sensor.poll_temp_raw))
+    assert not (moisture or raw or split_moisture or split_raw), "readings still allocate"
+    assert list(temp) == ["float result"], "get_temp allocates more than its result"
+    print(f"{bus.writes + bus.reads} bus transactions, {clock.us / 1e6:.1f} s of sensor time")
+
+    # a bad reading is retried without blocking, then given up on
+    bus.devices[0x36].moisture = 5000
+    wait = sensor.start_moisture()
+    polls = 0
+    try:
+        while True:
+            clock.sleep_ms(wait)
+            polls += 1
+            if sensor.poll_moisture() is not None:
+                break
+            wait = sensor.ready_in_ms() or 1
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("bad moisture readings were accepted")
+    assert sensor.pending == seesaw.IDLE and polls == 5, polls
+    sensor.start_temp()
+    try:
+        sensor.start_moisture()
+        raise AssertionError("two reads in flight at once")
+    except RuntimeError:
+        sensor.cancel()
+    print("ok")
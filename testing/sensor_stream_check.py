@@ -0,0 +1,264 @@
+# sensor_stream_check.py (CPython)
+# Soil samples over Wi-Fi in binary batches (sensor_stream.py on the ground
+# station, pico_stream.py on the Pico):
+#   - the Pico's packing matches the ground station's format, and the
+#     decoder gets every sample out of a stream cut at random places with
+#     text lines in between
+#   - pico_async.py on this machine (upy_shim.py, fake sensor) streams to
+#     the Receiver, which writes the log store (log_store.py)
+#   - motion.py only asks a Pico for the stream if discovery found it
+#     announcing the capability
+#   - against the USB serial path of pi_sensor.py, ASCII "moisture,temp"
+#     lines through a pty read with pyserial: bytes per sample, samples per
+#     second and ground station CPU time per sample
+#
+#   python testing/sensor_stream_check.py
+
+import asyncio
+import csv
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import serial
+
+import log_store
+import pico_async
+import pico_stream
+import sensor_stream
+from fake_i2c import FakeI2C, Seesaw
+from stemma_soil_sensor import StemmaSoilSensor
+
+BENCH_SAMPLES = 20000
+SAMPLE_MS = 100
+BATCH_MS = 500
+SECONDS = 3.0
+
+
+class FakeSampler:
+    """What SampleRing.add() reads off a SoilSampler"""
+
+    def __init__(self, moisture, temp_c, flags=0, kept=8, spread=1.5, n_moisture=8):
+        self.moisture = moisture
+        self.temp_c = temp_c
+        self.flags = flags
+        self.kept = kept
+        self.spread = spread
+        self.n_moisture = n_moisture
+
+
+def random_samples(count, rng):
+    out = []
+    ticks = 1000
+    for i in range(count):
+        ticks += rng.randint(90, 110)
+        moisture = None if rng.random() < 0.05 else rng.uniform(300, 1500)
+        temp_c = None if rng.random() < 0.05 else rng.uniform(-5, 40)
+        out.append((ticks, moisture, temp_c, rng.choice((0, 0, 0, 1, 16, 96)), rng.randint(0, 8),
+                    rng.uniform(0, 80)))
+    return out
+
+
+def pack(ring, samples, now):
+    seq = ring.seq
+    for ticks, moisture, temp_c, flags, kept, spread in samples:
+        ring.add(ticks, FakeSampler(moisture, temp_c, flags, kept, spread))
+    return ring.batch(seq, len(samples), now)[0]
+
+
+def check_format():
+    rng = random.Random(1)
+    samples = random_samples(pico_stream.BATCH_N, rng)
+    now = samples[-1][0] + 40
+    ring = pico_stream.SampleRing(8, spill=None)
+    data = pack(ring, samples, now)
+    assert data == sensor_stream.encode_batch(0, samples, 8, now, ring.boot), \
+        "Pico and ground station disagree"
+    assert len(data) == sensor_stream.HEADER.size + len(samples) * sensor_stream.SAMPLE.size
+
+    # a long stream of batches, text lines in between, cut at random places
+    ring = pico_stream.SampleRing(8, spill=None)
+    stream, sent = b"", []
+    for _ in range(200):
+        samples = random_samples(rng.randint(1, pico_stream.BATCH_N), rng)
+        stream += pack(ring, samples, samples[-1][0] + 40)
+        sent += samples
+        if rng.random() < 0.3:
+            stream += b"M,123,620.0,23.50,0,8,8,1.5\r\nSo"
+    decoder = sensor_stream.Decoder()
+    got = []
+    pos = 0
+    while pos < len(stream):
+        step = rng.randint(1, 300)
+        got += decoder.feed(stream[pos:pos + step], now=1000.0)
+        pos += step
+    assert [s.seq for s in got] == list(range(len(sent))), "samples lost or out of order"
+    for s, (ticks, moisture, temp_c, flags, kept, spread) in zip(got, sent):
+        assert (s.moisture is None) == (moisture is None) and (s.temp_c is None) == (temp_c is None)
+        assert moisture is None or abs(s.moisture - moisture) <= 1 / 32
+        assert temp_c is None or abs(s.temp_c - temp_c) <= 0.005
+        assert (s.flags, s.kept) == (flags, kept)
+        assert abs(s.spread - min(spread, 63.75)) <= 0.25
+    # timestamps within a batch keep the Pico's spacing
+    assert all(s.boot == ring.boot and not s.backfill for s in got)
+    gaps = [b.timestamp - a.timestamp for a, b in zip(got, got[1:]) if b.seq % pico_stream.BATCH_N]
+    assert all(0.089 <= g <= 0.111 for g in gaps[:5]), gaps[:5]
+    print(f"format: {len(got)} samples in {decoder.batches} batches through a cut-up stream, "
+          f"{decoder.skipped} bytes of text skipped")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def check_end_to_end(path):
+    pico_async.SAMPLE_MS = SAMPLE_MS
+    pico_async.BATCH_MS = BATCH_MS
+    sensor = StemmaSoilSensor(FakeI2C(devices={0x36: Seesaw(moisture=700)}), reset=False)
+    fw = pico_async.Firmware([27], sensor)
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(fw.run(port),), daemon=True).start()
+
+    store = log_store.LogStore(path)
+    receiver = sensor_stream.Receiver(lambda: ("127.0.0.1", port), store, retry_interval=0.05).start()
+    start = time.time()
+    time.sleep(SECONDS)
+    receiver.stop()
+    end = time.time()
+
+    rows = store.read()
+    assert len(rows) >= SECONDS * 1000 / SAMPLE_MS * 0.6, f"only {len(rows)} rows"
+    seqs = [int(r["seq"]) for r in rows]
+    assert seqs == list(range(seqs[0], seqs[0] + len(seqs))), "rows missing"
+    stamps = [float(r["timestamp"]) for r in rows]
+    assert start - 1.0 < stamps[0] and stamps[-1] < end, "timestamps off"
+    assert all(r["flags"] == "0" and float(r["capacitance"]) == 700 for r in rows)
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    print(f"end to end: {len(rows)} rows in {path}, sample interval {sum(gaps) / len(gaps) * 1000:.1f} ms, "
+          f"{fw.ring.seq} samples taken")
+
+
+def check_address(path):
+    # the ground station only streams from a Pico discovery found announcing
+    # "stream", never from the fixed address of the single-client angle server
+    import discovery
+    import motion
+
+    assert not motion.pico_registry.running
+    assert motion._sensor_stream_address() is None
+    motion.start_sensor_stream(path)
+    assert motion.sensor_receiver is None and not os.path.exists(path)
+
+    registry = motion.pico_registry
+    motion.pico_registry = discovery.Registry(port=0, bind="127.0.0.1").start()
+    try:
+        msg = {"role": "sensor", "port": 8080, "caps": ["angle"], "boot": "a"}
+        motion.pico_registry.handle(msg, "10.0.0.7")
+        assert motion._sensor_stream_address() is None
+        motion.pico_registry.handle(dict(msg, port=8081, caps=["angle", "stream"], boot="b"), "10.0.0.7")
+        assert motion._sensor_stream_address() == ("10.0.0.7", 8081)
+    finally:
+        motion.pico_registry.stop()
+        motion.pico_registry = registry
+    print("address: no stream without discovery or from a Pico without the stream capability")
+
+
+# ======================
+# Benchmark against the serial path
+# ======================
+
+def bench_serial(path):
+    """pi_sensor.py's loop, reading a pty instead of /dev/ttyACM1"""
+    master, slave = os.openpty()
+    tty = serial.Serial(os.ttyname(slave), 115200)
+    lines = [f"{int(m or 0)},{t or 0.0:.1f}\r\n".encode()
+             for _, m, t, *_ in random_samples(BENCH_SAMPLES, random.Random(2))]
+    sent = sum(len(line) for line in lines)
+
+    def write():
+        for line in lines:
+            os.write(master, line)
+
+    open(path, "w").write("timestamp,moisture,temperature\n")
+    writer = threading.Thread(target=write, daemon=True)
+    start = time.perf_counter()
+    writer.start()
+    cpu = time.thread_time()
+    for _ in range(BENCH_SAMPLES):
+        line = tty.readline().decode().strip()
+        moisture, temp = line.split(",")
+        with open(path, "a", newline="") as f:
+            csv.writer(f).writerow([datetime.now(), moisture, temp])
+    cpu = time.thread_time() - cpu
+    elapsed = time.perf_counter() - start
+    tty.close()
+    os.close(master)
+    os.close(slave)
+    return sent / BENCH_SAMPLES, BENCH_SAMPLES / elapsed, cpu / BENCH_SAMPLES * 1e6
+
+
+def bench_binary(path):
+    samples = random_samples(BENCH_SAMPLES, random.Random(2))
+    ring = pico_stream.SampleRing(8, spill=None)
+    batches = [pack(ring, samples[i:i + pico_stream.BATCH_N], samples[i][0] + 500)
+               for i in range(0, BENCH_SAMPLES, pico_stream.BATCH_N)]
+    sent = sum(len(b) for b in batches)
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def write():
+        conn, _ = server.accept()
+        conn.recv(64)  # "+stream"
+        for b in batches:
+            conn.sendall(b)
+        # read the acks until the receiver hangs up, closing with them
+        # unread would reset the connection under the last batches
+        conn.shutdown(socket.SHUT_WR)
+        while conn.recv(4096):
+            pass
+        conn.close()
+
+    threading.Thread(target=write, daemon=True).start()
+    store = log_store.LogStore(path)
+    # the Receiver's loop, without the reconnecting around it
+    receiver = sensor_stream.Receiver(lambda: None, store)
+    receiver.running = True
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        receiver._receive(server.getsockname())
+    except OSError:
+        pass  # closed once everything is sent
+    cpu = time.thread_time() - cpu
+    elapsed = time.perf_counter() - start
+    assert store.rows == BENCH_SAMPLES, store.rows
+    return sent / BENCH_SAMPLES, BENCH_SAMPLES / elapsed, cpu / BENCH_SAMPLES * 1e6
+
+
+if __name__ == "__main__":
+    check_format()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_end_to_end(os.path.join(tmp, "live.csv"))
+        check_address(os.path.join(tmp, "address.csv"))
+        ser = bench_serial(os.path.join(tmp, "soil_data.csv"))
+        wifi = bench_binary(os.path.join(tmp, "stream.csv"))
+    print(f"{BENCH_SAMPLES} samples      bytes/sample  samples/s  ground CPU us/sample")
+    print(f"  serial ASCII      {ser[0]:10.1f}  {ser[1]:9.0f}  {ser[2]:10.1f}   (no timestamp, flags or seq)")
+    print(f"  Wi-Fi batches     {wifi[0]:10.1f}  {wifi[1]:9.0f}  {wifi[2]:10.1f}   (batches of {pico_stream.BATCH_N})")
+    print("ok")
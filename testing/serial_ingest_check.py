@@ -0,0 +1,239 @@
+# serial_ingest_check.py (CPython, Linux/macOS)
+# The ground station's serial ingest (serial_ingest.py) against ptys
+# standing in for sensor Picos on USB serial, this script plays the Picos on
+# the master ends:
+#   - parsing batches of lines, with and without the Pico's ticks, and the
+#     lines that aren't samples
+#   - the line buffer with reads cut at random places and a line too long
+#     for it, the lines handed out as a view of the buffer
+#   - PICOS ports at LINE_HZ lines a second each, with a malformed line now
+#     and then: every sample reaches the log store once, in order per port,
+#     timestamped on the Pico's clock; a slow subscriber drops batches, a
+#     port unplugged halfway doesn't hold up the others
+#   - CPU time per line on the ground station against pi_sensor.py's old
+#     loop (readline, then open the CSV and write a row per line)
+#
+#   python testing/serial_ingest_check.py
+
+import asyncio
+import csv
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import serial
+
+import log_store
+import serial_ingest
+
+PICOS = 3
+LINE_HZ = 2000
+SECONDS = 3.0
+BLOCK_MS = 5
+MALFORMED_EVERY = 997
+BENCH_LINES = 20000
+
+
+def line(ticks, moisture, temp_c):
+    if ticks is None:
+        return b"%d,%.1f\r\n" % (moisture, temp_c)
+    return b"%d,%d,%.1f\r\n" % (ticks, moisture, temp_c)
+
+
+def check_parse():
+    chunk = b"612,23.4\r\n100,613,23.5\r\n101,614,-1.0"
+    rows, bad = serial_ingest.parse_lines(chunk)
+    assert rows == [(None, 612.0, 23.4), (100, 613.0, 23.5), (101, 614.0, -1.0)] and bad == []
+    chunk = b"612,23.4\r\n\r\nTraceback (most recent call last):\r\n61\xff2,23.4\r\n1,2,3,4\r\n615,23.6\r"
+    for data in (chunk, memoryview(bytearray(chunk))):
+        rows, bad = serial_ingest.parse_lines(data)
+        assert rows == [(None, 612.0, 23.4), (None, 615.0, 23.6)], rows
+        assert bad == [b"Traceback (most recent call last):\r", b"61\xff2,23.4\r", b"1,2,3,4\r"], bad
+    print("parse: 3 of 6 lines malformed, 1 blank, 2 samples, from bytes and from a memoryview")
+
+
+def check_buffer():
+    rng = random.Random(1)
+    lines = [line(i, 600 + i % 50, 20.0) for i in range(5000)]
+    data = b"".join(lines)
+    buffer = serial_ingest.LineBuffer(4096)
+    r, w = os.pipe()
+    rows = []
+    pos = 0
+    while pos < len(data):
+        n = min(rng.randint(1, 3000), 4096 - buffer.end, len(data) - pos)
+        os.write(w, data[pos:pos + n])
+        pos += n
+        assert buffer.fill(r) == n
+        chunk = buffer.lines()
+        if chunk is not None:
+            rows += serial_ingest.parse_lines(chunk)[0]
+    assert buffer.end == 0 and [r[0] for r in rows] == list(range(5000))
+
+    # a line the buffer can't hold is dropped whole, the next one is fine
+    for data in (b"x" * 10000 + b"\n", line(1, 600, 20.0)):
+        pos = 0
+        while pos < len(data):
+            n = min(4096 - buffer.end, len(data) - pos)
+            os.write(w, data[pos:pos + n])
+            pos += n
+            buffer.fill(r)
+            chunk = buffer.lines()
+    assert chunk == b"1,600,20.0\r" and buffer.overlong == 1, (bytes(chunk), buffer.overlong)
+    # the lines come out as a view of the buffer, not a copy
+    assert isinstance(chunk, memoryview) and chunk.obj is buffer.buf
+    os.close(r)
+    os.close(w)
+    print(f"buffer: {len(lines)} lines in reads of 1..3000 bytes, a 10000 byte line dropped")
+
+
+# ======================
+# Ports
+# ======================
+
+class PtyPico:
+    """A sensor Pico printing LINE_HZ lines a second on the master end of a pty"""
+
+    def __init__(self, ticks=True):
+        self.master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self.ticks = ticks
+        self.sent = 0
+        self.malformed = 0
+        self.start = None
+        self.unplug_at = None
+        self.closed = False
+
+    def run(self, seconds):
+        self.start = time.time()
+        n = 0
+        while True:
+            # a block every BLOCK_MS, the lines due by then
+            elapsed = time.time() - self.start
+            if elapsed >= seconds or (self.unplug_at is not None and elapsed >= self.unplug_at):
+                break
+            due = int(elapsed * LINE_HZ)
+            out = []
+            while n < due:
+                n += 1
+                if n % MALFORMED_EVERY == 0:
+                    out.append(b"OSError: [Errno 5] EIO\r\n")
+                    self.malformed += 1
+                    continue
+                out.append(line(n * 1000 // LINE_HZ if self.ticks else None, 600 + n % 50, 21.5))
+                self.sent += 1
+            os.write(self.master, b"".join(out))
+            time.sleep(BLOCK_MS / 1000)
+        if self.unplug_at is not None:
+            # the hangup throws away what the port hasn't read yet, as
+            # pulling the cable would: only the lines before that count
+            time.sleep(0.1)
+            os.close(self.master)
+            self.closed = True
+
+    def close(self):
+        os.close(self._slave)
+        if not self.closed:
+            os.close(self.master)
+
+
+async def ingest_ports(picos, store, seconds):
+    ingest = serial_ingest.SerialIngest([p.port for p in picos], store, retry_interval=0.2)
+    live = ingest.subscribe(maxsize=10000)
+    slow = ingest.subscribe(maxsize=5)
+    runner = asyncio.create_task(ingest.run())
+    while not all(p.connected for p in ingest.ports):
+        await asyncio.sleep(0.01)
+    writers = [threading.Thread(target=p.run, args=(seconds,), daemon=True) for p in picos]
+    cpu = time.thread_time()
+    for w in writers:
+        w.start()
+    while any(w.is_alive() for w in writers):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+    cpu = time.thread_time() - cpu
+    ingest.stop()
+    await runner
+    got = {}
+    while not live.empty():
+        port, samples = live.get_nowait()
+        got[port] = got.get(port, 0) + len(samples)
+    return ingest, got, slow.qsize(), cpu
+
+
+def check_ports(path):
+    picos = [PtyPico(ticks=i > 0) for i in range(PICOS)]
+    picos[-1].unplug_at = SECONDS / 2
+    store = log_store.LogStore(path)
+    ingest, got, slow, cpu = asyncio.run(ingest_ports(picos, store, SECONDS))
+    for p in picos:
+        p.close()
+    print(ingest.report())
+
+    rows = store.read()
+    sent = sum(p.sent for p in picos)
+    assert len(rows) == store.rows == sent, (len(rows), sent)
+    for pico, port in zip(picos, ingest.ports):
+        assert port.lines == got[pico.port] == pico.sent, (port.lines, got[pico.port], pico.sent)
+        assert port.malformed == pico.malformed, (port.malformed, pico.malformed)
+        mine = [r for r in rows if int(r["boot"]) == port.boot]
+        assert [int(r["seq"]) for r in mine] == list(range(pico.sent))
+        assert all(float(r["capacitance"]) >= 600 for r in mine)
+        if pico.ticks:
+            # the Pico's time of every line against when it was written,
+            # only later by the block the line went out in
+            errors = [float(r["timestamp"]) - pico.start - (int(r["seq"]) + 1 + int(r["seq"]) // MALFORMED_EVERY)
+                      / LINE_HZ for r in mine]
+            worst = max(abs(e) for e in errors)
+            assert worst < 0.02, worst
+    assert not ingest.ports[-1].connected and picos[-1].sent < picos[0].sent * 0.6
+    assert ingest.dropped > 0 and slow == 5
+    rate = min(p.sent for p in picos[:-1]) / SECONDS
+    assert rate >= 1000, rate
+    print(f"ports: {sent} samples from {PICOS} Picos at {rate:.0f} lines/s each, all in the log once, "
+          f"timestamps within {worst * 1000:.1f} ms of the Pico's, {ingest.dropped} batches dropped by "
+          f"a stuck subscriber")
+    return cpu / sent * 1e6
+
+
+def bench_old_loop(path):
+    """pi_sensor.py's old loop, reading a pty instead of /dev/ttyACM1"""
+    master, slave = os.openpty()
+    tty = serial.Serial(os.ttyname(slave), 115200)
+    data = [line(None, 600 + i % 50, 21.5) for i in range(BENCH_LINES)]
+
+    def write():
+        for chunk in data:
+            os.write(master, chunk)
+
+    open(path, "w").write("timestamp,moisture,temperature\n")
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    cpu = time.thread_time()
+    for _ in range(BENCH_LINES):
+        text = tty.readline().decode().strip()
+        moisture, temp = text.split(",")
+        with open(path, "a", newline="") as f:
+            csv.writer(f).writerow([datetime.now(), moisture, temp])
+    cpu = time.thread_time() - cpu
+    tty.close()
+    os.close(master)
+    os.close(slave)
+    return cpu / BENCH_LINES * 1e6
+
+
+if __name__ == "__main__":
+    check_parse()
+    check_buffer()
+    with tempfile.TemporaryDirectory() as tmp:
+        ingest_us = check_ports(os.path.join(tmp, "live.csv"))
+        old_us = bench_old_loop(os.path.join(tmp, "soil_data.csv"))
+    print(f"ground station CPU per line: {old_us:.1f} us the old loop, {ingest_us:.1f} us the ingest "
+          f"(event loop thread, the log store writes on a worker) ({old_us / ingest_us:.0f}x less)")
+    print("ok")
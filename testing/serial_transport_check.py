@@ -0,0 +1,121 @@
+# serial_transport_check.py (CPython, Linux/macOS)
+# Exercises transport.SerialTransport against a pty pair standing in for the
+# Pico's USB serial port: the transport opens the slave end, this script
+# plays the Pico on the master end.
+#
+#   python testing/serial_transport_check.py
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import transport
+
+
+class PtyPico:
+    """Reads frames from the master side of a pty, can be paused to act like a stuck Pico"""
+
+    def __init__(self):
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        self._slave = slave  # keep it open so the pty survives until the transport opens it
+        self.frames = []
+        self.parse_errors = 0
+        self.paused = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        buffer = b""
+        while self._running:
+            if self.paused.is_set():
+                time.sleep(0.001)
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self.frames.append([int(x) for x in line.decode().split(",")])
+                except ValueError:
+                    self.parse_errors += 1
+
+    def fill(self):
+        """Fill the pty buffer with blank lines, as if the Pico stopped reading a while ago"""
+        fd = os.open(self.port, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            while True:
+                os.write(fd, b"\r\n")
+        except BlockingIOError:
+            pass
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._running = False
+        os.close(self._slave)
+        os.close(self.master)
+
+
+def check_in_order():
+    pico = PtyPico()
+    with transport.SerialTransport(pico.port) as link:
+        for i in range(200):
+            link.send(transport.encode_frame([i, 90, 90]))
+            time.sleep(0.002)
+        time.sleep(0.2)
+        dropped = link.dropped
+
+    seqs = [f[0] for f in pico.frames]
+    assert seqs == sorted(seqs), "frames arrived out of order"
+    assert seqs[-1] == 199, f"newest frame never arrived, last was {seqs[-1]}"
+    assert len(seqs) + dropped == 200, "frames lost without being counted as dropped"
+    assert pico.parse_errors == 0
+    pico.close()
+    print(f"in order: {len(seqs)} frames delivered, {dropped} dropped")
+
+
+def check_stalled_reader():
+    pico = PtyPico()
+    pico.paused.set()
+    worst_send = 0.0
+
+    with transport.SerialTransport(pico.port, max_unsent=64, write_timeout=2.0) as link:
+        # ptys don't report out_waiting, so start with a full buffer to get
+        # the writer thread stuck in write(). Done after connect so the port
+        # is already in raw mode.
+        pico.fill()
+        # 1 kHz for half a second with nobody reading the port
+        for i in range(500):
+            t0 = time.perf_counter()
+            link.send(transport.encode_frame([i, 90, 90]))
+            worst_send = max(worst_send, time.perf_counter() - t0)
+            time.sleep(0.001)
+
+        pico.paused.clear()
+        time.sleep(0.3)
+        dropped = link.dropped
+
+    seqs = [f[0] for f in pico.frames]
+    assert worst_send < 0.005, f"send() blocked for {worst_send * 1000:.1f} ms"
+    assert dropped > 0, "stale frames were queued instead of dropped"
+    assert seqs[-1] == 499, f"newest frame never arrived, last was {seqs[-1]}"
+    assert pico.parse_errors == 0, "a frame was cut in half"
+    pico.close()
+    print(f"stalled reader: {len(seqs)} of 500 frames delivered, {dropped} dropped, "
+          f"worst send() {worst_send * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    check_in_order()
+    check_stalled_reader()
+    print("ok")
@@ -0,0 +1,228 @@
+# soil_sampler.py (MicroPython, also runs on CPython)
+# Turns a burst of rapid soil sensor readings into one clean, quality-tagged
+# sample, so bad reads (the 65535 / 0.0 rows in soil_data.csv) are caught
+# on the Pico instead of ending up in the logs, and the link carries one
+# record per sample instead of every reading.
+#
+#   sampler = SoilSampler(StemmaSoilSensor(i2c, reset=False))
+#   sampler.start()
+#   while not sampler.poll():          # split-phase, never blocks
+#       await asyncio.sleep_ms(sampler.ready_in_ms() or 1)
+#   sampler.moisture, sampler.temp_c, sampler.flags
+#
+# A burst is N_MOISTURE moisture readings and N_TEMP temperature readings.
+# Readings that can't be real (0, 65535, I2C errors, out of the sensor's
+# range) are dropped first, then the ones further than OUTLIER_K robust
+# standard deviations (1.4826 * MAD) from the median. What is left is
+# averaged. flags says what happened on the way, 0 is a clean sample.
+
+from array import array
+
+# quality flags
+Q_OUTLIERS = 1   # some readings were rejected as outliers
+Q_FEW = 2        # fewer than half of the readings were usable
+Q_NOISY = 4      # the readings spread more than NOISY_COUNTS
+Q_RANGE = 8      # moisture outside what the sensor gives in soil, air or water
+Q_BUS = 16       # I2C errors or all-zero / all-ones reads: wiring or the chip
+Q_TEMP = 32      # no usable temperature reading
+Q_FAULT = 64     # no usable moisture reading, moisture is None
+
+N_MOISTURE = 8
+N_TEMP = 3
+OUTLIER_K = 3.0
+MIN_SPREAD = 2.0      # counts, the readings are whole numbers
+NOISY_COUNTS = 25.0
+MOISTURE_RANGE = (200, 2000)
+TEMP_RANGE = (-40.0, 85.0)
+# samples in a row with Q_FAULT before the sensor gets a reset
+RESET_AFTER = 3
+
+_IDLE = 0
+_RESET = 1
+_MOISTURE = 2
+_TEMP = 3
+
+
+def _sort(a, n):
+    # insertion sort of the first n entries in place, n is small and
+    # sorted() would allocate a list
+    for i in range(1, n):
+        x = a[i]
+        j = i - 1
+        while j >= 0 and a[j] > x:
+            a[j + 1] = a[j]
+            j -= 1
+        a[j + 1] = x
+
+
+def _median(a, n):
+    _sort(a, n)
+    if n % 2:
+        return a[n // 2]
+    return (a[n // 2 - 1] + a[n // 2]) / 2
+
+
+class SoilSampler:
+    def __init__(self, sensor, n_moisture=N_MOISTURE, n_temp=N_TEMP):
+        self.sensor = sensor
+        self.n_moisture = n_moisture
+        self.n_temp = n_temp
+        self._moisture = array("f", [0.0] * n_moisture)
+        self._dev = array("f", [0.0] * n_moisture)
+        self._temp = array("i", [0] * n_temp)
+        self.phase = _IDLE
+        self._faults_in_a_row = 0
+        self.resets = 0
+        # the last sample
+        self.moisture = None
+        self.temp_c = None
+        self.flags = 0
+        self.kept = 0
+        self.spread = 0.0
+
+    def ready_in_ms(self):
+        return self.sensor.ready_in_ms()
+
+    def start(self):
+        """Start a burst, returns ms until poll() is worth calling"""
+        self._got = 0
+        self._read = 0
+        self._temps = 0
+        self._temp_read = 0
+        self.flags = 0
+        if self._faults_in_a_row >= RESET_AFTER:
+            self._faults_in_a_row = 0
+            try:
+                self.phase = _RESET
+                return self.sensor.start_reset()
+            except OSError:
+                # nothing on the bus: the sample is a fault, poll() says done
+                self.sensor.cancel()
+                self.flags |= Q_BUS
+                self._finish()
+                return 0
+        if not self._next():
+            self._finish()
+        return self.sensor.ready_in_ms()
+
+    def poll(self):
+        """Advance the burst, True once the sample is ready"""
+        sensor = self.sensor
+        try:
+            if self.phase == _RESET:
+                if not sensor.poll_reset():
+                    return False
+                self.resets += 1
+            elif self.phase == _MOISTURE:
+                value = sensor.poll_moisture()
+                if value is None:
+                    return False
+                self._read += 1
+                if value == 0 or value == 0xFFFF:
+                    self.flags |= Q_BUS
+                elif value <= 4095:
+                    self._moisture[self._got] = value
+                    self._got += 1
+            elif self.phase == _TEMP:
+                raw = sensor.poll_temp_raw()
+                if raw is None:
+                    return False
+                self._temp_read += 1
+                if raw == 0 or raw == 0x3FFFFFFF:
+                    self.flags |= Q_BUS
+                elif TEMP_RANGE[0] <= raw / 65536 <= TEMP_RANGE[1]:
+                    self._temp[self._temps] = raw
+                    self._temps += 1
+            else:
+                return True
+        except (OSError, RuntimeError):
+            # an I2C error, a wrong chip id or still over 4095 after the
+            # driver's retries
+            sensor.cancel()
+            self.flags |= Q_BUS
+            if self.phase == _RESET:
+                self._finish()
+                return True
+            self._count_failed()
+        if self._next():
+            return False
+        self._finish()
+        return True
+
+    def _next(self):
+        # start the next reading of the burst, False when there are none left
+        sensor = self.sensor
+        while self._read < self.n_moisture or self._temp_read < self.n_temp:
+            try:
+                if self._read < self.n_moisture:
+                    self.phase = _MOISTURE
+                    sensor.start_moisture()
+                else:
+                    self.phase = _TEMP
+                    sensor.start_temp()
+                return True
+            except OSError:
+                sensor.cancel()
+                self.flags |= Q_BUS
+                self._count_failed()
+        return False
+
+    def _count_failed(self):
+        if self.phase == _MOISTURE:
+            self._read += 1
+        else:
+            self._temp_read += 1
+
+    def _finish(self):
+        self.phase = _IDLE
+        n = self._got
+        self.kept = 0
+        self.spread = 0.0
+        if n == 0:
+            self.moisture = None
+            self.flags |= Q_FAULT
+        else:
+            m = self._moisture
+            median = _median(m, n)
+            dev = self._dev
+            for i in range(n):
+                dev[i] = abs(m[i] - median)
+            mad = _median(dev, n) * 1.4826
+            limit = OUTLIER_K * max(mad, MIN_SPREAD)
+            total = 0.0
+            for i in range(n):
+                if abs(m[i] - median) <= limit:
+                    total += m[i]
+                    self.kept += 1
+            self.moisture = total / self.kept
+            self.spread = mad
+            if self.kept < n:
+                self.flags |= Q_OUTLIERS
+            if mad > NOISY_COUNTS:
+                self.flags |= Q_NOISY
+            if not MOISTURE_RANGE[0] <= self.moisture <= MOISTURE_RANGE[1]:
+                self.flags |= Q_RANGE
+        if self.kept * 2 < self.n_moisture:
+            self.flags |= Q_FEW
+        if self._temps:
+            self.temp_c = _median(self._temp, self._temps) / 65536
+        else:
+            self.temp_c = None
+            self.flags |= Q_TEMP
+        self._faults_in_a_row = self._faults_in_a_row + 1 if self.flags & Q_FAULT else 0
+
+    def read(self):
+        """Blocking burst, for scripts"""
+        from time import sleep_ms
+        self.start()
+        while not self.poll():
+            sleep_ms(self.ready_in_ms() or 1)
+        return self.moisture, self.temp_c, self.flags
+
+    def record(self, ticks):
+        """The sample as the line pico_async.py sends, see its header"""
+        return ("M,%d,%s,%s,%d,%d,%d,%.1f\r\n" % (
+            ticks,
+            "" if self.moisture is None else "%.1f" % self.moisture,
+            "" if self.temp_c is None else "%.2f" % self.temp_c,
+            self.flags, self.kept, self.n_moisture, self.spread)).encode()
@@ -0,0 +1,164 @@
+# soil_sampler_check.py (CPython)
+# Runs soil_sampler.py against the fake soil sensor of fake_i2c.py misbehaving
+# in the ways the real one does: noise, spikes, all-ones reads (the 65535 /
+# 0.0 rows in soil_data.csv), NAKs, a temperature out of range and a sensor
+# that comes off the bus and back. Checks the flags of every case, and
+# compares the error of single readings (what pico_async.py used to send)
+# with the aggregated samples, and the bytes on the link for both.
+#
+#   python testing/soil_sampler_check.py
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import upy_shim
+upy_shim.install()
+
+import stemma_soil_sensor
+from fake_i2c import FakeI2C, Seesaw
+from soil_sampler import (SoilSampler, N_MOISTURE, RESET_AFTER, Q_OUTLIERS, Q_FEW,
+                          Q_NOISY, Q_RANGE, Q_BUS, Q_TEMP, Q_FAULT)
+
+SAMPLES = 500
+MOISTURE = 620
+
+
+# sleeping only moves the clock on, the drivers and the fake chip share it
+clock = upy_shim.virtual_time()
+
+
+def sample(sampler):
+    """One burst, driven the way pico_async.py does it, returns its ms"""
+    t0 = clock.us
+    clock.sleep_ms(sampler.start())
+    while not sampler.poll():
+        clock.sleep_ms(sampler.ready_in_ms() or 1)
+    return (clock.us - t0) / 1000
+
+
+def setup(**kwargs):
+    chip = Seesaw(moisture=MOISTURE, **kwargs)
+    bus = FakeI2C(devices={0x36: chip})
+    return bus, chip, SoilSampler(stemma_soil_sensor.StemmaSoilSensor(bus, reset=False))
+
+
+def names(flags):
+    return "|".join(n for n, q in (("OUTLIERS", Q_OUTLIERS), ("FEW", Q_FEW), ("NOISY", Q_NOISY),
+                                   ("RANGE", Q_RANGE), ("BUS", Q_BUS), ("TEMP", Q_TEMP),
+                                   ("FAULT", Q_FAULT)) if flags & q) or "clean"
+
+
+def percentile(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def clean():
+    bus, chip, sampler = setup(noise=3)
+    ms = sample(sampler)
+    assert sampler.flags == 0, names(sampler.flags)
+    assert abs(sampler.moisture - MOISTURE) < 5 and abs(sampler.temp_c - 23.5) < 1e-3
+    assert sampler.kept == N_MOISTURE
+    print(f"clean        {sampler.record(0).decode().strip()}  ({ms:.0f} ms per burst)")
+
+
+def spikes():
+    # single readings straight off the chip against samples, same chip
+    bus, chip, sampler = setup(noise=3, spikes=0.1, seed=1)
+    raw = [abs(sampler.sensor.get_moisture() - MOISTURE) for _ in range(SAMPLES)]
+    agg, outliers = [], 0
+    for _ in range(SAMPLES):
+        sample(sampler)
+        agg.append(abs(sampler.moisture - MOISTURE))
+        outliers += bool(sampler.flags & Q_OUTLIERS)
+        assert not sampler.flags & (Q_BUS | Q_FAULT | Q_NOISY), names(sampler.flags)
+    print(f"spikes       error in counts   p50    p99    max")
+    print(f"  single reading            {percentile(raw, .5):5.1f}  {percentile(raw, .99):5.1f}  {max(raw):5.1f}")
+    print(f"  sample of {N_MOISTURE}               {percentile(agg, .5):5.1f}  {percentile(agg, .99):5.1f}  {max(agg):5.1f}")
+    print(f"  {outliers} of {SAMPLES} samples had outliers rejected")
+    assert max(agg) < 10 and max(raw) > 150, (max(agg), max(raw))
+
+
+def noisy():
+    bus, chip, sampler = setup(noise=60, seed=2)
+    sample(sampler)
+    assert sampler.flags & Q_NOISY, names(sampler.flags)
+    print(f"noisy        {names(sampler.flags)}, spread {sampler.spread:.0f} counts")
+
+
+def floating_bus():
+    # every read all ones: what pico_sensor.py logged as 65535 / 0.0
+    bus, chip, sampler = setup(ones=1.0)
+    sample(sampler)
+    want = Q_BUS | Q_FAULT | Q_TEMP | Q_FEW
+    assert sampler.flags == want and sampler.moisture is None, names(sampler.flags)
+    print(f"all ones     {sampler.record(0).decode().strip()}  {names(sampler.flags)}")
+
+
+def naks():
+    bus, chip, sampler = setup(noise=3, naks=0.05, seed=3)
+    errors, flagged = [], 0
+    for _ in range(SAMPLES // 5):
+        sample(sampler)
+        if sampler.moisture is not None:
+            errors.append(abs(sampler.moisture - MOISTURE))
+        flagged += bool(sampler.flags & Q_BUS)
+    assert len(errors) == SAMPLES // 5 and max(errors) < 10, max(errors)
+    print(f"5% NAKs      {flagged} of {SAMPLES // 5} samples flagged BUS, all with a moisture, "
+          f"max error {max(errors):.1f}")
+
+
+def hot():
+    bus, chip, sampler = setup(temp_c=200.0)
+    sample(sampler)
+    assert sampler.flags == Q_TEMP and sampler.temp_c is None, names(sampler.flags)
+    assert sampler.moisture == MOISTURE
+    chip.temp_c, chip.moisture = 23.5, 3000
+    sample(sampler)
+    assert sampler.flags == Q_RANGE, names(sampler.flags)
+    print("range        temperature out of range TEMP, moisture out of range RANGE")
+
+
+def unplugged():
+    bus, chip, sampler = setup()
+    sample(sampler)
+    del bus.devices[0x36]
+    for _ in range(RESET_AFTER):
+        sample(sampler)
+        assert sampler.flags & (Q_BUS | Q_FAULT) == Q_BUS | Q_FAULT, names(sampler.flags)
+    bus.devices[0x36] = chip
+    # the sample after RESET_AFTER faults in a row resets the chip first
+    sample(sampler)
+    assert sampler.resets == 1 and chip.resets == 1 and sampler.flags == 0, names(sampler.flags)
+    # a reset that fails is a fault sample like any other
+    del bus.devices[0x36]
+    for _ in range(RESET_AFTER + 1):
+        sample(sampler)
+    assert sampler.resets == 1 and sampler.flags & Q_FAULT
+    print(f"unplugged    BUS|FAULT while off the bus, reset and clean once back")
+
+
+def traffic():
+    # the old firmware sent a line per reading, now one per burst
+    bus, chip, sampler = setup(noise=3)
+    sample(sampler)
+    record = sampler.record(123456)
+    single = b"M,123456,620,23.50\r\n"
+    old = N_MOISTURE * len(single)
+    print(f"link         {old} bytes for {N_MOISTURE} readings sent one by one, "
+          f"{len(record)} for the sample ({old / len(record):.1f}x less)")
+
+
+if __name__ == "__main__":
+    clean()
+    spikes()
+    noisy()
+    floating_bus()
+    naks()
+    hot()
+    unplugged()
+    traffic()
+    print("ok")
@@ -40,13 +40,20 @@ Implementation Notes
 * MicroPython firmware: https://micropython.org
 * SeeSaw Base Class: seesaw.py
 
+Changed for the snake: readings reuse the base class's buffers and decode
+the bytes by hand instead of ustruct.unpack(), so they don't allocate, and
+every reading can be split in two so nothing blocks while the chip converts:
+
+    wait_ms = sensor.start_moisture()
+    ... wait_ms later (asyncio.sleep, a timer, the next loop pass) ...
+    moisture = sensor.poll_moisture()   # None if not ready yet / retrying
+
 **Tested on:**
 * Hardware: Adafruit HUZZAH32 - ESP32 Feather https://learn.adafruit.com/adafruit-huzzah32-esp32-feather/overview
 * Firmware: MicroPython v1.12 https://micropython.org/resources/firmware/esp32-idf3-20191220-v1.12.bin
 """
 
 import time
-import ustruct
 
 import seesaw
 
@@ -54,35 +61,90 @@ _STATUS_TEMP = const(0x04)
 
 _TOUCH_CHANNEL_OFFSET = const(0x10)
 
+# split-phase reads in flight, next to the ones in seesaw.py
+_MOISTURE = const(10)
+_TEMP = const(11)
+
+# the blocking read waited 1 ms after each conversion as well
+_MOISTURE_MS = const(6)
+_TEMP_MS = const(5)
+_RETRIES = const(4)
+
 class StemmaSoilSensor(seesaw.Seesaw):
     """Driver for Adafruit STEMMA Soil Sensor - I2C Capacitive Moisture Sensor
        :param I2C i2c: I2C bus the SeeSaw is connected to.
-       :param int addr: I2C address of the SeeSaw device. Default is 0x36."""
-    def __init__(self, i2c, addr=0x36):
-        super().__init__(i2c, addr)
+       :param int addr: I2C address of the SeeSaw device. Default is 0x36.
+       :param bool reset: see Seesaw."""
+    def __init__(self, i2c, addr=0x36, reset=True):
+        self._retries = 0
+        super().__init__(i2c, addr, reset)
+
+    def start_temp(self):
+        """Start a temperature conversion, returns ms until poll_temp() has it"""
+        self._start(seesaw.STATUS_BASE, _STATUS_TEMP, _TEMP, _TEMP_MS)
+        return _TEMP_MS
+
+    def poll_temp_raw(self):
+        """Temperature in 1/65536 degC as an int once ready, None until then"""
+        if self.pending != _TEMP:
+            raise RuntimeError("No temperature reading started")
+        if not self.ready():
+            return None
+        self.pending = seesaw.IDLE
+        buf = self._buf4
+        self.i2c.readfrom_into(self.addr, buf)
+        return ((buf[0] & 0x3F) << 24) | (buf[1] << 16) | (buf[2] << 8) | buf[3]
+
+    def poll_temp(self):
+        raw = self.poll_temp_raw()
+        return None if raw is None else 0.00001525878 * raw
+
+    def start_moisture(self):
+        """Start a moisture conversion, returns ms until poll_moisture() has it"""
+        self._retries = 0
+        self._start(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, _MOISTURE, _MOISTURE_MS)
+        return _MOISTURE_MS
+
+    def poll_moisture(self):
+        """Moisture once ready, None until then (also while retrying a bad reading)"""
+        if self.pending != _MOISTURE:
+            raise RuntimeError("No moisture reading started")
+        if not self.ready():
+            return None
+        buf = self._buf2
+        self.i2c.readfrom_into(self.addr, buf)
+        ret = (buf[0] << 8) | buf[1]
 
-    def get_temp(self):
-        buf = bytearray(4)
-        self._read(seesaw.STATUS_BASE, _STATUS_TEMP, buf, .005)
-        buf[0] = buf[0] & 0x3F
-        ret = ustruct.unpack(">I", buf)[0]
-        return 0.00001525878 * ret
+        # retry if reading was bad
+        if ret > 4095:
+            self._retries += 1
+            if self._retries > _RETRIES:
+                self.pending = seesaw.IDLE
+                raise RuntimeError("Could not get a valid moisture reading.")
+            self._start(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, _MOISTURE, _MOISTURE_MS)
+            return None
 
-    def get_moisture(self):
-        buf = bytearray(2)
+        self.pending = seesaw.IDLE
+        return ret
 
-        self._read(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, buf, .005)
-        ret = ustruct.unpack(">H", buf)[0]
-        time.sleep(.001)
+    # blocking versions
 
-        # retry if reading was bad
-        count = 0
-        while ret > 4095:
-            self._read(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, buf, .005)
-            ret = ustruct.unpack(">H", buf)[0]
-            time.sleep(.001)
-            count += 1
-            if count > 3:
-                raise RuntimeError("Could not get a valid moisture reading.")
+    def get_temp_raw(self):
+        """Temperature in 1/65536 degC as an int, unlike get_temp() it doesn't allocate"""
+        self.start_temp()
+        while True:
+            time.sleep_ms(self.ready_in_ms())
+            raw = self.poll_temp_raw()
+            if raw is not None:
+                return raw
 
-        return ret
\ No newline at end of file
+    def get_temp(self):
+        return 0.00001525878 * self.get_temp_raw()
+
+    def get_moisture(self):
+        self.start_moisture()
+        while True:
+            time.sleep_ms(self.ready_in_ms())
+            ret = self.poll_moisture()
+            if ret is not None:
+                return ret
@@ -0,0 +1,245 @@
+# store_forward_check.py (CPython)
+# Store and forward of the soil samples (pico_stream.SampleRing on the Pico,
+# sensor_stream.Receiver on the ground station) through Wi-Fi drops:
+#   - the ring keeps unacknowledged samples, spills the ones it has to
+#     overwrite to flash and serves batches from either
+#   - pico_async.py on this machine streams through a proxy that drops the
+#     link for a while, twice, and once the ground station restarts as
+#     well: the log store still ends up with every sample, the missed ones
+#     backfilled out of order while new ones keep arriving
+#   - the dashboard's incremental reader (dashboard/sorted_csv.py) sorts
+#     the backfilled rows in without re-sorting the whole history
+#
+#   python testing/store_forward_check.py
+
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "dashboard"))
+
+import upy_shim
+upy_shim.install()
+
+import log_store
+import pico_async
+import pico_stream
+import sensor_stream
+from fake_i2c import FakeI2C, Seesaw
+from sorted_csv import SortedCsv
+from stemma_soil_sensor import StemmaSoilSensor
+
+SAMPLE_MS = 40
+RING = 25            # samples in RAM, an outage longer than a second spills to flash
+OUTAGE = 2.0         # s
+HISTORY_ROWS = 200000
+
+
+class FakeSampler:
+    def __init__(self, i):
+        self.moisture = 500 + i % 1000
+        self.temp_c = 20.0
+        self.flags = 0
+        self.kept = 8
+        self.spread = 1.0
+
+
+def check_ring(tmp):
+    spill = os.path.join(tmp, "samples.bin")
+    ring = pico_stream.SampleRing(8, size=10, spill=spill)
+    for i in range(25):
+        ring.add(1000 + 40 * i, FakeSampler(i))
+    # nothing acknowledged: the 15 overwritten ones are on flash
+    assert (ring.spill_first, ring.spilled, ring.lost) == (0, 15, 0)
+    ring._spill_f.flush()
+    assert os.path.getsize(spill) == 15 * 15
+    decoder = sensor_stream.Decoder()
+    seq, got = ring.first(0), []
+    while seq < ring.seq:
+        data, seq = ring.batch(seq, 50, 2000, pico_stream.BACKFILL)
+        got += decoder.feed(data, now=100.0)
+    assert [s.seq for s in got] == list(range(25)), [s.seq for s in got]
+    assert all(s.moisture == 500 + s.seq and s.backfill for s in got)
+    assert abs(got[-1].timestamp - (100.0 - (2000 - 1960) / 1000)) < 1e-6
+    # an ack past the spilled samples frees the file, the next spill starts over
+    ring.ack(20)
+    assert ring.spilled == 0
+    for i in range(25, 40):
+        ring.add(1000 + 40 * i, FakeSampler(i))
+    assert (ring.spill_first, ring.spilled) == (20, 10), (ring.spill_first, ring.spilled)
+    # samples below the ack are let go of, nothing is lost
+    assert ring.first(0) == 20 and ring.lost == 0
+    print("ring: spill to flash, batches from flash and RAM, ack frees the flash ok")
+
+
+class Proxy:
+    """A TCP relay standing in for the Wi-Fi link, cut() drops it"""
+
+    def __init__(self, port):
+        self.target = ("127.0.0.1", port)
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.up = True
+        self.socks = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.server.accept()
+            if not self.up:
+                conn.close()
+                continue
+            pico = socket.create_connection(self.target)
+            self.socks += [conn, pico]
+            threading.Thread(target=self._pipe, args=(conn, pico), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(pico, conn), daemon=True).start()
+
+    def _pipe(self, a, b):
+        try:
+            while True:
+                data = a.recv(4096)
+                if not data or not self.up:
+                    break
+                b.sendall(data)
+        except OSError:
+            pass
+        for s in (a, b):
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def cut(self):
+        self.up = False
+        for s in self.socks:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.socks = []
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(cond, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not cond() and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    return cond()
+
+
+def check_outages(tmp):
+    pico_async.SAMPLE_MS = SAMPLE_MS
+    pico_async.BATCH_MS = 300
+    sensor = StemmaSoilSensor(FakeI2C(devices={0x36: Seesaw(moisture=700)}), reset=False)
+    fw = pico_async.Firmware([27], sensor)
+    # n of 2 keeps a sample quick (14 ms) next to SAMPLE_MS
+    fw.sampler.n_moisture = 2
+    fw.sampler.n_temp = 1
+    fw.ring = pico_stream.SampleRing(2, size=RING, spill=os.path.join(tmp, "samples.bin"))
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(fw.run(port),), daemon=True).start()
+    proxy = Proxy(port)
+    path = os.path.join(tmp, "live.csv")
+
+    def receiver():
+        return sensor_stream.Receiver(lambda: ("127.0.0.1", proxy.port), log_store.LogStore(path),
+                                      retry_interval=0.1, timeout=1.0).start()
+
+    rx = receiver()
+    assert wait_for(lambda: rx.samples >= 20), "nothing streamed"
+    spilled = 0
+    for restart in (False, True):
+        proxy.cut()
+        time.sleep(OUTAGE)
+        spilled = max(spilled, fw.ring.spilled)
+        if restart:
+            # the ground station goes down too, the new one reads the log
+            # to know where it left off
+            rx.stop()
+            rx = receiver()
+        proxy.up = True
+        assert wait_for(lambda: rx.connected), "no reconnect"
+        time.sleep(1.0)
+    end = fw.ring.seq
+    assert wait_for(lambda: log_store.LogStore(path).received()[1].__len__() >= end), "backfill incomplete"
+    rx.stop()
+
+    rows = pd.read_csv(path)
+    seqs = rows["seq"].to_numpy()
+    assert len(seqs) == len(set(seqs)), "duplicate rows"
+    assert set(seqs) >= set(range(end)), f"missing {sorted(set(range(end)) - set(seqs))[:10]}"
+    backfilled = np.count_nonzero(np.diff(rows["timestamp"].to_numpy()) < 0)
+    assert backfilled > 0, "backfill didn't arrive alongside live rows"
+    # wall time from the Pico's ticks: one sample every SAMPLE_MS in seq order
+    by_seq = rows.sort_values("seq")
+    gaps = np.diff(by_seq["timestamp"].to_numpy()) * 1000
+    assert np.percentile(np.abs(gaps - SAMPLE_MS), 99) < 20, np.percentile(gaps, [1, 50, 99])
+    print(f"outages: {len(rows)} rows, seq 0..{seqs.max()} complete after two {OUTAGE:.0f} s drops "
+          f"and a ground station restart; up to {spilled} samples on flash, "
+          f"{backfilled} places where a backfilled row follows a newer one")
+    return path
+
+
+def check_dashboard(tmp, path):
+    # the rows as logged, backfill out of order, read a few at a time
+    rows = pd.read_csv(path)
+    part = os.path.join(tmp, "part.csv")
+    reader = SortedCsv(part, list(rows.columns))
+    with open(part, "w") as f:
+        f.write(",".join(rows.columns) + "\n")
+    for i in range(0, len(rows), 7):
+        rows.iloc[i:i + 7].to_csv(part, mode="a", header=False, index=False)
+        reader.read()
+    want = rows.sort_values("timestamp", kind="mergesort").reset_index(drop=True)
+    assert np.array_equal(reader.read()["seq"].to_numpy(), want["seq"].to_numpy())
+
+    # cost against re-reading and re-sorting everything, with a long history
+    big = os.path.join(tmp, "big.csv")
+    t = 1.7e9 + np.arange(HISTORY_ROWS) * 0.1
+    history = pd.DataFrame({"timestamp": t, "capacitance": 700.0, "moisture_pct": 17.7,
+                            "temperature_c": 23.5, "flags": 0, "kept": 8, "boot": 1,
+                            "seq": np.arange(HISTORY_ROWS)})
+    history.to_csv(big, index=False, float_format="%.3f")
+    reader = SortedCsv(big, list(history.columns))
+    reader.read()
+    incremental, full = [], []
+    for k in range(20):
+        # 10 live rows at the end, 50 backfilled ones from a minute back
+        live = history.iloc[-10:].assign(timestamp=t[-1] + 0.1 * (np.arange(10) + 1 + 10 * k))
+        back = history.iloc[-650:-600].assign(timestamp=t[-650:-600] + 0.05 + 0.001 * k)
+        pd.concat([live, back]).to_csv(big, mode="a", header=False, index=False, float_format="%.3f")
+        s = time.perf_counter()
+        df = reader.read()
+        incremental.append(time.perf_counter() - s)
+        s = time.perf_counter()
+        full_df = pd.read_csv(big).sort_values("timestamp")
+        full.append(time.perf_counter() - s)
+    assert np.array_equal(df["timestamp"].to_numpy(), full_df["timestamp"].to_numpy())
+    assert df["timestamp"].is_monotonic_increasing
+    print(f"dashboard: {len(df)} rows, a read with backfilled rows takes "
+          f"{np.median(incremental) * 1000:.1f} ms, re-reading and sorting everything "
+          f"{np.median(full) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        check_ring(tmp)
+        path = check_outages(tmp)
+        check_dashboard(tmp, path)
+    print("ok")
@@ -0,0 +1,100 @@
+# sweep_check.py (CPython)
+# The serpentine parameter sweep (sweep.py):
+#   - the simulated angles are the ones motion.serpentine_angles sends once
+#     the point is loaded as a preset (sweep.to_preset), at every phase
+#   - a point with omega = 0 gives a full record, ranked below any that
+#     moves forward
+#   - a small grid through the process pool, then again from the cache
+#   - presets of points over the whole K_n range load on the ground station
+#
+#   python testing/sweep_check.py
+
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import motion
+import sweep
+
+POINTS = [
+    {"alpha": 60.0, "omega": 2.0, "K_n": 0.5, "gamma": 0.0},
+    {"alpha": 35.0, "omega": 3.0, "K_n": 1.0, "gamma": 7.5},
+    {"alpha": 80.0, "omega": 1.0, "K_n": 0.25, "gamma": -20.0},
+    # beta past 2 pi, wrapped by to_preset()
+    {"alpha": 45.0, "omega": 2.0, "K_n": 4.5, "gamma": 0.0},
+]
+
+
+def check_same_angles():
+    start = motion.params.public()
+    for point in POINTS:
+        motion.params.update(sweep.to_preset(point))
+        # off the zero crossings, where gamma = 7.5 would round either way
+        # depending on the last bit of the phase
+        theta = np.linspace(0, 2 * math.pi, 97) + 0.01
+        simulated = sweep.servo_angles(point, theta)
+        for th, row in zip(theta, simulated):
+            # a time at which the live phase is th
+            p = motion.params.snapshot()
+            now = p["epoch"] + (th - p["phase0"]) / p["omega"]
+            sent = motion.serpentine_angles(0.0, now)
+            assert np.allclose(row, sent), (point, th, row, sent)
+    motion.params.update({k: start[k] for k in ("alpha", "omega", "K_n", "n", "beta", "gamma")})
+    print(f"angles: {len(POINTS)} points x 97 phases, the sweep's angles are the ones the gait sends")
+
+
+def check_presets(preset_path):
+    # what --save writes loads on the ground station, over the whole K_n range
+    import app as ground_station
+
+    preset_file, motion.params.preset_file = motion.params.preset_file, preset_path
+    start = motion.params.public()
+    client = ground_station.app.test_client()
+    try:
+        lo, hi = sweep.gait_params.LIMITS["K_n"]
+        for i, k in enumerate([lo, 1.0, 3.0, 4.5, 7.0, hi]):
+            motion.params.save_preset(f"sweep-{i}", sweep.to_preset(dict(POINTS[0], K_n=k)))
+            r = client.post(f"/presets/sweep-{i}/load")
+            assert r.status_code == 200, (k, r.data)
+    finally:
+        motion.params.update({k: start[k] for k in ("alpha", "omega", "K_n", "n", "beta", "gamma")})
+        motion.params.preset_file = preset_file
+    print(f"presets: K_n {lo:g}..{hi:g} saved and loaded back through the app")
+
+
+def check_results(cache_path):
+    still = dict(POINTS[0], omega=0.0)
+    record = sweep.evaluate(still)
+    assert set(record) == set(sweep.evaluate(POINTS[0])), record
+
+    points = sweep.grid([30.0, 60.0], [0.0, 2.0], [0.5, 1.0], [0.0])
+    cache = sweep.load_cache(cache_path)
+    results, simulated = sweep.run(points, workers=2, cache=cache)
+    assert simulated == len(points)
+    results.sort(key=sweep.score, reverse=True)
+    # standing still scores 0, below anything that moves forward
+    assert all(sweep.score(r) == 0.0 for r in results if r["point"]["omega"] == 0.0)
+    forward = [r for r in results if r["distance_per_cycle"] > 0]
+    assert forward and results[:len(forward)] == forward
+    assert results[0]["distance_per_cycle"] > 0
+    sweep.save_cache(cache, cache_path)
+
+    again, simulated = sweep.run(points, workers=2, cache=sweep.load_cache(cache_path))
+    assert simulated == 0 and sorted(again, key=str) == sorted(results, key=str)
+    best = results[0]
+    print(f"grid: {len(points)} points, the second run all from the cache, best "
+          f"alpha {best['point']['alpha']:.0f} omega {best['point']['omega']:.1f} "
+          f"K_n {best['point']['K_n']:.2f} at {best['distance_per_cycle'] * 100:.1f} cm/cycle")
+
+
+if __name__ == "__main__":
+    check_same_angles()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_results(os.path.join(tmp, "sweep_cache.json"))
+        check_presets(os.path.join(tmp, "gait_presets.json"))
+    print("ok")
@@ -0,0 +1,131 @@
+# telemetry_check.py (CPython)
+# The motor Pico's telemetry back-channel (telemetry.py):
+#   - a report survives encode_report/parse_report, lines that aren't a
+#     well formed report are None
+#   - handle_line() puts a report into the metrics in seconds and counts
+#     the lines that aren't one
+#   - the control RTT of a report is send -> report minus the age the Pico
+#     gives, only for a seq still in the SENT_WINDOW ring
+#   - over a TcpTransport to fake_pico.py, reports come back for the frames
+#     the gait sent
+#
+#   python testing/telemetry_check.py
+
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import metrics
+import telemetry
+import transport
+from fake_pico import FakePico
+
+REPORT = {"seq": 41, "frames": 1200, "skipped": 3, "lat_avg": 180, "lat_max": 950, "loop_avg": 210,
+          "loop_max": 1400, "age": 2500, "mem_free": 150000, "parse_errors": 1}
+
+
+def report(**values):
+    return telemetry.encode_report(dict(REPORT, **values))
+
+
+def check_parse():
+    line = report()
+    assert line == b"T,41,1200,3,180,950,210,1400,2500,150000,1\r\n", line
+    assert telemetry.parse_report(line) == REPORT
+    # the firmware's averages can be floats, they go out as ints
+    assert telemetry.parse_report(report(lat_avg=180.7))["lat_avg"] == 180
+
+    bad = [b"", b"\r\n", b"T", b"T,1,2,3", line.replace(b"T,", b"R,"), line.rstrip() + b",7",
+           line.replace(b"180", b"18.0"), line.replace(b"950", b"x"), b"Traceback (most recent call last):"]
+    for b in bad:
+        assert telemetry.parse_report(b) is None, b
+    print(f"parse: a report round trips, {len(bad)} malformed lines are None")
+
+
+def check_metrics():
+    t = telemetry.Telemetry()
+    reports, bad = metrics.pico_reports.value, metrics.pico_bad_reports.value
+    assert t.handle_line(b"MemoryError", now=1.0) is None and t.latest is None
+    assert metrics.pico_bad_reports.value == bad + 1
+
+    assert t.handle_line(report(), now=1.0) == REPORT and t.latest == REPORT
+    assert metrics.pico_reports.value == reports + 1
+    assert metrics.pico_last_seq.value == 41 and metrics.pico_frames_applied.value == 1200
+    assert metrics.pico_frames_skipped.value == 3 and metrics.pico_parse_errors.value == 1
+    assert metrics.pico_mem_free.value == 150000
+    # the Pico reports microseconds, the metrics are seconds
+    assert abs(metrics.pico_apply_latency.value - 180e-6) < 1e-12
+    assert abs(metrics.pico_apply_latency_max.value - 950e-6) < 1e-12
+    assert abs(metrics.pico_loop_time.value - 210e-6) < 1e-12
+    assert abs(metrics.pico_loop_time_max.value - 1400e-6) < 1e-12
+
+    # a bad line leaves the last report as it was
+    t.handle_line(b"T,1,2", now=2.0)
+    assert t.latest == REPORT
+    print("metrics: report fields in seconds, bad lines counted and ignored")
+
+
+def check_rtt():
+    rtt = metrics.control_rtt
+    t = telemetry.Telemetry()
+
+    # sent at 10.0, applied, reported 2.5 ms later, back at 10.0125: 10 ms
+    t.sent(41, now=10.0)
+    count, total = rtt.count, rtt.sum
+    t.handle_line(report(seq=41, age=2500), now=10.0125)
+    assert rtt.count == count + 1 and abs(rtt.sum - total - 0.010) < 1e-9, rtt.sum - total
+
+    # a Pico clock running fast can't make it negative
+    t.handle_line(report(seq=41, age=50000), now=10.0125)
+    assert rtt.count == count + 2 and abs(rtt.sum - total - 0.010) < 1e-9
+
+    # a seq that was never sent: no RTT, the rest of the report still counts
+    t.handle_line(report(seq=42), now=11.0)
+    assert rtt.count == count + 2 and t.latest["seq"] == 42
+
+    # SENT_WINDOW frames later the slot of seq 41 is taken, its report has no RTT
+    for seq in range(42, 42 + telemetry.SENT_WINDOW):
+        t.sent(seq, now=20.0 + seq * 0.05)
+    t.handle_line(report(seq=41), now=40.0)
+    assert rtt.count == count + 2
+    last = 41 + telemetry.SENT_WINDOW
+    t.handle_line(report(seq=last, age=0), now=20.0 + last * 0.05 + 0.004)
+    assert rtt.count == count + 3 and abs(rtt.sum - total - 0.014) < 1e-9
+    print(f"rtt: send -> report less the Pico's age, clamped at 0, only for seqs in the "
+          f"last {telemetry.SENT_WINDOW} sent")
+
+
+def check_link():
+    pico = FakePico(report_interval=0.1).start()
+    link = transport.TcpTransport(pico.host, pico.port).connect()
+    count = metrics.control_rtt.count
+    sent = set()
+    try:
+        for i in range(40):
+            if link.send_frame([90 + i % 20, 70, 90, 60, 90, 90]) is not None:
+                sent.add(link.encoder.last_seq)
+            time.sleep(0.01)
+        deadline = time.perf_counter() + 2.0
+        while metrics.control_rtt.count == count and time.perf_counter() < deadline:
+            time.sleep(0.01)
+    finally:
+        link.close()
+        pico.stop()
+    latest = link.telemetry.latest
+    assert latest is not None and latest["seq"] in sent, (latest, sorted(sent))
+    assert latest["frames"] <= len(sent) and latest["parse_errors"] == 0
+    assert metrics.control_rtt.count > count
+    print(f"link: {pico.reports_sent} reports from fake_pico.py for {len(sent)} frames, "
+          f"last one for seq {latest['seq']}")
+
+
+if __name__ == "__main__":
+    check_parse()
+    check_metrics()
+    check_rtt()
+    check_link()
+    print("ok")
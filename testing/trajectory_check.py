@@ -0,0 +1,166 @@
+# trajectory_check.py (CPython)
+# Compression ratio and reconstruction error of spline trajectory uploads
+# (trajectory.py). Each manoeuvre is fitted, encoded, parsed back by the fake
+# Pico and evaluated the way the firmware does (float32, 50 Hz), then
+# compared with the original samples and, for smooth manoeuvres, with the
+# exact trajectory between samples. Finishes with an upload through
+# POST /start_trajectory to the fake Pico over TCP.
+#
+#   python testing/trajectory_check.py
+
+import os
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import trajectory
+from fake_pico import FakePico
+
+RATE = 20        # Hz, what the gait loop would stream
+SERVO_RATE = 50  # Hz, firmware evaluation rate (TRAJ_MS = 20)
+CALIBRATION = np.array([0, -20, 0, -30, 0, 0])
+HORIZONTAL = np.array([0, 1, 0, 1, 0, 1], dtype=bool)
+
+
+def serpentine(t, alpha, omega, K_n=0.5, gamma=0.0):
+    """Servo angles of motion.serpentine_angles without the rounding, gamma may vary with t"""
+    t = np.asarray(t, dtype=float)
+    waving = np.flatnonzero(~HORIZONTAL)
+    beta = 2 * K_n * np.pi / len(waving)
+    out = np.tile(CALIBRATION + 90.0, (len(t), 1))
+    wave = (np.broadcast_to(alpha, t.shape)[:, None]
+            * np.sin(omega * t[:, None] + np.arange(len(waving)) * beta)
+            + np.broadcast_to(gamma, t.shape)[:, None])
+    out[:, waving] += wave
+    return np.clip(out, 0, 180)
+
+
+def turn(t):
+    # 20 s: wind up, turn left for a while, straighten out
+    ramp = np.clip(t / 4, 0, 1) * np.clip((20 - t) / 4, 0, 1)
+    return serpentine(t, alpha=60 * ramp, omega=2.0, gamma=20 * np.sin(np.pi * t / 20) ** 2)
+
+
+def slow_crawl(t):
+    return serpentine(t, alpha=40, omega=0.5)
+
+
+def reach(t):
+    # a non-periodic pose change, every joint eases to a new angle and back
+    s = 0.5 - 0.5 * np.cos(np.pi * np.clip(t / 5, 0, 2))
+    target = np.array([40, 70, 150, 60, 30, 90])
+    return (CALIBRATION + 90.0) + s[:, None] * (target - (CALIBRATION + 90.0))
+
+
+def as_sent(t):
+    # what the robot really streams: whole degrees, so steps of up to 0.5 deg
+    return np.round(serpentine(t, alpha=60, omega=2.0))
+
+
+MANOEUVRES = [
+    ("turn", turn, 20, True),
+    ("slow crawl", slow_crawl, 60, True),
+    ("reach", reach, 10, True),
+    ("whole degrees", as_sent, 20, False),
+]
+
+
+def firmware_eval(joints, t):
+    # the Pico stores segments in array('f')
+    joints32 = [[tuple(float(np.float32(x)) for x in s) for s in segs] for segs in joints]
+    return trajectory.evaluate_all(joints32, t).astype(np.float32)
+
+
+def check(name, fn, seconds, smooth, tol):
+    t = np.arange(0, seconds + 1e-9, 1 / RATE)
+    angles = fn(t)
+
+    t0 = time.perf_counter()
+    joints = trajectory.fit(t, angles, tol)
+    fit_ms = (time.perf_counter() - t0) * 1000
+    data = trajectory.encode_upload(joints)
+
+    pico = FakePico()
+    for line in data.split(b"\n"):
+        if line.strip():
+            pico.handle_line(line, 0.0)
+    pico.server.close()
+    assert pico.parse_errors == 0 and pico.upload.ready
+    uploaded = pico.upload.joints
+
+    err = np.abs(firmware_eval(uploaded, t) - angles)
+    # rounding the coefficients and float32 can add a hair on top of tol
+    assert err.max() <= tol + 0.02, f"{name}: error {err.max():.3f} > tol {tol}"
+    line = (f"{name:14s} tol {tol:4.2f}: {sum(len(s) for s in joints):4d} segments "
+            f"{len(data):6d} B vs {trajectory.stream_bytes(angles):7d} B streamed "
+            f"({trajectory.stream_bytes(angles) / len(data):5.1f}x), "
+            f"samples max {err.max():.3f} rms {np.sqrt((err ** 2).mean()):.3f}")
+
+    if smooth:
+        # between the samples, at the firmware's update rate
+        tf = np.arange(0, seconds, 1 / SERVO_RATE)
+        err_f = np.abs(firmware_eval(uploaded, tf) - fn(tf))
+        line += f", {SERVO_RATE} Hz max {err_f.max():.3f}"
+    print(line + f", fit {fit_ms:.0f} ms")
+
+
+def check_upload():
+    import app as ground_station
+    import motion
+
+    pico = FakePico().start()
+    motion.HOST_motor, motion.PORT = pico.host, pico.port
+    client = ground_station.app.test_client()
+    t = np.arange(0, 10, 1 / RATE)
+    r = client.post("/start_trajectory", json={"t": t.tolist(), "angles": reach(t).tolist()})
+    assert r.status_code == 200, r.data
+    deadline = time.time() + 2
+    while pico.trajectory_started is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert pico.trajectory_started is not None, "upload never arrived"
+    client.post("/stop")
+    time.sleep(0.1)
+    assert pico.trajectory_started is None and pico.stops, "stop did not end playback"
+    motion.gait_thread.join(1)
+
+    # refused before anything starts: one sample, angles the servos can't take
+    for body in ({"t": [0], "angles": [[90, 90]]}, {"t": [], "angles": []},
+                 {"t": [0, 0.1], "angles": [[900, -50], [90, 90]]},
+                 {"t": [0, 0.1], "angles": [[90, float("nan")], [90, 90]]}):
+        r2 = client.post("/start_trajectory", json=body)
+        assert r2.status_code == 400, (body, r2.status_code, r2.data)
+    assert not motion.running
+    pico.stop()
+    print(f"upload over TCP: {r.get_json()}, 4 bad bodies refused with 400")
+
+
+def check_limits():
+    # samples at the limits with a sharp turn in between: the cubics overshoot
+    # past 180 and below 0, playback must not
+    t = np.arange(0, 2, 1 / RATE)
+    y = np.where((t > 0.5) & (t < 1.0), 180.0, 0.0)
+    y[(t > 1.2) & (t < 1.4)] = 180.0
+    joints = trajectory.fit(t, np.stack([y, 180 - y], axis=1), tol=20.0)
+    fine = np.arange(0, t[-1], 0.001)
+    raw = np.concatenate([[np.polyval(np.array(seg[2:])[::-1], u) for u in np.linspace(0, 1, 50)]
+                          for segs in joints for seg in segs])
+    played = firmware_eval(trajectory.parse_upload(trajectory.encode_upload(joints)), fine)
+    assert raw.min() < 0 or raw.max() > 180, "no overshoot to clamp"
+    assert played.min() >= 0 and played.max() <= 180, (played.min(), played.max())
+    print(f"limits: the cubics reach {raw.min():.1f}..{raw.max():.1f} deg, playback stays in 0..180")
+
+
+if __name__ == "__main__":
+    for tol in (0.25, 0.5, 1.0):
+        for name, fn, seconds, smooth in MANOEUVRES:
+            if not smooth and tol < 0.5:
+                continue  # whole-degree steps can't be followed closer than 0.5
+            check(name, fn, seconds, smooth, tol)
+    check_limits()
+    check_upload()
+    print("ok")
@@ -0,0 +1,186 @@
+# upy_shim.py (CPython)
+# Just enough MicroPython to run the Pico firmware modules on a PC, for the
+# check scripts: machine, picozero, network, rp2, uasyncio (plain asyncio),
+# ustruct, micropython (const, and the native/viper decorators doing
+# nothing), the const() builtin, time.ticks_* and gc.mem_free.
+#
+#   import upy_shim
+#   upy_shim.install()
+#   import pico_async
+#
+# PWM.duty_u16() writes are kept in PWM.writes as (perf_counter, pin, duty)
+# so a script can see when a servo moved. I2C is fake_i2c.FakeI2C, with a
+# soil sensor at 0x36. Its conversion delays are left to the driver's sleeps,
+# as on the real board.
+#
+# virtual_time() swaps the clock for a simulated one, for scheduling
+# checks with the fake bus's timing model (FakeI2C(timing=True)).
+
+import asyncio
+import builtins
+import gc
+import os
+import struct
+import sys
+import time
+import types
+
+from fake_i2c import FakeI2C
+
+
+def ticks_ms():
+    return int(time.perf_counter() * 1000)
+
+
+def ticks_us():
+    return int(time.perf_counter() * 1000000)
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+class Pin:
+    OUT = 1
+    IN = 0
+
+    def __init__(self, pin, mode=None, value=None):
+        self.pin = pin
+        self._value = value or 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+
+class PWM:
+    writes = []  # (perf_counter, pin, duty) of every duty_u16()
+
+    def __init__(self, pin):
+        self.pin = pin.pin
+        self.duty = 0
+
+    def freq(self, f=None):
+        return 50
+
+    def duty_u16(self, duty=None):
+        if duty is None:
+            return self.duty
+        self.duty = duty
+        PWM.writes.append((time.perf_counter(), self.pin, duty))
+
+
+class WLAN:
+    """Always connected, on localhost"""
+
+    def __init__(self, interface=0):
+        self._active = False
+
+    def active(self, on=None):
+        if on is not None:
+            self._active = on
+        return self._active
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def status(self):
+        return 3
+
+    def scan(self):
+        return []
+
+    def ifconfig(self, config=None):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+
+class VirtualClock:
+    """Simulated time: sleeping moves it on at once, see virtual_time()"""
+
+    def __init__(self):
+        self.us = 0.0
+
+    def ticks_us(self):
+        return int(self.us)
+
+    def ticks_ms(self):
+        return int(self.us // 1000)
+
+    def sleep_us(self, us):
+        if us > 0:
+            self.us += us
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def seconds(self):
+        return self.us / 1000000
+
+
+def virtual_time():
+    """
+    Run time.ticks_* and time.sleep_* (after install()) on a VirtualClock
+    and return it, so a simulation of seconds of bus traffic takes as long
+    as the Python it runs. real_time() goes back.
+    """
+    clock = VirtualClock()
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.sleep_ms = clock.sleep_ms
+    time.sleep_us = clock.sleep_us
+    return clock
+
+
+def real_time():
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+
+def _module(name, **attrs):
+    m = types.ModuleType(name)
+    m.__dict__.update(attrs)
+    sys.modules[name] = m
+    return m
+
+
+def install():
+    """Put the fake modules in place, call before importing firmware"""
+    builtins.const = lambda x: x
+    real_time()
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    gc.mem_free = lambda: 150000
+    gc.mem_alloc = lambda: 50000
+
+    _module("machine", Pin=Pin, PWM=PWM, I2C=FakeI2C,
+            unique_id=lambda: b"\xe6\x61\x4c\x31", reset=lambda: sys.exit(0),
+            freq=lambda f=None: 125000000)
+    _module("picozero", pico_led=Pin("LED"))
+    _module("network", WLAN=WLAN, STA_IF=0, AP_IF=1)
+    _module("rp2", bootsel_button=lambda: 0)
+    _module("micropython", const=builtins.const, native=lambda f: f, viper=lambda f: f)
+    sys.modules["uasyncio"] = asyncio
+    sys.modules["ustruct"] = struct
+    sys.modules.setdefault("uos", os)
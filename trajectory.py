@@ -0,0 +1,248 @@
+import argparse
+import time
+
+import numpy as np
+
+import transport
+
+# Spline-compressed trajectories for scripted manoeuvres. Instead of streaming
+# one frame per tick, every joint's trajectory is fitted with piecewise cubics
+# that stay within tol degrees of the samples, and the coefficients are
+# uploaded to the Pico once. pico_wifi_motor.py evaluates them at its servo
+# update rate.
+#
+# Each segment covers [t0, t0 + dur] of one joint and is a cubic in
+# u = (t - t0) / dur, 0 <= u <= 1:
+#     angle = c0 + u * (c1 + u * (c2 + u * c3))
+# Neighbouring segments meet at the sample between them, so the servo never
+# jumps at a segment boundary.
+#
+# Upload, one line each (times in ms from the start of the trajectory):
+#   @B,joints,duration      begin, throws away any previous trajectory
+#   @S,j,t0,dur,c0,c1,c2,c3 one segment of joint j, in time order per joint
+#   @G                      go, playback starts when this line is parsed
+# Normal frames and !S stop playback.
+#
+#   python trajectory.py flight.rec --tol 0.5
+#   python trajectory.py flight.rec --tol 0.5 --upload --host 127.0.0.1
+
+DEFAULT_TOL = 0.5  # degrees
+DECIMALS = 2       # coefficients go over the wire with this many decimals
+# the firmware keeps 6 floats per segment, this keeps an upload under ~50 KB of Pico RAM
+MAX_SEGMENTS = 2000
+# servo limits, the samples must stay within them and so does playback: a
+# cubic can overshoot between samples
+ANGLE_MIN = 0.0
+ANGLE_MAX = 180.0
+
+
+# ======================
+# Fitting
+# ======================
+
+def _fit_segment(u, y):
+    """
+    Cubic through the first and last sample, least squares in between.
+    Returns (c0, c1, c2, c3) rounded to DECIMALS.
+    """
+    y0, y1 = y[0], y[-1]
+    a = b = 0.0
+    if len(u) > 2:
+        # p(u) = y0 + (y1 - y0) u + a u(1 - u) + b u^2(1 - u)
+        basis = np.stack([u * (1 - u), u * u * (1 - u)], axis=1)
+        residual = y - (y0 + (y1 - y0) * u)
+        (a, b), *_ = np.linalg.lstsq(basis, residual, rcond=None)
+    coeffs = (y0, (y1 - y0) + a, b - a, -b)
+    return tuple(round(float(c), DECIMALS) for c in coeffs)
+
+
+def _poly(coeffs, u):
+    c0, c1, c2, c3 = coeffs
+    return c0 + u * (c1 + u * (c2 + u * c3))
+
+
+def _segment_error(t, y, i, j):
+    u = (t[i:j + 1] - t[i]) / (t[j] - t[i])
+    coeffs = _fit_segment(u, y[i:j + 1])
+    return np.abs(_poly(coeffs, u) - y[i:j + 1]).max(), coeffs
+
+
+def fit_joint(t, y, tol=DEFAULT_TOL):
+    """
+    Piecewise cubic fit of one joint, t in seconds (increasing), y in degrees.
+    Greedy: every segment is grown as far as it can go while the worst
+    error stays within tol (doubling, then bisecting the last step).
+    Returns a list of (t0, dur, c0, c1, c2, c3) with t0 and dur in seconds.
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    segments = []
+    i = 0
+    last = len(t) - 1
+    while i < last:
+        # two samples always fit exactly
+        good = i + 1
+        _, coeffs = _segment_error(t, y, i, good)
+        step = 1
+        bad = None
+        while good < last:
+            j = min(good + step, last)
+            err, c = _segment_error(t, y, i, j)
+            if err > tol:
+                bad = j
+                break
+            good, coeffs = j, c
+            step *= 2
+        while bad is not None and bad - good > 1:
+            j = (good + bad) // 2
+            err, c = _segment_error(t, y, i, j)
+            if err > tol:
+                bad = j
+            else:
+                good, coeffs = j, c
+        segments.append((float(t[i] - t[0]), float(t[good] - t[i])) + coeffs)
+        i = good
+    return segments
+
+
+def fit(t, angles, tol=DEFAULT_TOL):
+    """
+    Fit every joint of a (T, joints) angle array sampled at times t.
+    Times are rounded to whole ms first, the resolution of the upload.
+    Returns a list of segment lists, one per joint.
+    """
+    t = np.asarray(t, dtype=float)
+    if t.ndim != 1 or len(t) < 2:
+        raise ValueError("need at least two samples")
+    t = np.round((t - t[0]) * 1000) / 1000
+    angles = np.asarray(angles, dtype=float)
+    if angles.ndim != 2 or len(t) != len(angles) or angles.shape[1] == 0:
+        raise ValueError("angles must be (T, joints) with one row per time")
+    if not np.all((angles >= ANGLE_MIN) & (angles <= ANGLE_MAX)):
+        raise ValueError(f"angles must be within {ANGLE_MIN:g}..{ANGLE_MAX:g} degrees")
+    if np.any(np.diff(t) <= 0):
+        raise ValueError("times must be increasing by at least 1 ms")
+    joints = [fit_joint(t, angles[:, j], tol) for j in range(angles.shape[1])]
+    total = sum(len(s) for s in joints)
+    if total > MAX_SEGMENTS:
+        raise ValueError(f"{total} segments is too many for the Pico, raise tol or shorten the manoeuvre")
+    return joints
+
+
+def evaluate(segments, t):
+    """
+    Angles of one joint at times t (seconds from the start), clamped to the
+    ends in time and to the servo limits in angle, as the firmware plays it
+    """
+    t = np.asarray(t, dtype=float)
+    starts = np.array([s[0] for s in segments])
+    k = np.clip(np.searchsorted(starts, t, side="right") - 1, 0, len(segments) - 1)
+    seg = np.array(segments)[k]
+    u = np.clip((t - seg[:, 0]) / seg[:, 1], 0.0, 1.0)
+    return np.clip(_poly(seg[:, 2:].T, u), ANGLE_MIN, ANGLE_MAX)
+
+
+def evaluate_all(joints, t):
+    """(T, joints) angles of a whole fitted trajectory"""
+    return np.stack([evaluate(s, t) for s in joints], axis=1)
+
+
+# ======================
+# Upload format
+# ======================
+
+def _num(c):
+    text = f"{c:.{DECIMALS}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def encode_upload(joints):
+    """Fitted trajectory -> the @B/@S/@G lines as one bytes object"""
+    lines = [f"@B,{len(joints)},{round(duration(joints) * 1000)}"]
+    for j, segments in enumerate(joints):
+        for t0, dur, *coeffs in segments:
+            lines.append(f"@S,{j},{round(t0 * 1000)},{round(dur * 1000)},"
+                         + ",".join(_num(c) for c in coeffs))
+    lines.append("@G")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+class UploadParser:
+    """Reassembles an upload line by line, the way the firmware does"""
+
+    def __init__(self):
+        self.joints = None
+        self.duration = None
+        self.ready = False
+
+    def handle_line(self, line):
+        parts = line.strip().split(b",")
+        cmd = parts[0]
+        if cmd == b"@B":
+            self.joints = [[] for _ in range(int(parts[1]))]
+            self.duration = int(parts[2]) / 1000
+            self.ready = False
+        elif cmd == b"@S":
+            j, t0, dur = int(parts[1]), int(parts[2]), int(parts[3])
+            self.joints[j].append((t0 / 1000, dur / 1000) + tuple(float(c) for c in parts[4:8]))
+        elif cmd == b"@G":
+            self.ready = True
+        else:
+            raise ValueError(f"not an upload line: {line!r}")
+
+
+def parse_upload(data):
+    parser = UploadParser()
+    for line in data.split(b"\n"):
+        if line.strip():
+            parser.handle_line(line)
+    return parser.joints
+
+
+def duration(joints):
+    return max(s[-1][0] + s[-1][1] for s in joints)
+
+
+def upload(link, joints):
+    """Send a fitted trajectory over a connected transport, playback starts right away"""
+    link.send_priority(transport.RESUME)
+    link.send(encode_upload(joints))
+
+
+def stream_bytes(angles):
+    """What streaming the same samples frame by frame would have cost"""
+    return sum(len(transport.encode_frame(list(row), i + 1)) for i, row in enumerate(angles))
+
+
+# ======================
+# Command line
+# ======================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and upload a recorded manoeuvre as splines")
+    parser.add_argument("recording", help="flight recorder file or CSV from 'recorder.py dump'")
+    parser.add_argument("--tol", type=float, default=DEFAULT_TOL, help="max error in degrees")
+    parser.add_argument("--upload", action="store_true", help="send it to the Pico and play it")
+    parser.add_argument("--host", default="192.168.34.119", help="motor Pico")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    import replay
+    frames = replay.load_frames(args.recording)
+    if len(frames) < 2:
+        raise SystemExit("need at least two frames")
+    t = np.array([f[0] for f in frames])
+    angles = np.array([f[1] for f in frames], dtype=float)
+
+    joints = fit(t, angles, args.tol)
+    data = encode_upload(joints)
+    error = np.abs(evaluate_all(parse_upload(data), t - t[0]) - angles).max()
+    print(f"{len(frames)} frames over {t[-1] - t[0]:.1f} s -> "
+          f"{sum(len(s) for s in joints)} segments, {len(data)} bytes "
+          f"({stream_bytes(angles) / len(data):.1f}x smaller), max error {error:.3f} deg")
+
+    if args.upload:
+        with transport.TcpTransport(args.host, args.port) as link:
+            upload(link, joints)
+            print(f"uploaded, playing for {duration(joints):.1f} s")
+            time.sleep(duration(joints))
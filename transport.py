@@ -0,0 +1,403 @@
+import fcntl
+import itertools
+import socket
+import termios
+import threading
+import time
+
+import serial
+
+import metrics
+import telemetry
+
+# Transports carry encoded frames from the ground station to a Pico.
+# Everything that sends frames (the gait loops in motion.py, replay.py)
+# goes through one of these so they all share the same send path and metrics.
+#
+# Every transport has the same interface:
+#   connect()       open the link, returns self
+#   send_frame(angles)  number, encode and send one frame, returns the bytes
+#                   sent or None when the frame was suppressed as unchanged
+#   send(data)      send already encoded bytes (replay.py)
+#   send_priority(data)  send a stop/resume command ahead of queued frames
+#   unsent_bytes()  bytes queued below us (kernel socket buffer, serial driver)
+#   close()
+# and works as a context manager.
+
+
+def encode_frame(angles, seq=None):
+    """
+    Servo angles -> the line format parsed by pico_wifi_motor.py.
+    With seq the line is prefixed "seq:", the Pico reports the last
+    sequence number it applied on the telemetry back-channel.
+    """
+    line = ",".join(map(str, angles))
+    if seq is not None:
+        line = f"{seq}:{line}"
+    return (line + "\r\n").encode()
+
+
+# Delta frames ("seq:~j=v,j=v") only carry the joints that changed since the
+# previous frame, j is the joint index. The firmware keeps the last full
+# state and applies them on top of it. A full frame (keyframe) goes out every
+# keyframe_every ticks and after every connect/priority command, so the Pico
+# resyncs within a second even if it rebooted.
+DELTA = "~"
+
+
+class FrameEncoder:
+    """
+    Turns a stream of angle lists into numbered keyframes and delta frames.
+    encode() returns None for a tick where no joint changed, nothing needs
+    to be sent for it. With deltas=False every frame sent is a keyframe but
+    unchanged frames are still suppressed (for links that drop frames).
+    """
+
+    def __init__(self, keyframe_every=20, deltas=True):
+        self.keyframe_every = keyframe_every
+        self.deltas = deltas
+        self._seq = itertools.count(1)
+        self.last_seq = None
+        self._state = None
+        self._since_key = 0
+
+    def reset(self):
+        """Make the next frame a keyframe, the Pico's state is unknown"""
+        self._state = None
+
+    def encode(self, angles):
+        angles = list(angles)
+        state = self._state
+        self._since_key += 1
+
+        if state is None or len(state) != len(angles) or self._since_key >= self.keyframe_every:
+            body = ",".join(map(str, angles))
+            self._since_key = 0
+            metrics.keyframes_sent.inc()
+        else:
+            changed = [f"{j}={a}" for j, (a, old) in enumerate(zip(angles, state)) if a != old]
+            if not changed:
+                metrics.frames_suppressed.inc()
+                return None
+            full = ",".join(map(str, angles))
+            delta = DELTA + ",".join(changed)
+            body = delta if self.deltas and len(delta) < len(full) else full
+
+        self._state = angles
+        seq = self.last_seq = next(self._seq)
+        return f"{seq}:{body}\r\n".encode()
+
+
+# Priority commands start with "!". The firmware applies them as soon as
+# they are parsed and throws away any normal frames received before them.
+#   !S,a,b,c...  stop: go to these angles and ignore frames until resumed
+#   !R           resume: accept frames again
+RESUME = b"!R\r\n"
+
+
+def encode_stop(angles):
+    return ("!S," + ",".join(map(str, angles)) + "\r\n").encode()
+
+
+class TcpTransport:
+    def __init__(self, host, port, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.telemetry = telemetry.Telemetry()
+        self.encoder = FrameEncoder()
+        self._reader = None
+        # the HTTP thread sends stop commands while the gait thread is sending
+        # frames, the lock keeps their bytes from interleaving on the stream
+        self._send_lock = threading.Lock()
+
+    def connect(self):
+        try:
+            s = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError:
+            metrics.connect_errors.inc()
+            raise
+        # frames are tiny, don't let Nagle hold them back waiting for more data
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = s
+        metrics.record_connect()
+        self._reader = threading.Thread(target=self._read_loop, args=(s,), daemon=True)
+        self._reader.start()
+        return self
+
+    def _read_loop(self, sock):
+        # telemetry reports from the Pico, one per line
+        buffer = b""
+        while True:
+            try:
+                data = sock.recv(1024)
+            except socket.timeout:
+                # the socket keeps connect()'s timeout for sendall, a quiet Pico is fine
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.strip():
+                    self.telemetry.handle_line(line)
+
+    def send_frame(self, angles):
+        data = self.encoder.encode(angles)
+        if data is None:
+            return None
+        self.telemetry.sent(self.encoder.last_seq)
+        self.send(data)
+        return data
+
+    def send(self, data):
+        t0 = time.perf_counter()
+        try:
+            with self._send_lock:
+                self._sock().sendall(data)
+        except OSError:
+            metrics.send_errors.inc()
+            raise
+        metrics.send_latency.observe(time.perf_counter() - t0)
+        metrics.frames_sent.inc()
+        metrics.bytes_sent.inc(len(data))
+
+    def send_priority(self, data):
+        # frames are a few dozen bytes and TCP_NODELAY is set, so waiting for
+        # the lock costs at most one frame's sendall
+        with self._send_lock:
+            self._sock().sendall(data)
+            # a stop moves the servos, the next frame has to be a keyframe
+            self.encoder.reset()
+        metrics.priority_sent.inc()
+
+    def _sock(self):
+        # the gait thread may have closed the link since the caller picked it
+        # up (emergency_stop), that is a send error like any other
+        s = self.sock
+        if s is None:
+            raise OSError("the link is closed")
+        return s
+
+    def unsent_bytes(self):
+        # bytes still sitting in the kernel send buffer
+        s = self.sock
+        if s is None:
+            return 0
+        buf = fcntl.ioctl(s.fileno(), termios.TIOCOUTQ, b"\0\0\0\0")
+        return int.from_bytes(buf, "little")
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                # wakes the reader thread out of recv()
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        if self.sock is None:
+            self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox between the gait loop and a writer thread.
+    put() never blocks on I/O and replaces a frame that has not been
+    written yet, so the writer always sends the newest frame and stale
+    ones are dropped instead of queueing up.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._priority = None
+        self._closed = False
+        self.dropped = 0
+
+    def _count_drop(self):
+        # called with the lock held
+        self.dropped += 1
+        metrics.frames_dropped.inc()
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None:
+                self._count_drop()
+            self._frame = frame
+            self._cond.notify()
+
+    def put_priority(self, data):
+        """A priority command replaces the waiting frame and goes out first"""
+        with self._cond:
+            if self._frame is not None:
+                self._count_drop()
+                self._frame = None
+            self._priority = data
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """
+        Wait for something to send, returns (data, is_priority), or
+        (None, False) once closed
+        """
+        with self._cond:
+            while self._frame is None and self._priority is None and not self._closed:
+                if not self._cond.wait(timeout):
+                    return None, False
+            if self._priority is not None:
+                data, self._priority = self._priority, None
+                return data, True
+            frame, self._frame = self._frame, None
+            return frame, False
+
+    def drop(self):
+        with self._cond:
+            self._count_drop()
+
+    @property
+    def has_priority(self):
+        return self._priority is not None
+
+    def newest(self, frame):
+        """Return a newer waiting frame in place of frame, dropping frame"""
+        with self._cond:
+            if self._frame is None:
+                return frame
+            self._count_drop()
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class SerialTransport:
+    """
+    USB serial link to a Pico running pico_motor.py (the tethered build).
+
+    send() only drops the frame in a LatestFrame mailbox, a writer thread
+    does the actual write. Before writing, the writer waits until the
+    driver's output buffer is below max_unsent bytes, and picks up any
+    newer frame that arrived meanwhile, so a slow port never delays the
+    gait loop and never builds up a backlog of old frames.
+    """
+
+    def __init__(self, port, baudrate=115200, max_unsent=64, write_timeout=0.5, poll=0.001):
+        self.port = port
+        self.baudrate = baudrate
+        self.max_unsent = max_unsent
+        self.write_timeout = write_timeout
+        self.poll = poll
+        self.ser = None
+        # the mailbox drops frames, so a delta could go missing: keyframes only
+        self.encoder = FrameEncoder(deltas=False)
+        self._mailbox = None
+        self._writer = None
+
+    def connect(self):
+        try:
+            self.ser = serial.Serial(self.port, self.baudrate, write_timeout=self.write_timeout)
+        except serial.SerialException:
+            metrics.connect_errors.inc()
+            raise
+        metrics.record_connect()
+        self._mailbox = LatestFrame()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        return self
+
+    def send_frame(self, angles):
+        # numbered like the TCP frames, pico_motor.py has no back-channel yet
+        data = self.encoder.encode(angles)
+        if data is not None:
+            self.send(data)
+        return data
+
+    def send(self, data):
+        self._mailbox.put(data)
+
+    def send_priority(self, data):
+        self.encoder.reset()
+        self._mailbox.put_priority(data)
+
+    def unsent_bytes(self):
+        ser = self.ser
+        if ser is None:
+            return 0
+        return ser.out_waiting
+
+    @property
+    def dropped(self):
+        return self._mailbox.dropped if self._mailbox is not None else 0
+
+    def _write_loop(self):
+        mailbox = self._mailbox
+        while True:
+            data, priority = mailbox.take()
+            if data is None:
+                break
+
+            if priority:
+                # frames still in the driver buffer are older than the stop,
+                # throw them away so the command goes out right now
+                self.ser.reset_output_buffer()
+                metrics.priority_sent.inc()
+            else:
+                # a frame written behind a full buffer is stale by the time it
+                # goes out, wait for the buffer to drain and keep the newest frame
+                while (self.ser.out_waiting > self.max_unsent
+                       and not mailbox.closed and not mailbox.has_priority):
+                    time.sleep(self.poll)
+                    data = mailbox.newest(data)
+                if mailbox.has_priority:
+                    # a stop came in while we waited, this frame is dead
+                    mailbox.drop()
+                    continue
+            if mailbox.closed and not priority:
+                # a stop queued just before close() still has to go out
+                break
+
+            t0 = time.perf_counter()
+            try:
+                self.ser.write(data)
+            except serial.SerialException:
+                # includes write timeouts, the next frame replaces this one anyway
+                metrics.send_errors.inc()
+                continue
+            metrics.send_latency.observe(time.perf_counter() - t0)
+            metrics.frames_sent.inc()
+            metrics.bytes_sent.inc(len(data))
+
+    def close(self):
+        if self._mailbox is not None:
+            self._mailbox.close()
+        if self._writer is not None:
+            self._writer.join(timeout=self.write_timeout + 0.5)
+            self._writer = None
+        if self.ser is not None:
+            self.ser.close()
+            self.ser = None
+
+    def __enter__(self):
+        if self.ser is None:
+            self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()